@@ -0,0 +1,233 @@
+import asyncio
+import hashlib
+import os
+import re
+from pathlib import Path
+from typing import Optional
+from config import AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_MB, AUDIO_CACHE_MIN_PLAYS, EXTRACTION_MODE
+from extraction import ExtractionScheduler, ExtractionCancelled, PRIORITY_PREFETCH, make_executor
+from stream_cache import video_key
+import db
+import ytdl
+import logging
+
+logger = logging.getLogger(__name__)
+
+AUDIO_SUFFIX = ".opus"
+TEMP_PREFIX = "."  # Descargas a medias: se ignoran al indexar y se borran al arrancar
+_SAFE_KEY_RE = re.compile(r"^[\w-]{1,64}$")
+
+# Descargas simultáneas: cada una ocupa un worker de su pool durante toda la pista
+DOWNLOAD_CONCURRENCY = 1
+
+
+class AudioCache:
+    """
+    Cache en disco del audio de las canciones, en ficheros Opus.
+
+    Se descargan en segundo plano las canciones reproducidas al menos
+    `min_plays` veces (entre todos los servidores y reinicios) y las
+    próximas de cada cola. El tamaño total está acotado: al llenarse se
+    expulsa la canción con menos reproducciones (LFU), y una descarga no
+    entra si para hacerle sitio habría que expulsar canciones más
+    escuchadas que ella.
+
+    Las descargas tienen su propio pool: ocupan un worker durante toda la
+    pista, y en el pool de extracción (y en el límite por servidor)
+    dejarían esperando a /play y a play_next.
+    """
+
+    def __init__(self, directory: Optional[Path], max_bytes: int, min_plays: int,
+                 scheduler: Optional[ExtractionScheduler] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_plays = max(1, min_plays)
+        self._files: dict[str, int] = {}  # clave -> bytes
+        self._plays: dict[str, int] = {}
+        self._used = 0
+        self._downloads: dict[str, asyncio.Task] = {}
+        self._scheduler = scheduler or ExtractionScheduler(
+            DOWNLOAD_CONCURRENCY, DOWNLOAD_CONCURRENCY,
+            executor_factory=lambda: make_executor(EXTRACTION_MODE, DOWNLOAD_CONCURRENCY)
+        )
+        self.stats = {"hits": 0, "misses": 0, "downloads": 0, "download_failures": 0, "rejected": 0,
+                      "evictions": 0, "bytes_saved": 0, "bytes_downloaded": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    @staticmethod
+    def key(webpage_url: str) -> str:
+        """Nombre del fichero de una canción: el ID del vídeo, o un hash si no es un ID seguro."""
+        key = video_key(webpage_url)
+        return key if _SAFE_KEY_RE.match(key) else hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}{AUDIO_SUFFIX}"
+
+    def load(self) -> None:
+        """Indexa los ficheros ya descargados y las reproducciones guardadas (bloqueante, llamar al arrancar)."""
+        if not self.enabled:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._plays = db.get_play_counts()
+        for path in self.directory.iterdir():
+            if path.name.startswith(TEMP_PREFIX):
+                path.unlink(missing_ok=True)
+            elif path.suffix == AUDIO_SUFFIX:
+                size = path.stat().st_size
+                self._files[path.stem] = size
+                self._used += size
+        # Si se ha reducido AUDIO_CACHE_MAX_MB desde la última vez
+        self._evict(0)
+        logger.info(f"🎧 Cache de audio: {len(self._files)} canciones, {self._used / 1024 / 1024:.1f} MB")
+
+    def lookup(self, webpage_url: str) -> Optional[Path]:
+        """Devuelve el fichero local de una canción, o None si no está descargada."""
+        if not self.enabled:
+            return None
+        key = self.key(webpage_url)
+        size = self._files.get(key)
+        if size is not None:
+            path = self._path(key)
+            if path.exists():
+                self.stats["hits"] += 1
+                self.stats["bytes_saved"] += size
+                return path
+            # Borrado por fuera del bot
+            self._forget(key)
+        self.stats["misses"] += 1
+        return None
+
+    def contains(self, webpage_url: str) -> bool:
+        return self.enabled and self.key(webpage_url) in self._files
+
+    def record_play(self, webpage_url: str, guild_id: int = 0) -> None:
+        """Cuenta una reproducción y descarga la canción si ya es lo bastante popular."""
+        if not self.enabled:
+            return
+        key = self.key(webpage_url)
+        self._plays[key] = self._plays.get(key, 0) + 1
+        asyncio.get_running_loop().run_in_executor(None, db.record_play, key)
+        if self._plays[key] >= self.min_plays:
+            self.schedule_download(webpage_url, guild_id)
+
+    def schedule_download(self, webpage_url: str, guild_id: int = 0) -> None:
+        """Descarga una canción en segundo plano si no está ya en disco o descargándose."""
+        if not self.enabled:
+            return
+        key = self.key(webpage_url)
+        if key in self._files or key in self._downloads:
+            return
+        # El tamaño real se conoce al terminar; mientras, se estima con la media de lo guardado
+        estimate = self._used // len(self._files) if self._files else 0
+        if self._victims(key, estimate) is None:
+            self.stats["rejected"] += 1
+            return
+        task = asyncio.create_task(self._download(key, webpage_url, guild_id))
+        self._downloads[key] = task
+        task.add_done_callback(lambda t: self._downloads.pop(key, None))
+
+    def _victims(self, key: str, needed: int) -> Optional[list[str]]:
+        """Canciones a expulsar (de menos a más reproducidas) para que quepan `needed` bytes, o None si no se debe."""
+        free = self.max_bytes - self._used
+        if needed <= free:
+            return []
+        plays = self._plays.get(key, 0)
+        victims = []
+        # sorted es estable: a igualdad de reproducciones sale antes la que se descargó antes
+        for candidate in sorted(self._files, key=lambda k: self._plays.get(k, 0)):
+            if self._plays.get(candidate, 0) > plays:
+                return None
+            victims.append(candidate)
+            free += self._files[candidate]
+            if needed <= free:
+                return victims
+        return None
+
+    def _evict(self, needed: int) -> None:
+        while self._files and self._used + needed > self.max_bytes:
+            victim = min(self._files, key=lambda k: self._plays.get(k, 0))
+            self._path(victim).unlink(missing_ok=True)
+            self._forget(victim)
+            self.stats["evictions"] += 1
+
+    def _forget(self, key: str) -> None:
+        self._used -= self._files.pop(key, 0)
+
+    async def _download(self, key: str, webpage_url: str, guild_id: int) -> None:
+        temp = self.directory / f"{TEMP_PREFIX}{key}"
+        temp_file = temp.with_name(temp.name + AUDIO_SUFFIX)
+        try:
+            # Sin plazo: una pista larga puede tardar; es trabajo de fondo y se cancela con el prefetch
+            size = await self._scheduler.run(
+                ytdl.download_audio, webpage_url, str(temp), guild_id=guild_id, priority=PRIORITY_PREFETCH
+            )
+            victims = self._victims(key, size)
+            if victims is None:
+                # Mientras se descargaba entraron canciones más escuchadas
+                self.stats["rejected"] += 1
+                self._discard_temp(key)
+                return
+            for victim in victims:
+                self._path(victim).unlink(missing_ok=True)
+                self._forget(victim)
+                self.stats["evictions"] += 1
+            os.replace(temp_file, self._path(key))
+            self._files[key] = size
+            self._used += size
+            self.stats["downloads"] += 1
+            self.stats["bytes_downloaded"] += size
+            logger.info(f"🎧 Guardada en el cache de audio: {webpage_url} ({size / 1024 / 1024:.1f} MB)")
+        except ExtractionCancelled:
+            self._discard_temp(key)
+        except asyncio.CancelledError:
+            self._discard_temp(key)
+            raise
+        except Exception as e:
+            self.stats["download_failures"] += 1
+            self._discard_temp(key)
+            logger.warning(f"No se pudo guardar {webpage_url} en el cache de audio: {e}")
+
+    def _discard_temp(self, key: str) -> None:
+        # yt-dlp deja el formato original y los .part junto al .opus
+        for path in self.directory.glob(f"{TEMP_PREFIX}{key}.*"):
+            path.unlink(missing_ok=True)
+
+    def cancel_guild(self, guild_id: int) -> int:
+        """Descarta las descargas de un servidor que aún esperan turno (la que está en curso termina)."""
+        return self._scheduler.cancel_guild(guild_id)
+
+    def shutdown(self) -> None:
+        """Cancela las descargas y cierra su pool."""
+        for task in list(self._downloads.values()):
+            task.cancel()
+        self._scheduler.shutdown()
+
+    def get_stats(self) -> dict:
+        """
+        Obtiene estadísticas del cache de audio.
+
+        Returns:
+            Diccionario con aciertos, descargas, expulsiones, bytes ahorrados y ocupación
+        """
+        stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["enabled"] = self.enabled
+        stats["files"] = len(self._files)
+        stats["used_mb"] = self._used / 1024 / 1024
+        stats["max_mb"] = self.max_bytes / 1024 / 1024
+        stats["downloading"] = len(self._downloads)
+        stats["download_queue"] = self._scheduler.get_stats()["queue_depth"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+audio_cache = AudioCache(Path(AUDIO_CACHE_DIR) if AUDIO_CACHE_DIR else None, AUDIO_CACHE_MAX_MB * 1024 * 1024,
+                         AUDIO_CACHE_MIN_PLAYS)
+
+
+def get_audio_cache_stats() -> dict:
+    """Obtiene estadísticas del cache de audio."""
+    return audio_cache.get_stats()
@@ -1,53 +1,429 @@
 import discord
+import asyncio
+import time
+from collections import OrderedDict, deque
 from typing import Optional
 from datetime import datetime, timezone
-from config import AUDIT_LOOKBACK_SECONDS
+from config import AUDIT_LOOKBACK_SECONDS, AUDIT_CACHE_SECONDS, AUDIT_WAIT_SECONDS
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def _entry_channel_id(entry: discord.AuditLogEntry) -> Optional[int]:
+    """Canal de una entrada de borrado: extra.channel en message_delete, target en message_bulk_delete."""
+    channel = getattr(getattr(entry, "extra", None), "channel", None)
+    if channel is None and entry.action == discord.AuditLogAction.message_bulk_delete:
+        channel = getattr(entry, "target", None)
+    return getattr(channel, "id", None)
+
+
+def _is_recent(entry: discord.AuditLogEntry, now: datetime) -> bool:
+    delta = (now - entry.created_at).total_seconds()
+    return 0 <= delta <= AUDIT_LOOKBACK_SECONDS
+
+
+class AuditLogCache:
+    """
+    Cache de entradas de auditoría por servidor y acción.
+
+    Las búsquedas simultáneas del mismo servidor y acción comparten una sola
+    petición HTTP, y durante `window` segundos se responden desde memoria.
+    Las entradas se indexan por canal para no recorrer la lista completa.
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self._entries: dict[tuple, list[discord.AuditLogEntry]] = {}
+        self._by_channel: dict[tuple, dict[int, list[discord.AuditLogEntry]]] = {}
+        self._fetched_at: dict[tuple, float] = {}
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        self.stats = {"api_calls": 0, "coalesced": 0, "cache_hits": 0}
+
+    async def get_entries(
+            self,
+            guild: discord.Guild,
+            action: discord.AuditLogAction,
+            limit: int
+    ) -> list[discord.AuditLogEntry]:
+        """
+        Devuelve las entradas recientes de `action`, pidiéndolas a Discord solo si hace falta.
+
+        Raises:
+            discord.Forbidden y demás errores HTTP de la petición compartida
+        """
+        key = (guild.id, action)
+        loop = asyncio.get_running_loop()
+
+        fetched_at = self._fetched_at.get(key)
+        if fetched_at is not None and loop.time() - fetched_at <= self.window:
+            self.stats["cache_hits"] += 1
+            return self._entries[key]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(inflight)
+
+        future = loop.create_future()
+        self._inflight[key] = future
+        try:
+            entries = [entry async for entry in guild.audit_logs(limit=limit, action=action)]
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Marcar como leída si nadie más esperaba
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        self.stats["api_calls"] += 1
+        self._store(key, entries, loop.time())
+        future.set_result(entries)
+        return entries
+
+    def _store(self, key: tuple, entries: list[discord.AuditLogEntry], fetched_at: float) -> None:
+        index: dict[int, list[discord.AuditLogEntry]] = {}
+        for entry in entries:
+            channel_id = _entry_channel_id(entry)
+            if channel_id is not None:
+                index.setdefault(channel_id, []).append(entry)
+        self._entries[key] = entries
+        self._by_channel[key] = index
+        self._fetched_at[key] = fetched_at
+
+    def entries_for_channel(
+            self,
+            guild_id: int,
+            action: discord.AuditLogAction,
+            channel_id: int
+    ) -> list[discord.AuditLogEntry]:
+        """Entradas en memoria de `action` en un canal, de la más reciente a la más antigua."""
+        return self._by_channel.get((guild_id, action), {}).get(channel_id, [])
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "api_calls_saved": self.stats["coalesced"] + self.stats["cache_hits"]}
+
+
+audit_cache = AuditLogCache(AUDIT_CACHE_SECONDS)
+
+
+def get_audit_cache_stats() -> dict:
+    """Estadísticas del cache de auditoría: peticiones hechas y ahorradas."""
+    return audit_cache.get_stats()
+
+
+class DeleteCountTracker:
+    """
+    Sigue el extra.count de las entradas message_delete de cada servidor.
+
+    Discord agrupa los borrados repetidos del mismo moderador sobre el mismo
+    autor y canal en una única entrada: incrementa su count sin crear otra
+    ni cambiar su fecha. Comparando cada count con el último visto se sabe
+    cuántos borrados nuevos representa cada entrada, y esos borrados quedan
+    como créditos por (servidor, canal, autor) que los borrados pendientes
+    reclaman en O(1).
+    """
+
+    def __init__(self, credit_ttl: float, max_tracked: int = 500):
+        self.credit_ttl = credit_ttl
+        self.max_tracked = max_tracked
+        self._counts: dict[int, OrderedDict[int, int]] = {}
+        self._polled: set[int] = set()
+        self._credits: dict[tuple, deque[list]] = {}  # clave -> [[instante, entrada, borrados sin reclamar]]
+
+    @staticmethod
+    def _count(entry: discord.AuditLogEntry) -> int:
+        return getattr(getattr(entry, "extra", None), "count", None) or 1
+
+    def _remember(self, guild_id: int, entry: discord.AuditLogEntry) -> int:
+        """Guarda el count actual de la entrada y devuelve el que se había visto antes (0 si es nueva)."""
+        counts = self._counts.setdefault(guild_id, OrderedDict())
+        previous = counts.get(entry.id, 0)
+        counts[entry.id] = self._count(entry)
+        counts.move_to_end(entry.id)
+        while len(counts) > self.max_tracked:
+            counts.popitem(last=False)
+        return previous
+
+    def record(self, entry: discord.AuditLogEntry) -> None:
+        """Marca como ya atribuida una entrada recibida por el gateway."""
+        self._remember(entry.guild.id, entry)
+
+    def observe(self, guild_id: int, entries: list[discord.AuditLogEntry]) -> int:
+        """
+        Compara una página del audit log con la anterior y acumula créditos por cada borrado nuevo.
+
+        En la primera página de un servidor solo cuentan las entradas recientes,
+        porque no hay counts anteriores con los que comparar.
+
+        Returns:
+            Número de borrados nuevos detectados
+        """
+        baseline = guild_id not in self._polled
+        self._polled.add(guild_id)
+        now_dt = datetime.now(timezone.utc)
+        now = time.monotonic()
+
+        detected = 0
+        for entry in entries:
+            previous = self._remember(guild_id, entry)
+            if baseline and not _is_recent(entry, now_dt):
+                continue
+            new_deletions = self._count(entry) - previous
+            if new_deletions <= 0:
+                continue
+            key = (guild_id, _entry_channel_id(entry), getattr(entry.target, "id", None))
+            self._credits.setdefault(key, deque()).append([now, entry, new_deletions])
+            detected += new_deletions
+        return detected
+
+    def claim(self, guild_id: int, channel_id: int, author_id: Optional[int]) -> Optional[discord.AuditLogEntry]:
+        """
+        Reclama un borrado acreditado en el canal (y del autor, si se conoce).
+
+        Returns:
+            La entrada responsable del borrado, o None si no hay créditos
+        """
+        self._prune(time.monotonic())
+        if author_id is not None:
+            keys = [(guild_id, channel_id, author_id)]
+        else:
+            keys = [k for k in self._credits if k[:2] == (guild_id, channel_id)]
+
+        for key in keys:
+            credits = self._credits.get(key)
+            if not credits:
+                continue
+            credit = credits[0]
+            credit[2] -= 1
+            if credit[2] <= 0:
+                credits.popleft()
+                if not credits:
+                    del self._credits[key]
+            return credit[1]
+        return None
+
+    def _prune(self, now: float) -> None:
+        for key in list(self._credits):
+            credits = self._credits[key]
+            while credits and now - credits[0][0] > self.credit_ttl:
+                credits.popleft()
+            if not credits:
+                del self._credits[key]
+
+
+delete_count_tracker = DeleteCountTracker(AUDIT_LOOKBACK_SECONDS * 6)
+
+
+class DeletionCorrelator:
+    """
+    Empareja borrados pendientes con las entradas que llegan por on_audit_log_entry_create.
+
+    Cada borrado espera en un índice por (acción, servidor, canal, autor) y se
+    resuelve en cuanto llega su entrada o vence el plazo. Las entradas que
+    llegan antes que el evento de borrado se guardan `retention` segundos para
+    emparejarlas después, porque Discord no garantiza el orden. Los borrados
+    que no se registran (ignore) descartan su entrada: si quedara libre, el
+    siguiente borrado del autor en ese canal se atribuiría al moderador.
+    """
+
+    _TRACKED_ACTIONS = (discord.AuditLogAction.message_delete, discord.AuditLogAction.message_bulk_delete)
+
+    def __init__(self, retention: float):
+        self.retention = retention
+        self._waiters: dict[tuple, deque[asyncio.Future]] = {}
+        self._unclaimed: dict[tuple, deque[tuple[float, discord.AuditLogEntry]]] = {}
+        self._ignored: dict[tuple, deque[float]] = {}  # (acción, servidor, canal) -> borrados sin registrar
+        self.stats = {"matched": 0, "matched_early": 0, "expired": 0, "dropped": 0}
+
+    @staticmethod
+    def _entry_key(entry: discord.AuditLogEntry) -> tuple:
+        author_id = None
+        if entry.action == discord.AuditLogAction.message_delete:
+            author_id = getattr(entry.target, "id", None)
+        return entry.action, entry.guild.id, _entry_channel_id(entry), author_id
+
+    def feed(self, entry: discord.AuditLogEntry) -> bool:
+        """
+        Procesa una entrada nueva del audit log.
+
+        Returns:
+            True si resolvió un borrado pendiente
+        """
+        if entry.action not in self._TRACKED_ACTIONS:
+            return False
+
+        key = self._entry_key(entry)
+        # Un borrado cuyo autor se desconoce acepta cualquier entrada del canal
+        for waiter_key in (key, key[:3] + (None,)):
+            waiters = self._waiters.get(waiter_key)
+            while waiters:
+                future = waiters.popleft()
+                if not future.done():
+                    future.set_result(self._matched(entry))
+                    self.stats["matched"] += 1
+                    if not waiters:
+                        del self._waiters[waiter_key]
+                    return True
+            self._waiters.pop(waiter_key, None)
+
+        now = asyncio.get_running_loop().time()
+        self._prune(now)
+        ignored = self._ignored.get(key[:3])
+        if ignored:
+            # Es la entrada de un borrado que no se registra
+            ignored.popleft()
+            if not ignored:
+                del self._ignored[key[:3]]
+            self._drop(entry)
+            return False
+        self._unclaimed.setdefault(key, deque()).append((now, entry))
+        return False
+
+    def ignore(self, action: discord.AuditLogAction, guild_id: int, channel_id: int) -> None:
+        """
+        Anota un borrado que no se va a registrar (p. ej. de un mensaje que no estaba guardado).
+
+        Descarta la entrada más antigua sin reclamar de ese canal o, si aún no
+        ha llegado, la próxima que llegue sin nadie esperándola.
+        """
+        now = asyncio.get_running_loop().time()
+        self._prune(now)
+        channel = (action, guild_id, channel_id)
+        candidates = [k for k in self._unclaimed if k[:3] == channel]
+        if not candidates:
+            self._ignored.setdefault(channel, deque()).append(now)
+            return
+        oldest = min(candidates, key=lambda k: self._unclaimed[k][0][0])
+        _, entry = self._unclaimed[oldest].popleft()
+        if not self._unclaimed[oldest]:
+            del self._unclaimed[oldest]
+        self._drop(entry)
+
+    def _drop(self, entry: discord.AuditLogEntry) -> None:
+        # Se da por emparejada para que el sondeo HTTP tampoco se la asigne a otro borrado
+        self._matched(entry)
+        self.stats["dropped"] += 1
+
+    @staticmethod
+    def _matched(entry: discord.AuditLogEntry) -> discord.AuditLogEntry:
+        if entry.action == discord.AuditLogAction.message_delete:
+            # Para que el siguiente sondeo HTTP no vuelva a contar este borrado
+            delete_count_tracker.record(entry)
+        return entry
+
+    def _prune(self, now: float) -> None:
+        for key in list(self._unclaimed):
+            entries = self._unclaimed[key]
+            while entries and now - entries[0][0] > self.retention:
+                entries.popleft()
+            if not entries:
+                del self._unclaimed[key]
+        for key in list(self._ignored):
+            noted = self._ignored[key]
+            while noted and now - noted[0] > self.retention:
+                noted.popleft()
+            if not noted:
+                del self._ignored[key]
+
+    def _claim(self, key: tuple) -> Optional[discord.AuditLogEntry]:
+        self._prune(asyncio.get_running_loop().time())
+        if key[3] is None:
+            candidates = [k for k in self._unclaimed if k[:3] == key[:3]]
+        else:
+            candidates = [key] if key in self._unclaimed else []
+        for candidate in candidates:
+            _, entry = self._unclaimed[candidate].popleft()
+            if not self._unclaimed[candidate]:
+                del self._unclaimed[candidate]
+            return self._matched(entry)
+        return None
+
+    async def wait_for(
+            self,
+            action: discord.AuditLogAction,
+            guild_id: int,
+            channel_id: int,
+            author_id: Optional[int],
+            timeout: float
+    ) -> Optional[discord.AuditLogEntry]:
+        """
+        Espera la entrada de auditoría de un borrado.
+
+        Args:
+            action: message_delete o message_bulk_delete
+            guild_id: ID del servidor
+            channel_id: ID del canal del mensaje borrado
+            author_id: Autor del mensaje (None si se desconoce o en borrados masivos)
+            timeout: Plazo máximo de espera en segundos
+
+        Returns:
+            AuditLogEntry si llegó a tiempo, None si venció el plazo
+        """
+        if action == discord.AuditLogAction.message_bulk_delete:
+            author_id = None
+        key = (action, guild_id, channel_id, author_id)
+
+        entry = self._claim(key)
+        if entry is not None:
+            self.stats["matched_early"] += 1
+            return entry
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, deque()).append(future)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.stats["expired"] += 1
+            return None
+        finally:
+            waiters = self._waiters.get(key)
+            if waiters is not None:
+                try:
+                    waiters.remove(future)
+                except ValueError:
+                    pass
+                if not waiters:
+                    del self._waiters[key]
+
+
+# El evento de borrado llega casi a la vez que su entrada: una entrada sin reclamar pasado el plazo de
+# espera no es de ningún borrado pendiente, y guardarla más tiempo solo sirve para atribuirla mal
+deletion_correlator = DeletionCorrelator(AUDIT_WAIT_SECONDS)
+
+
 async def find_audit_entry_for_channel(
         guild: discord.Guild,
         channel_id: int,
+        author_id: Optional[int] = None,
         limit: int = 20
 ) -> Optional[discord.AuditLogEntry]:
     """
-    Busca una entrada reciente de message_delete o message_bulk_delete relacionada con channel_id.
+    Busca la entrada de message_delete o message_bulk_delete responsable de un borrado en channel_id.
+
+    Las entradas message_delete se atribuyen por los borrados nuevos que
+    representan (entradas nuevas o con count incrementado), no por su fecha.
 
     Args:
         guild: El servidor de Discord
         channel_id: ID del canal donde se eliminó el mensaje
+        author_id: ID del autor del mensaje eliminado, si se conoce
         limit: Número máximo de entradas a revisar
 
     Returns:
         AuditLogEntry si se encuentra, None en caso contrario
     """
-    now = datetime.now(timezone.utc)
-
     # Buscar en message_delete
     try:
-        async for entry in guild.audit_logs(
-                limit=limit,
-                action=discord.AuditLogAction.message_delete
-        ):
-            # Verificar que la entrada sea reciente
-            delta = (now - entry.created_at).total_seconds()
-            if delta < 0 or delta > AUDIT_LOOKBACK_SECONDS:
-                continue
-
-            # Verificar si la entrada está relacionada con el canal
-            extra = getattr(entry, "extra", None)
-            if extra and hasattr(extra, "channel"):
-                channel = getattr(extra, "channel", None)
-                if channel and getattr(channel, "id", None) == channel_id:
-                    logger.debug(f"Entrada de auditoría encontrada: {entry.user} eliminó mensaje en canal {channel_id}")
-                    return entry
-
-            # Fallback: si tiene target y es reciente
-            if getattr(entry, "target", None) and delta <= AUDIT_LOOKBACK_SECONDS:
-                logger.debug(f"Entrada de auditoría (fallback) encontrada: {entry.user}")
-                return entry
+        entries = await audit_cache.get_entries(guild, discord.AuditLogAction.message_delete, limit)
+        delete_count_tracker.observe(guild.id, entries)
+        entry = delete_count_tracker.claim(guild.id, channel_id, author_id)
+        if entry:
+            logger.debug(f"Entrada de auditoría encontrada: {entry.user} eliminó mensaje en canal {channel_id}")
+            return entry
 
     except discord.Forbidden:
         logger.warning("Permisos insuficientes para acceder al registro de auditoría")
@@ -57,30 +433,45 @@ async def find_audit_entry_for_channel(
         # Continuar con bulk_delete
 
     # Buscar en message_bulk_delete
-    try:
-        async for entry in guild.audit_logs(
-                limit=10,
-                action=discord.AuditLogAction.message_bulk_delete
-        ):
-            delta = (now - entry.created_at).total_seconds()
-            if delta < 0 or delta > AUDIT_LOOKBACK_SECONDS:
-                continue
+    entry = await find_bulk_delete_entry(guild, channel_id)
+    if entry:
+        return entry
+
+    logger.debug(f"No se encontró entrada de auditoría para el canal {channel_id}")
+    return None
 
-            extra = getattr(entry, "extra", None)
-            if extra and hasattr(extra, "channel"):
-                channel = getattr(extra, "channel", None)
-                if channel and getattr(channel, "id", None) == channel_id:
-                    logger.debug(
-                        f"Entrada de bulk delete encontrada: {entry.user} eliminó mensajes en canal {channel_id}")
-                    return entry
+
+async def find_bulk_delete_entry(
+        guild: discord.Guild,
+        channel_id: int,
+        limit: int = 10
+) -> Optional[discord.AuditLogEntry]:
+    """
+    Busca una entrada reciente de message_bulk_delete en channel_id.
+
+    Args:
+        guild: El servidor de Discord
+        channel_id: ID del canal donde se eliminaron los mensajes
+        limit: Número máximo de entradas a revisar
+
+    Returns:
+        AuditLogEntry si se encuentra, None en caso contrario
+    """
+    action = discord.AuditLogAction.message_bulk_delete
+    try:
+        await audit_cache.get_entries(guild, action, limit)
+        now = datetime.now(timezone.utc)
+        for entry in audit_cache.entries_for_channel(guild.id, action, channel_id):
+            if _is_recent(entry, now):
+                logger.debug(
+                    f"Entrada de bulk delete encontrada: {entry.user} eliminó mensajes en canal {channel_id}")
+                return entry
 
     except discord.Forbidden:
         logger.warning("Permisos insuficientes para acceder al registro de auditoría (bulk)")
-        return None
     except Exception as e:
         logger.error(f"Error al buscar en audit log (bulk_delete): {e}")
 
-    logger.debug(f"No se encontró entrada de auditoría para el canal {channel_id}")
     return None
 
 
@@ -0,0 +1,109 @@
+# Memoria y latencia de CompactMessageCache frente al cache original (OrderedDict de tuplas).
+#
+#   python bench_cache.py                    # 200000 mensajes sintéticos
+#   python bench_cache.py --count 1000000
+#
+# La memoria se mide con tracemalloc: todo lo que reserva cada cache con los mismos mensajes dentro.
+import argparse
+import random
+import time
+import tracemalloc
+from collections import OrderedDict
+
+from bench_compression import synthetic_messages
+from cache import CompactMessageCache, POLICY_FIFO, POLICY_LRU
+
+LOOKUPS = 100_000
+BATCH = 100
+# Margen de slots y arena sobre lo que ocupan los mensajes: con el anillo lleno, cada reubicación LRU compacta
+HEADROOM = 1.25
+
+
+class OrderedDictCache:
+    """El cache de antes: message_id -> (author_id, content), LRU con move_to_end y popitem."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[int, tuple[int, str]] = OrderedDict()
+
+    def put(self, message_id: int, author_id: int, content: str, channel_id: int = 0, guild_id: int = 0) -> None:
+        self._entries[message_id] = (author_id, content)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, message_id: int):
+        value = self._entries.get(message_id)
+        if value is not None:
+            self._entries.move_to_end(message_id)
+        return value
+
+    def get_many(self, message_ids) -> dict:
+        return {m: self._entries[m] for m in message_ids if m in self._entries}
+
+
+def _fill(cache, messages: list[tuple[int, int, str]]) -> float:
+    start = time.perf_counter()
+    for message_id, author_id, content in messages:
+        # Contenido nuevo en cada put, como los mensajes que llegan del gateway
+        cache.put(message_id, author_id, content.encode("utf-8").decode("utf-8"), 0, 0)
+    return time.perf_counter() - start
+
+
+def _measure(label: str, factory, messages: list[tuple[int, int, str]]) -> dict:
+    # tracemalloc frena cada reserva: la memoria se mide en una pasada y los tiempos en otra
+    tracemalloc.start()
+    cache = factory()
+    _fill(cache, messages)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del cache
+
+    cache = factory()
+    put_s = _fill(cache, messages)
+    rng = random.Random(1)
+    ids = [rng.choice(messages)[0] for _ in range(LOOKUPS)]
+    start = time.perf_counter()
+    for message_id in ids:
+        cache.get(message_id)
+    get_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in range(0, len(ids), BATCH):
+        cache.get_many(ids[i:i + BATCH])
+    get_many_s = time.perf_counter() - start
+
+    return {
+        "label": label,
+        "bytes_per_msg": memory / len(messages),
+        "put_us": put_s / len(messages) * 1e6,
+        "get_us": get_s / len(ids) * 1e6,
+        "get_many_us": get_many_s / len(ids) * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memoria y latencia del cache de mensajes")
+    parser.add_argument("--count", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    texts = synthetic_messages(args.count, args.seed)
+    base_id = 1_100_000_000_000_000_000
+    messages = [(base_id + (i << 22), rng.randrange(10 ** 17, 10 ** 18), text) for i, text in enumerate(texts)]
+    content_bytes = sum(len(text.encode("utf-8")) for text in texts)
+    print(f"{args.count} mensajes, {content_bytes / args.count:.1f} bytes de texto por mensaje")
+
+    entries, arena = int(args.count * HEADROOM), int(content_bytes * HEADROOM)
+    results = [
+        _measure("OrderedDict", lambda: OrderedDictCache(args.count), messages),
+        # Los mismos mensajes, sin desalojos
+        _measure("Compact lru", lambda: CompactMessageCache(entries, arena, policy=POLICY_LRU), messages),
+        _measure("Compact fifo", lambda: CompactMessageCache(entries, arena, policy=POLICY_FIFO), messages),
+    ]
+    for r in results:
+        print(f"{r['label']:>12}: {r['bytes_per_msg']:6.1f} B/msg  put {r['put_us']:5.2f} µs  "
+              f"get {r['get_us']:5.2f} µs  get_many {r['get_many_us']:5.2f} µs/msg")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+# Bytes por mensaje y latencia de get_message con el contenido sin comprimir, con deflate y con deflate + diccionario.
+#
+#   python bench_compression.py                          # 20000 mensajes sintéticos (reproducible con --seed)
+#   python bench_compression.py --db mensajes.db         # mensajes reales de una base de datos (solo lectura)
+#
+# El diccionario se entrena con train_dictionary sobre otros mensajes distintos de los medidos,
+# como en producción, donde solo se aplica a los mensajes que llegan después de entrenarlo.
+import argparse
+import logging
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import db
+
+BASE_MS = 1_700_000_000_000
+MESSAGE_SPACING_MS = 20_000  # ~4300 mensajes al día
+LATENCY_SAMPLES = 2000
+
+_WORDS = (
+    "que de no a la el es y en lo un por me una te los se con para mi está si bien pero yo eso las "
+    "qué sí al como le más todo esto ya ahora muy hay era él aquí ser tu fue así nos creo hacer "
+    "bueno vale jaja jajaja xd lol gg wtf alguien sabe cuando empieza el evento hoy mañana servidor "
+    "canal mensaje borrado moderador baneo kick rol admin bot música canción playlist cola skip "
+    "partida juego ranked equipo jugar stream directo vídeo link foto captura pantalla tío tía "
+    "gracias perdón vale genial igual también entonces porque tengo tienes tiene quiero puedo "
+    "sé nada algo mucho poco gente día noche semana luego antes después siempre nunca otra vez "
+    "hola buenas buenos días qué tal cómo estáis alguien conectado voy vamos venga dale ok okey"
+).split()
+_EMOJIS = ["😂", "👍", "🔥", "❤️", "😭", "🤔", "<:pepega:712345678901234567>", "<a:catjam:723456789012345678>"]
+
+
+def synthetic_messages(count: int, seed: int = 0) -> list[str]:
+    """Mensajes de chat con vocabulario Zipf, menciones, enlaces y emojis; la misma semilla da el mismo corpus."""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(_WORDS))]
+    messages = []
+    for _ in range(count):
+        words = rng.choices(_WORDS, weights, k=max(1, int(rng.lognormvariate(2.0, 1.0))))
+        if rng.random() < 0.1:
+            words.insert(0, f"<@{rng.randrange(10 ** 17, 10 ** 18)}>")
+        if rng.random() < 0.08:
+            video = "".join(rng.choices("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_", k=11))
+            words.append(f"https://www.youtube.com/watch?v={video}")
+        if rng.random() < 0.3:
+            words.append(rng.choice(_EMOJIS))
+        messages.append(" ".join(words))
+    return messages
+
+
+def load_messages(path: str) -> list[str]:
+    """Lee (sin modificarla) el contenido de los mensajes de una base de datos del bot."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if "diccionarios" in names:
+        db._load_dictionaries(conn)
+    tables = [row[0] for row in conn.execute(db.LIST_PARTITIONS_SQL)]
+    if db.LEGACY_TABLE in names:
+        tables.append(db.LEGACY_TABLE)
+    messages = [db.decode_content(row[0]) for table in tables
+                for row in conn.execute(f"SELECT content FROM {table}") if row[0]]
+    conn.close()
+    return messages
+
+
+def _open(path: Path, min_bytes: int) -> None:
+    db.close_db()
+    db._connections = db.ConnectionManager(path)
+    db._dictionaries.clear()
+    db._current_dict_id = 0
+    db.DB_COMPRESS_MIN_BYTES = min_bytes
+    db.init_db()
+
+
+def _insert(messages: list[str]) -> float:
+    """Guarda los mensajes en lotes como el escritor en segundo plano; devuelve los segundos empleados."""
+    start = time.perf_counter()
+    for offset in range(0, len(messages), 500):
+        by_partition = defaultdict(list)
+        for i, content in enumerate(messages[offset:offset + 500], offset):
+            message_id = ((BASE_MS + i * MESSAGE_SPACING_MS - db.DISCORD_EPOCH_MS) << 22) | i % 4096
+            by_partition[db.partition_for_message(message_id)].append((message_id, i % 50, content, i % 7))
+        with db.get_db_connection() as conn:
+            for table, rows in by_partition.items():
+                db._ensure_partition(conn, table)
+                db._insert_messages(conn, table, rows)
+    return time.perf_counter() - start
+
+
+def train(messages: list[str], directory: Path) -> bytes:
+    _open(directory / "entrenamiento.db", db.DB_COMPRESS_MIN_BYTES)
+    _insert(messages)
+    dict_id = db.train_dictionary()
+    data = db._dictionaries.get(dict_id, b"")
+    db.close_db()
+    return data
+
+
+def measure(label: str, messages: list[str], directory: Path, min_bytes: int, dictionary: bytes = b"") -> dict:
+    path = directory / f"{label}.db"
+    _open(path, min_bytes)
+    if dictionary:
+        with db.get_db_connection() as conn:
+            conn.execute("INSERT INTO diccionarios (id, data) VALUES (1, ?)", (dictionary,))
+            db._load_dictionaries(conn)
+    insert_s = _insert(messages)
+
+    conn = db.get_read_connection()
+    stored = compressed = 0
+    ids = []
+    for table in db.list_partitions(conn):
+        row = conn.execute(
+            f"SELECT total(length(CAST(content AS BLOB))), total(typeof(content) = 'blob') FROM {table}"
+        ).fetchone()
+        stored += row[0]
+        compressed += row[1]
+        ids.extend(r[0] for r in conn.execute(f"SELECT message_id FROM {table}"))
+
+    latencies = []
+    for message_id in random.Random(1).sample(ids, min(LATENCY_SAMPLES, len(ids))):
+        start = time.perf_counter()
+        db.get_message(message_id)
+        latencies.append((time.perf_counter() - start) * 1e6)
+
+    db.close_db()
+    vacuum = sqlite3.connect(path)
+    vacuum.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    vacuum.execute("VACUUM")
+    vacuum.close()
+    return {
+        "label": label,
+        "content_bytes": stored / len(messages),
+        "file_bytes": os.path.getsize(path) / len(messages),
+        "compressed_pct": compressed / len(messages) * 100,
+        "inserts_per_s": len(messages) / insert_s,
+        "get_us_p50": statistics.median(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tamaño y latencia del contenido comprimido de los mensajes")
+    parser.add_argument("--count", type=int, default=20000, help="Mensajes sintéticos a medir")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", help="Medir con los mensajes de esta base de datos en vez de sintéticos")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.db:
+        messages = load_messages(args.db)
+        random.Random(args.seed).shuffle(messages)
+        split = min(5000, len(messages) // 2)
+        training, messages = messages[:split], messages[split:]
+    else:
+        training = synthetic_messages(5000, args.seed + 1)
+        messages = synthetic_messages(args.count, args.seed)
+    raw = sum(len(m.encode("utf-8")) for m in messages) / len(messages)
+    min_bytes = db.DB_COMPRESS_MIN_BYTES
+    print(f"{len(messages)} mensajes, {raw:.1f} bytes de texto por mensaje, umbral {min_bytes} bytes")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        dictionary = train(training, directory)
+        results = [
+            measure("sin_comprimir", messages, directory, min_bytes=1 << 30),
+            measure("deflate", messages, directory, min_bytes),
+        ]
+        if dictionary:
+            results.append(measure("diccionario", messages, directory, min_bytes, dictionary))
+        else:
+            print("Muestras insuficientes para entrenar el diccionario")
+
+    base = results[0]
+    for r in results:
+        print(f"{r['label']:>14}: contenido {r['content_bytes']:6.1f} B/msg ({r['content_bytes'] / base['content_bytes']:5.1%})  "
+              f"fichero {r['file_bytes']:6.1f} B/msg ({r['file_bytes'] / base['file_bytes']:5.1%})  "
+              f"comprimidos {r['compressed_pct']:4.1f}%  {r['inserts_per_s']:7.0f} inserciones/s  "
+              f"get_message p50 {r['get_us_p50']:5.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# Retraso del event loop mientras el planificador ejecuta extracciones, en modo thread y en modo process.
+#
+#   python bench_extraction.py                    # trabajo sintético (parseo de JSON y regex, como yt-dlp)
+#   python bench_extraction.py --query "lofi"     # búsquedas reales con yt-dlp (necesita red)
+#   python bench_extraction.py --reuse            # coste por llamada: YoutubeDL reutilizada frente a una nueva
+#
+# El retraso es lo que tarda en despertar un asyncio.sleep(5 ms) de más: es lo que notan
+# los eventos del gateway y los frames de audio mientras yt-dlp trabaja.
+import argparse
+import asyncio
+import functools
+import http.server
+import json
+import os
+import re
+import statistics
+import tempfile
+import threading
+import time
+
+TICK = 0.005
+_PLAYER_RE = re.compile(r"var ytInitialPlayerResponse = ({.*?});</script>", re.S)
+
+
+def _synthetic_page(formats: int = 4000) -> str:
+    response = {
+        "videoDetails": {"title": "x" * 200, "shortDescription": "y" * 5000},
+        "streamingData": {"adaptiveFormats": [
+            {"itag": i, "mimeType": 'audio/webm; codecs="opus"', "bitrate": 128000 + i,
+             "url": f"https://rr1.googlevideo.com/videoplayback?expire=1&id={i}&" + "p=1&" * 40}
+            for i in range(formats)
+        ]},
+    }
+    return "<html>" + "<div>relleno</div>" * 20000 + f"var ytInitialPlayerResponse = {json.dumps(response)};</script>"
+
+
+_PAGE = None
+
+
+def synthetic_extraction(_: int) -> int:
+    """Lo que yt-dlp hace con el GIL tomado: buscar el JSON en la página, decodificarlo y elegir formato."""
+    global _PAGE
+    if _PAGE is None:
+        _PAGE = _synthetic_page()
+    data = json.loads(_PLAYER_RE.search(_PAGE).group(1))
+    formats = data["streamingData"]["adaptiveFormats"]
+    return max(formats, key=lambda f: (f["bitrate"], len(f["url"])))["itag"]
+
+
+async def _measure(mode: str, workers: int, jobs: int, query: str = None) -> dict:
+    from extraction import ExtractionScheduler, make_executor
+    import ytdl
+
+    scheduler = ExtractionScheduler(workers, jobs, executor_factory=lambda: make_executor(mode, workers))
+    if query:
+        fn, args = ytdl.search, [f"ytsearch5:{query} {i}" for i in range(jobs)]
+    else:
+        fn, args = synthetic_extraction, list(range(jobs))
+
+    # Calentar el pool (arranque de procesos e instancias de YoutubeDL) fuera de la medida
+    await asyncio.gather(*(scheduler.run(fn, a, guild_id=i) for i, a in enumerate(args[:workers])))
+
+    lags = []
+    done = asyncio.Event()
+
+    async def sampler():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(TICK)
+            lags.append((time.perf_counter() - start - TICK) * 1000)
+
+    sampling = asyncio.create_task(sampler())
+    start = time.perf_counter()
+    await asyncio.gather(*(scheduler.run(fn, a, guild_id=i) for i, a in enumerate(args)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await sampling
+    scheduler.shutdown()
+
+    lags.sort()
+    return {
+        "mode": mode,
+        "jobs_per_s": jobs / elapsed,
+        "lag_p50_ms": statistics.median(lags),
+        "lag_p99_ms": lags[int(len(lags) * 0.99)],
+        "lag_max_ms": lags[-1],
+    }
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def _serve_track(directory: str) -> http.server.ThreadingHTTPServer:
+    """Servidor HTTP local con un fichero de audio, para medir yt-dlp sin red."""
+    with open(os.path.join(directory, "pista.opus"), "wb") as f:
+        f.write(os.urandom(64 * 1024))
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def measure_reuse(calls: int, url: str = None) -> dict:
+    """Milisegundos por extracción creando una YoutubeDL en cada llamada y reutilizando la del hilo (ytdl)."""
+    import yt_dlp
+    import ytdl
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = None
+        if url is None:
+            server = _serve_track(directory)
+            url = f"http://127.0.0.1:{server.server_address[1]}/pista.opus"
+
+        def fresh():
+            with yt_dlp.YoutubeDL(ytdl.YDL_EXTRACT_OPTIONS) as ydl:
+                ydl.extract_info(url, download=False)
+
+        def reused():
+            ytdl._extract_info("extract", url)
+
+        def construct():
+            yt_dlp.YoutubeDL(ytdl.YDL_EXTRACT_OPTIONS).close()
+
+        results = {}
+        for label, fn in (("nueva", fresh), ("reutilizada", reused), ("solo_crear", construct)):
+            fn()  # Calentamiento: importación de extractores, primera conexión
+            times = []
+            for _ in range(calls):
+                start = time.perf_counter()
+                fn()
+                times.append((time.perf_counter() - start) * 1000)
+            results[label] = statistics.median(times)
+        if server:
+            server.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retraso del event loop con el pool de extracción en modo thread y process")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--jobs", type=int, default=32)
+    parser.add_argument("--query", help="Búsqueda real de yt-dlp en vez del trabajo sintético")
+    parser.add_argument("--reuse", action="store_true", help="Medir el coste por llamada de YoutubeDL nueva frente a reutilizada")
+    parser.add_argument("--calls", type=int, default=20, help="Llamadas por variante con --reuse")
+    parser.add_argument("--url", help="URL a extraer con --reuse (por defecto, un fichero servido en local)")
+    args = parser.parse_args()
+
+    if args.reuse:
+        result = measure_reuse(args.calls, args.url)
+        print(f"YoutubeDL nueva por llamada: {result['nueva']:7.1f} ms  "
+              f"reutilizada: {result['reutilizada']:7.1f} ms  "
+              f"(crear la instancia: {result['solo_crear']:.1f} ms)")
+        return
+
+    for mode in ("thread", "process"):
+        result = asyncio.run(_measure(mode, args.workers, args.jobs, args.query))
+        print(f"{result['mode']:>8}: {result['jobs_per_s']:6.1f} trabajos/s  "
+              f"retraso p50 {result['lag_p50_ms']:6.1f} ms  p99 {result['lag_p99_ms']:6.1f} ms  "
+              f"máx {result['lag_max_ms']:6.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# Tiempo de las migraciones sobre una tabla mensajes original grande, y escrituras/lecturas antes y después.
+#
+#   python bench_migration.py                    # 500000 mensajes
+#   python bench_migration.py --count 2000000
+#
+# "Antes" es el esquema original (id AUTOINCREMENT + UNIQUE(message_id) + idx_message_id);
+# "tablas", solo las particiones (el cambio de esquema); "después", el camino real con índice FTS
+# y compresión a través de _insert_messages y get_message.
+import argparse
+import logging
+import os
+import random
+import re
+import tempfile
+import time
+from pathlib import Path
+
+import db
+from bench_compression import synthetic_messages
+
+BASE_MS = 1_700_000_000_000
+MESSAGE_SPACING_MS = 20_000
+BATCH = 500
+LOOKUPS = 20_000
+EXTRA = 20_000
+
+LEGACY_SCHEMA = (
+    """CREATE TABLE mensajes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        message_id INTEGER UNIQUE,
+        author_id INTEGER,
+        content TEXT,
+        channel_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    "CREATE INDEX idx_message_id ON mensajes(message_id)",
+)
+
+
+class _MigrationTimes(logging.Handler):
+    """Recoge los tiempos que run_migrations escribe en el log."""
+
+    _RE = re.compile(r"Migración (\d+) completada en ([\d.]+)s")
+
+    def __init__(self):
+        super().__init__()
+        self.times: dict[int, float] = {}
+
+    def emit(self, record: logging.LogRecord) -> None:
+        match = self._RE.match(record.getMessage())
+        if match:
+            self.times[int(match.group(1))] = float(match.group(2))
+
+
+def _rows(texts: list[str], offset: int = 0) -> list[tuple]:
+    rows = []
+    for i, content in enumerate(texts, offset):
+        message_id = ((BASE_MS + i * MESSAGE_SPACING_MS - db.DISCORD_EPOCH_MS) << 22) | i % 4096
+        rows.append((message_id, i % 50, content, i % 7))
+    return rows
+
+
+def _legacy(rows: list[tuple], extra: list[tuple], ids: list[int]) -> tuple[float, float]:
+    """Inserciones/s en la tabla original ya llena y búsquedas/s por message_id."""
+    with db.get_db_connection() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.execute(statement)
+    sql = "INSERT OR REPLACE INTO mensajes (message_id, author_id, content, channel_id) VALUES (?, ?, ?, ?)"
+    for i in range(0, len(rows), BATCH):
+        with db.get_db_connection() as conn:
+            conn.executemany(sql, rows[i:i + BATCH])
+
+    start = time.perf_counter()
+    for i in range(0, len(extra), BATCH):
+        with db.get_db_connection() as conn:
+            conn.executemany(sql, extra[i:i + BATCH])
+    insert_rate = len(extra) / (time.perf_counter() - start)
+
+    conn = db.get_read_connection()
+    start = time.perf_counter()
+    for message_id in ids:
+        conn.execute("SELECT author_id, content, channel_id, created_at FROM mensajes WHERE message_id = ?",
+                     (message_id,)).fetchone()
+    return insert_rate, len(ids) / (time.perf_counter() - start)
+
+
+def _table_only(extra: list[tuple], ids: list[int]) -> tuple[float, float]:
+    """Lo mismo que _legacy sobre las particiones: sin índice FTS ni compresión, solo el cambio de esquema."""
+    start = time.perf_counter()
+    for i in range(0, len(extra), BATCH):
+        by_partition = {}
+        for row in extra[i:i + BATCH]:
+            by_partition.setdefault(db.partition_for_message(row[0]), []).append(row)
+        with db.get_db_connection() as conn:
+            for table, chunk in by_partition.items():
+                conn.execute(db.CREATE_PARTITION_SQL.format(table=table))
+                conn.executemany(db.INSERT_MESSAGE_SQL.format(table=table), chunk)
+    insert_rate = len(extra) / (time.perf_counter() - start)
+
+    conn = db.get_read_connection()
+    start = time.perf_counter()
+    for message_id in ids:
+        conn.execute(db.SELECT_MESSAGE_SQL.format(table=db.partition_for_message(message_id)),
+                     (message_id,)).fetchone()
+    return insert_rate, len(ids) / (time.perf_counter() - start)
+
+
+def _partitioned(extra: list[tuple], ids: list[int]) -> tuple[float, float]:
+    start = time.perf_counter()
+    for i in range(0, len(extra), BATCH):
+        by_partition = {}
+        for row in extra[i:i + BATCH]:
+            by_partition.setdefault(db.partition_for_message(row[0]), []).append(row)
+        with db.get_db_connection() as conn:
+            for table, chunk in by_partition.items():
+                db._ensure_partition(conn, table)
+                db._insert_messages(conn, table, chunk)
+    insert_rate = len(extra) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for message_id in ids:
+        db.get_message(message_id)
+    return insert_rate, len(ids) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de migración de la tabla mensajes y rendimiento antes/después")
+    parser.add_argument("--count", type=int, default=500_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    times = _MigrationTimes()
+    db.logger.addHandler(times)
+    db.logger.setLevel(logging.INFO)
+    db.logger.propagate = False
+
+    texts = synthetic_messages(args.count + 3 * EXTRA, args.seed)
+    rows = _rows(texts[:args.count])
+    # Mensajes nuevos (no migrados) para medir las inserciones de cada esquema
+    legacy_extra, table_extra, full_extra = (_rows(texts[start:start + EXTRA], offset=start)
+                                             for start in range(args.count, args.count + 3 * EXTRA, EXTRA))
+    ids = [row[0] for row in random.Random(args.seed).sample(rows, min(LOOKUPS, len(rows)))]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "mensajes.db"
+        db._connections = db.ConnectionManager(path)
+        legacy_insert, legacy_lookup = _legacy(rows, legacy_extra, ids)
+        size_before = os.path.getsize(path)
+
+        start = time.perf_counter()
+        db.init_db()
+        migration_s = time.perf_counter() - start
+        partitions = len(db.list_partitions())
+
+        table_insert, table_lookup = _table_only(table_extra, ids)
+        new_insert, new_lookup = _partitioned(full_extra, ids)
+        db.close_db()
+        size_after = os.path.getsize(path)
+
+    print(f"{args.count} mensajes en la tabla original, {partitions} particiones tras migrar")
+    print(f"migraciones: {migration_s:.1f} s en total  "
+          + "  ".join(f"{version}: {seconds:.2f} s" for version, seconds in sorted(times.times.items())))
+    print(f"   antes: {legacy_insert:8.0f} inserciones/s  {legacy_lookup:8.0f} búsquedas/s  "
+          f"{size_before / 1024 / 1024:7.1f} MB")
+    print(f"  tablas: {table_insert:8.0f} inserciones/s  {table_lookup:8.0f} búsquedas/s  "
+          "(particiones sin FTS ni compresión)")
+    print(f" después: {new_insert:8.0f} inserciones/s  {new_lookup:8.0f} búsquedas/s  "
+          f"{size_after / 1024 / 1024:7.1f} MB (incluye el índice FTS)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# Tiempo hasta el primer audio (TTFA) de /play con playlists de 10, 100 y 1000 entradas.
+#
+#   python bench_playlist.py
+#   python bench_playlist.py --call-ms 900 --page-ms 500 --stream-ms 1500
+#
+# yt-dlp se sustituye por un modelo de coste (no hace falta red): cada ytdl.search paga una petición
+# inicial más una página de continuación por cada 100 entradas hasta la última pedida, y
+# ytdl.extract_stream un tiempo fijo. "antes" es la búsqueda plana de toda la playlist (hasta
+# playlistmaxentries) seguida del stream de la primera canción; "trozos", iter_playlist + ensure_stream
+# como hace /play ahora; "cache", lo mismo con la playlist ya guardada en search_cache.
+# "cola" es cuándo termina ingest_playlist (final de la playlist o cola llena, MAX_QUEUE_SIZE).
+import os
+
+os.environ["EXTRACTION_MODE"] = "thread"  # ytdl se sustituye en este proceso
+
+import argparse
+import asyncio
+import logging
+import math
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import db
+import music
+import ytdl
+from extraction import extraction_scheduler, PRIORITY_INTERACTIVE
+from stream_cache import stream_cache
+
+SIZES = (10, 100, 1000)
+PAGE_SIZE = 100
+
+
+def _install_model(size: int, call_s: float, page_s: float, stream_s: float) -> None:
+    max_entries = ytdl.YDL_SEARCH_OPTIONS["playlistmaxentries"]
+
+    def search(query, start=None, end=None):
+        first, last = start or 1, min(size, end or max_entries)
+        time.sleep(call_s + math.ceil(last / PAGE_SIZE) * page_s)
+        playlist_id = query.rsplit("=", 1)[1]
+        return [{"title": f"canción {i}", "webpage_url": f"https://www.youtube.com/watch?v={playlist_id}-{i}",
+                 "thumbnail": None} for i in range(first, last + 1)]
+
+    def extract_stream(webpage_url):
+        time.sleep(stream_s)
+        return {"url": f"{webpage_url}&expire={int(time.time()) + 21600}", "ext": "webm", "acodec": "opus"}
+
+    ytdl.search = search
+    ytdl.extract_stream = extract_stream
+
+
+async def _before(query: str) -> tuple[float, float]:
+    start = time.perf_counter()
+    entries = await extraction_scheduler.run(ytdl.search, query, priority=PRIORITY_INTERACTIVE)
+    queued = time.perf_counter() - start
+    await music.ensure_stream(music._songs_from_entries(entries)[0])
+    return time.perf_counter() - start, queued
+
+
+async def _chunked(query: str) -> tuple[float, float]:
+    player = music.MusicPlayer(SimpleNamespace(id=1))
+    start = time.perf_counter()
+    chunks = music.iter_playlist(query)
+    first = await anext(chunks, [])
+    for song in first:
+        player.add_song(song)
+    await music.ensure_stream(player.get_next())
+    ttfa = time.perf_counter() - start
+    await music.ingest_playlist(chunks, player, requester=None)
+    queued = time.perf_counter() - start
+    player.cancel_prefetch()
+    return ttfa, queued
+
+
+async def _run(sizes, runs: int, call_s: float, page_s: float, stream_s: float) -> list[dict]:
+    results = []
+    for size in sizes:
+        _install_model(size, call_s, page_s, stream_s)
+        samples = {"antes": [], "trozos": [], "cache": []}
+        for run in range(runs):
+            query = f"https://www.youtube.com/playlist?list=PL{size}x{run}"
+            # Cada medida extrae el stream de la primera canción: solo la playlist puede venir del cache
+            stream_cache._entries.clear()
+            samples["antes"].append(await _before(query))
+            stream_cache._entries.clear()
+            samples["trozos"].append(await _chunked(query))
+            stream_cache._entries.clear()
+            samples["cache"].append(await _chunked(query))
+        for label, values in samples.items():
+            results.append({
+                "size": size,
+                "label": label,
+                "ttfa_ms": statistics.median(v[0] for v in values) * 1000,
+                "queued_ms": statistics.median(v[1] for v in values) * 1000,
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo hasta el primer audio de una playlist")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--call-ms", type=float, default=700, help="Petición inicial de cada ytdl.search")
+    parser.add_argument("--page-ms", type=float, default=400, help="Cada página de 100 entradas")
+    parser.add_argument("--stream-ms", type=float, default=1200, help="Cada ytdl.extract_stream")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db._connections = db.ConnectionManager(Path(tmp) / "mensajes.db")
+        db.init_db()
+        results = asyncio.run(_run(args.sizes, args.runs, args.call_ms / 1000, args.page_ms / 1000,
+                                   args.stream_ms / 1000))
+        db.close_db()
+    extraction_scheduler.shutdown()
+
+    print(f"modelo: {args.call_ms:.0f} ms por búsqueda + {args.page_ms:.0f} ms por página de {PAGE_SIZE}, "
+          f"{args.stream_ms:.0f} ms por stream; MAX_QUEUE_SIZE {music.MAX_QUEUE_SIZE}")
+    for r in results:
+        print(f"{r['size']:5} entradas {r['label']:>7}: primer audio {r['ttfa_ms']:7.0f} ms  "
+              f"cola {r['queued_ms']:7.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,33 @@
+if __name__ == '__main__':
+    # python bot.py arranca a través de main.py: los workers de EXTRACTION_MODE=process vuelven a importar
+    # el script principal, y main.py no carga nada (este módulo cargaría discord, el cache, la base de datos...)
+    import runpy
+    runpy.run_module("main", run_name="__main__", alter_sys=True)
+    raise SystemExit
+
 import discord
 from discord.ext import commands
 from discord import app_commands
 import asyncio
+import gzip
+import io
+import json
 import logging
-from config import TOKEN, ADMIN_LOG_CHANNEL_ID, MUSIC_CHANNEL_ID, INTENTS, AUDIT_WAIT_SECONDS, INACTIVITY_TIMEOUT
+import time
+from datetime import datetime, timezone
+from typing import Optional
+from config import (TOKEN, ADMIN_LOG_CHANNEL_ID, MUSIC_CHANNEL_ID, INTENTS, AUDIT_WAIT_SECONDS, INACTIVITY_TIMEOUT,
+                    DB_RETENTION_DAYS, DB_RETENTION_INTERVAL_HOURS, CACHE_SNAPSHOT_PATH, CACHE_SNAPSHOT_INTERVAL,
+                    SEARCH_PAGE_SIZE, EXPORT_MAX_ROWS, LOG_EDIT_DIFF)
 import db
 import cache
-from notifier import send_admin_embed
-from audit import find_audit_entry_for_channel
-from music import music_manager, search_youtube, play_next, LOOP_OFF, LOOP_CURRENT, LOOP_QUEUE
+import notifier
+from notifier import send_admin_embed, send_bulk_delete_summary, PRIORITY_HIGH, PRIORITY_NORMAL
+from audit import find_audit_entry_for_channel, find_bulk_delete_entry, deletion_correlator
+from extraction import extraction_scheduler
+from audio_cache import audio_cache
+from music import (music_manager, search_youtube, play_next, is_playlist_query, iter_playlist, ingest_playlist,
+                   LOOP_OFF, LOOP_CURRENT, LOOP_QUEUE)
 
 # CONFIGURACIÓN INICIAL
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -23,10 +42,54 @@ intents.voice_states = True
 class MusicBot(commands.Bot):
     def __init__(self):
         super().__init__(command_prefix="!", intents=intents, help_command=None)
+        self.retention_task = None
+        self.snapshot_task = None
 
     async def setup_hook(self):
+        db.init_db()
+        db.message_writer.start()
+        # Aún no se reciben eventos, así que el cache se puede rellenar desde otro hilo
+        await asyncio.to_thread(cache.load_snapshot, CACHE_SNAPSHOT_PATH)
+        await asyncio.to_thread(audio_cache.load)
+        self.retention_task = asyncio.create_task(retention_loop())
+        if CACHE_SNAPSHOT_INTERVAL > 0:
+            self.snapshot_task = asyncio.create_task(snapshot_loop())
         await self.tree.sync()
 
+    async def close(self):
+        for task in (self.retention_task, self.snapshot_task):
+            if task:
+                task.cancel()
+        await notifier.close()
+        await super().close()
+        audio_cache.shutdown()
+        extraction_scheduler.shutdown()
+        await asyncio.to_thread(cache.write_snapshot, cache.snapshot_state(), CACHE_SNAPSHOT_PATH)
+        # Guardar los mensajes pendientes antes de salir
+        await asyncio.to_thread(db.message_writer.stop)
+        db.close_db()
+
+
+async def retention_loop():
+    """Aplica la retención de mensajes periódicamente, fuera del event loop."""
+    while True:
+        try:
+            await asyncio.to_thread(db.delete_old_messages, DB_RETENTION_DAYS)
+            await asyncio.to_thread(db.purge_search_results)
+        except Exception as e:
+            logger.error(f"Error aplicando retención de mensajes: {e}")
+        await asyncio.sleep(DB_RETENTION_INTERVAL_HOURS * 3600)
+
+
+async def snapshot_loop():
+    """Guarda periódicamente el cache en disco para arrancar en caliente tras un reinicio."""
+    while True:
+        await asyncio.sleep(CACHE_SNAPSHOT_INTERVAL)
+        try:
+            await asyncio.to_thread(cache.write_snapshot, cache.snapshot_state(), CACHE_SNAPSHOT_PATH)
+        except Exception as e:
+            logger.error(f"Error guardando snapshot del cache: {e}")
+
 
 bot = MusicBot()
 
@@ -35,7 +98,6 @@ bot = MusicBot()
 @bot.event
 async def on_ready():
     logger.info(f"✅ Bot conectado como {bot.user}")
-    db.init_db()
 
 
 @bot.event
@@ -59,12 +121,45 @@ async def on_message(message: discord.Message):
     if message.author.bot or not message.guild: return
     try:
         content = message.content or ("[Embed]" if message.embeds else "[Sin contenido]")
-        db.save_message(message.id, message.author.id, content, message.channel.id)
-        cache.cache_message(message.id, message.author.id, content)
+        if not db.queue_message(message.id, message.author.id, content, message.channel.id):
+            # Cola llena: esperar hueco fuera del event loop (backpressure)
+            queued = await asyncio.to_thread(
+                db.message_writer.submit, message.id, message.author.id, content, message.channel.id,
+                block=True, timeout=5.0
+            )
+            if not queued:
+                logger.warning(f"Cola de escritura llena, mensaje {message.id} no guardado en la base de datos")
+        cache.cache_message(message.id, message.author.id, content, message.channel.id, message.guild.id)
     except Exception as e:
         logger.error(f"Error guardando mensaje: {e}")
 
 
+@bot.event
+async def on_raw_message_edit(payload: discord.RawMessageUpdateEvent):
+    data = payload.data
+    # Las actualizaciones sin "content" son solo de embeds (previsualizaciones de enlaces)
+    if not payload.guild_id or "content" not in data or data.get("author", {}).get("bot"): return
+    try:
+        content = data["content"] or ("[Embed]" if data.get("embeds") else "[Sin contenido]")
+        previous = cache.update_cached(payload.message_id, content)
+        if previous == content: return
+        edited_at = int(time.time() * 1000)
+        if not db.queue_edit(payload.message_id, content, edited_at):
+            queued = await asyncio.to_thread(
+                db.message_writer.submit_edit, payload.message_id, content, edited_at,
+                block=True, timeout=5.0
+            )
+            if not queued:
+                logger.warning(f"Cola de escritura llena, edición de {payload.message_id} no guardada")
+    except Exception as e:
+        logger.error(f"Error guardando edición: {e}")
+
+
+@bot.event
+async def on_audit_log_entry_create(entry: discord.AuditLogEntry):
+    deletion_correlator.feed(entry)
+
+
 @bot.event
 async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
     if not payload.guild_id: return
@@ -74,16 +169,25 @@ async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
     if not content:
         rec = db.get_message(payload.message_id)
         if rec: content, author_id = rec['content'], rec['author_id']
-    if not content: return
+    if not content:
+        # No se registra, pero su entrada de auditoría no debe quedar para el siguiente borrado del canal
+        deletion_correlator.ignore(discord.AuditLogAction.message_delete, payload.guild_id, payload.channel_id)
+        return
 
-    await asyncio.sleep(AUDIT_WAIT_SECONDS)
     try:
         guild = bot.get_guild(payload.guild_id)
         admin_channel = guild.get_channel(ADMIN_LOG_CHANNEL_ID)
         if not admin_channel: return
-        entry = await find_audit_entry_for_channel(guild, payload.channel_id)
+        # La entrada suele llegar por el gateway; el audit log por HTTP queda como respaldo
+        entry = await deletion_correlator.wait_for(
+            discord.AuditLogAction.message_delete, payload.guild_id, payload.channel_id, author_id,
+            timeout=AUDIT_WAIT_SECONDS
+        )
+        if entry is None:
+            entry = await find_audit_entry_for_channel(guild, payload.channel_id, author_id)
         executor = entry.user if entry else None
         if author_id and executor and executor.id == author_id: return
+        history = await asyncio.to_thread(db.get_message_history, payload.message_id) if LOG_EDIT_DIFF else None
 
         await send_admin_embed(
             admin_channel,
@@ -91,12 +195,51 @@ async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
             executor_display=executor.mention if executor else "Desconocido",
             channel_display=guild.get_channel(payload.channel_id).mention,
             content=content,
-            message_id=payload.message_id
+            message_id=payload.message_id,
+            priority=PRIORITY_HIGH if executor else PRIORITY_NORMAL,
+            history=history
         )
     except Exception as e:
         logger.error(f"Error enviando log: {e}")
 
 
+@bot.event
+async def on_raw_bulk_message_delete(payload: discord.RawBulkMessageDeleteEvent):
+    if not payload.guild_id: return
+    ids = list(payload.message_ids)
+    found = cache.get_cached_many(ids)
+    records = {mid: {"message_id": mid, "author_id": a, "content": c} for mid, (a, c) in found.items()}
+    missing = [mid for mid in ids if mid not in records]
+    if missing:
+        records.update(await asyncio.to_thread(db.get_messages, missing))
+    if not records:
+        deletion_correlator.ignore(discord.AuditLogAction.message_bulk_delete, payload.guild_id, payload.channel_id)
+        return
+
+    try:
+        guild = bot.get_guild(payload.guild_id)
+        admin_channel = guild.get_channel(ADMIN_LOG_CHANNEL_ID)
+        if not admin_channel: return
+        entry = await deletion_correlator.wait_for(
+            discord.AuditLogAction.message_bulk_delete, payload.guild_id, payload.channel_id, None,
+            timeout=AUDIT_WAIT_SECONDS
+        )
+        if entry is None:
+            entry = await find_bulk_delete_entry(guild, payload.channel_id)
+        executor = entry.user if entry else None
+        channel = guild.get_channel(payload.channel_id)
+
+        await send_bulk_delete_summary(
+            admin_channel,
+            executor_display=executor.mention if executor else "Desconocido",
+            channel_display=channel.mention if channel else f"<#{payload.channel_id}>",
+            messages=[records[mid] for mid in sorted(records)],
+            total=len(ids)
+        )
+    except Exception as e:
+        logger.error(f"Error enviando log de borrado masivo: {e}")
+
+
 # --- COMANDOS MÚSICA ---
 def check_music_channel(interaction: discord.Interaction) -> bool:
     return not MUSIC_CHANNEL_ID or interaction.channel_id == MUSIC_CHANNEL_ID
@@ -110,12 +253,20 @@ async def play(interaction: discord.Interaction, busqueda: str):
         return await interaction.response.send_message("❌ Entra a un canal de voz primero.", ephemeral=True)
 
     await interaction.response.defer()
-    songs = await search_youtube(busqueda)
-    if not songs:
-        return await interaction.followup.send("❌ No encontré resultados.")
-
+    requested_at = time.monotonic()
     guild = interaction.guild
     voice_channel = interaction.user.voice.channel
+
+    if is_playlist_query(busqueda):
+        # La playlist se pide mientras se conecta al canal de voz y se añade a la cola por trozos
+        chunks = iter_playlist(busqueda, guild.id)
+        first_chunk = asyncio.ensure_future(anext(chunks, []))
+        songs = None
+    else:
+        songs = await search_youtube(busqueda, guild.id)
+        if not songs:
+            return await interaction.followup.send("❌ No encontré resultados.")
+
     player = music_manager.get_player(guild)
     vc = guild.voice_client
 
@@ -125,8 +276,16 @@ async def play(interaction: discord.Interaction, busqueda: str):
         elif vc.channel != voice_channel:
             await vc.move_to(voice_channel)
     except Exception as e:
+        if songs is None:
+            first_chunk.cancel()
+            # Hay que esperar a que termine el anext cancelado: no se puede cerrar un generador en marcha
+            await asyncio.gather(first_chunk, return_exceptions=True)
+            await chunks.aclose()
         return await interaction.followup.send(f"❌ Error conexión: {e}")
 
+    if songs is None:
+        return await play_playlist(interaction, player, vc, chunks, first_chunk, requested_at)
+
     for s in songs:
         s.requester = interaction.user
         player.add_song(s)
@@ -152,6 +311,47 @@ async def play(interaction: discord.Interaction, busqueda: str):
     await interaction.followup.send(embed=embed)
 
 
+async def play_playlist(interaction: discord.Interaction, player, vc, chunks, first_chunk, requested_at: float):
+    """Empieza a sonar con el primer trozo de la playlist y añade el resto en segundo plano."""
+    try:
+        first = await first_chunk
+    except Exception as e:
+        logger.error(f"Error en búsqueda de playlist: {e}")
+        first = []
+    if not first:
+        await chunks.aclose()
+        return await interaction.followup.send("❌ No encontré resultados.")
+
+    added = 0
+    for s in first:
+        s.requester = interaction.user
+        if player.add_song(s):
+            added += 1
+
+    if not vc.is_playing() and not player.current:
+        player.requested_at = requested_at
+        await play_next(vc, player)
+
+    def progress_embed(count: int, done: bool) -> discord.Embed:
+        embed = discord.Embed(
+            title="📂 Playlist Añadida" if done else "📂 Añadiendo playlist...",
+            description=f"Se han añadido **{count}** canciones." if done else f"**{count}** canciones en cola...",
+            color=discord.Color.purple()
+        )
+        embed.set_footer(text=f"Pedido por {interaction.user.display_name}",
+                         icon_url=interaction.user.display_avatar.url)
+        return embed
+
+    message = await interaction.followup.send(embed=progress_embed(added, False), wait=True)
+
+    async def on_progress(count: int, done: bool):
+        await message.edit(embed=progress_embed(added + count, done))
+
+    task = asyncio.create_task(ingest_playlist(chunks, player, interaction.user, on_progress))
+    player.ingest_tasks.add(task)
+    task.add_done_callback(player.ingest_tasks.discard)
+
+
 @bot.tree.command(name="loop", description="Configura el modo de repetición")
 @app_commands.choices(modo=[
     app_commands.Choice(name="⛔ Desactivado", value=0),
@@ -227,5 +427,161 @@ async def queue(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed)
 
 
-if __name__ == '__main__':
+# --- BÚSQUEDA Y EXPORTACIÓN DE MENSAJES ---
+def _parse_date(value: Optional[str], end_of_day: bool = False) -> Optional[int]:
+    """Convierte AAAA-MM-DD (UTC) en milisegundos Unix; lanza ValueError si el formato no es válido."""
+    if not value:
+        return None
+    day = datetime.strptime(value.strip(), "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    ms = int(day.timestamp() * 1000)
+    return ms + 86_399_999 if end_of_day else ms
+
+
+def _search_filters(texto, autor, canal, desde, hasta) -> dict:
+    return {
+        "text": texto,
+        "author_id": autor.id if autor else None,
+        "channel_id": canal.id if canal else None,
+        "since_ms": _parse_date(desde),
+        "until_ms": _parse_date(hasta, end_of_day=True),
+    }
+
+
+def _visible_channel_ids(guild: discord.Guild, member: discord.Member) -> set[int]:
+    # La base de datos no guarda el servidor, así que los resultados se limitan a sus canales,
+    # y de ellos a los que quien consulta puede leer (Gestionar mensajes no da acceso a los privados)
+    channels = list(guild.channels) + list(guild.threads)
+    return {c.id for c in channels if c.permissions_for(member).read_message_history}
+
+
+def _search_page(channel_ids: set[int], filters: dict, before_id: Optional[int], limit: int) -> list[dict]:
+    """Devuelve hasta limit + 1 resultados (el extra indica si hay más páginas)."""
+    results = []
+    for message in db.iter_messages(before_id=before_id, page_size=limit + 1, channel_ids=channel_ids, **filters):
+        results.append(message)
+        if len(results) > limit:
+            break
+    return results
+
+
+def _export_messages(channel_ids: set[int], filters: dict, max_rows: int) -> tuple[io.BytesIO, int]:
+    """Escribe los resultados como NDJSON comprimido con gzip."""
+    buffer = io.BytesIO()
+    count = 0
+    with gzip.GzipFile(fileobj=buffer, mode="wb") as gz:
+        for message in db.iter_messages(channel_ids=channel_ids, **filters):
+            gz.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+            count += 1
+            if count >= max_rows:
+                break
+    buffer.seek(0)
+    return buffer, count
+
+
+class SearchView(discord.ui.View):
+    """Paginación de /buscar: cada página se consulta al pulsar, con el último ID como cursor."""
+
+    def __init__(self, channel_ids: set[int], filters: dict):
+        super().__init__(timeout=300)
+        self.channel_ids = channel_ids
+        self.filters = filters
+        self.cursors = [None]  # before_id de cada página visitada
+        self.results = []
+
+    async def load(self):
+        page = await asyncio.to_thread(
+            _search_page, self.channel_ids, self.filters, self.cursors[-1], SEARCH_PAGE_SIZE
+        )
+        self.results = page[:SEARCH_PAGE_SIZE]
+        self.newer.disabled = len(self.cursors) == 1
+        self.older.disabled = len(page) <= SEARCH_PAGE_SIZE
+
+    def build_embed(self) -> discord.Embed:
+        embed = discord.Embed(title="🔎 Mensajes encontrados", color=discord.Color.blue())
+        if not self.results:
+            embed.description = "No hay resultados."
+            return embed
+
+        lines = []
+        for message in self.results:
+            created = discord.utils.format_dt(discord.utils.snowflake_time(message["message_id"]), "f")
+            content = message["content"] or "*[Sin texto]*"
+            if len(content) > 200:
+                content = content[:197] + "..."
+            lines.append(f"{created} <@{message['author_id']}> en <#{message['channel_id']}>\n{content}")
+        embed.description = "\n\n".join(lines)[:4000]
+        embed.set_footer(text=f"Página {len(self.cursors)}")
+        return embed
+
+    @discord.ui.button(label="◀️ Más recientes", style=discord.ButtonStyle.secondary)
+    async def newer(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.cursors.pop()
+        await self.load()
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+
+    @discord.ui.button(label="Más antiguos ▶️", style=discord.ButtonStyle.secondary)
+    async def older(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.cursors.append(self.results[-1]["message_id"])
+        await self.load()
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+
+
+@bot.tree.command(name="buscar", description="Busca en los mensajes registrados")
+@app_commands.default_permissions(manage_messages=True)
+@app_commands.guild_only()
+@app_commands.describe(texto="Palabras a buscar", autor="Autor del mensaje", canal="Canal del mensaje",
+                       desde="Fecha inicial (AAAA-MM-DD)", hasta="Fecha final (AAAA-MM-DD)")
+async def buscar(interaction: discord.Interaction, texto: Optional[str] = None, autor: Optional[discord.User] = None,
+                 canal: Optional[discord.abc.GuildChannel] = None, desde: Optional[str] = None,
+                 hasta: Optional[str] = None):
+    try:
+        filters = _search_filters(texto, autor, canal, desde, hasta)
+    except ValueError:
+        return await interaction.response.send_message("❌ Usa fechas con formato AAAA-MM-DD.", ephemeral=True)
+
+    await interaction.response.defer(ephemeral=True)
+    view = SearchView(_visible_channel_ids(interaction.guild, interaction.user), filters)
+    try:
+        await view.load()
+    except Exception as e:
+        logger.error(f"Error en /buscar: {e}")
+        return await interaction.followup.send("❌ Error al buscar mensajes.", ephemeral=True)
+    await interaction.followup.send(embed=view.build_embed(), view=view, ephemeral=True)
+
+
+@bot.tree.command(name="exportar", description="Exporta los mensajes registrados (NDJSON comprimido)")
+@app_commands.default_permissions(manage_messages=True)
+@app_commands.guild_only()
+@app_commands.describe(texto="Palabras a buscar", autor="Autor del mensaje", canal="Canal del mensaje",
+                       desde="Fecha inicial (AAAA-MM-DD)", hasta="Fecha final (AAAA-MM-DD)")
+async def exportar(interaction: discord.Interaction, texto: Optional[str] = None, autor: Optional[discord.User] = None,
+                   canal: Optional[discord.abc.GuildChannel] = None, desde: Optional[str] = None,
+                   hasta: Optional[str] = None):
+    try:
+        filters = _search_filters(texto, autor, canal, desde, hasta)
+    except ValueError:
+        return await interaction.response.send_message("❌ Usa fechas con formato AAAA-MM-DD.", ephemeral=True)
+
+    await interaction.response.defer(ephemeral=True)
+    try:
+        buffer, count = await asyncio.to_thread(
+            _export_messages, _visible_channel_ids(interaction.guild, interaction.user), filters, EXPORT_MAX_ROWS
+        )
+    except Exception as e:
+        logger.error(f"Error en /exportar: {e}")
+        return await interaction.followup.send("❌ Error al exportar mensajes.", ephemeral=True)
+
+    if buffer.getbuffer().nbytes > interaction.guild.filesize_limit:
+        return await interaction.followup.send("❌ La exportación supera el tamaño máximo; acota los filtros.",
+                                               ephemeral=True)
+
+    note = f" (límite de {EXPORT_MAX_ROWS})" if count >= EXPORT_MAX_ROWS else ""
+    await interaction.followup.send(
+        f"📦 {count} mensajes exportados{note}.",
+        file=discord.File(buffer, filename="mensajes.ndjson.gz"),
+        ephemeral=True
+    )
+
+
+def main():
     bot.run(TOKEN)
\ No newline at end of file
@@ -1,30 +1,495 @@
-from collections import OrderedDict
+import mmap
+import os
+import struct
+import time
+from array import array
 from typing import Optional, Tuple
-from config import CACHE_MAX
+from config import (CACHE_MAX, CACHE_MAX_BYTES, CACHE_POLICY, CACHE_TTL_SECONDS, CACHE_CHANNEL_QUOTA_BYTES,
+                    CACHE_GUILD_QUOTA_BYTES)
 import logging
 
 logger = logging.getLogger(__name__)
 
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK_64 = (1 << 64) - 1
+
+POLICY_LRU = "lru"
+POLICY_FIFO = "fifo"
+POLICY_TTL = "ttl"
+POLICIES = (POLICY_LRU, POLICY_FIFO, POLICY_TTL)
+
+# Snapshot: cabecera + arrays de metadatos de las entradas vivas (de la más antigua a la más nueva) + contenido
+_SNAPSHOT_MAGIC = b"RMBC"
+_SNAPSHOT_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct("<4sHIQ")  # magic, versión, número de entradas, bytes de contenido
+_SNAPSHOT_ARRAYS = (('q', "ids"), ('q', "authors"), ('q', "channels"), ('q', "guilds"), ('d', "times"),
+                    ('i', "lengths"))
+
+# Fracción de espacio muerto (entradas marcadas) a partir de la cual se compacta en lugar de desalojar
+_COMPACT_THRESHOLD = 0.25
+
+
+class _SlotGroups:
+    """
+    Listas enlazadas de slots por clave (canal o servidor), en orden de inserción.
+
+    Permiten encontrar en O(1) la entrada más antigua de un canal o servidor
+    para aplicar su cuota de bytes. La clave 0 (desconocida) no se agrupa.
+    """
+
+    def __init__(self, size: int, limit: int):
+        self.limit = limit
+        self.keys = array('q', [0]) * size
+        self._next = array('i', [-1]) * size
+        self._chains: dict[int, list[int]] = {}  # clave -> [primer slot, último slot, bytes vivos]
+
+    def reset(self) -> None:
+        self._chains.clear()
+
+    def append(self, slot: int, key: int, size: int) -> None:
+        self.keys[slot] = key
+        self._next[slot] = -1
+        if not key:
+            return
+        chain = self._chains.get(key)
+        if chain is None:
+            self._chains[key] = [slot, slot, size]
+            return
+        if chain[0] == -1:
+            chain[0] = slot
+        else:
+            self._next[chain[1]] = slot
+        chain[1] = slot
+        chain[2] += size
+
+    def on_kill(self, slot: int, size: int) -> None:
+        key = self.keys[slot]
+        chain = self._chains.get(key)
+        if chain:
+            chain[2] -= size
+            if chain[0] == -1 and chain[2] <= 0:
+                del self._chains[key]
+
+    def on_evict(self, slot: int) -> None:
+        # El anillo desaloja en orden, así que el slot es el primero de su lista si sigue en ella
+        key = self.keys[slot]
+        chain = self._chains.get(key)
+        if chain and chain[0] == slot:
+            self._advance(key, chain)
+
+    def _advance(self, key: int, chain: list[int]) -> None:
+        chain[0] = self._next[chain[0]]
+        if chain[0] == -1:
+            chain[1] = -1
+            if chain[2] <= 0:
+                del self._chains[key]
+
+    def over_limit(self, key: int) -> bool:
+        chain = self._chains.get(key) if key and self.limit else None
+        return chain is not None and chain[2] > self.limit
+
+    def pop_oldest_live(self, key: int, lengths: array) -> int:
+        """Saca de la lista de `key` su slot vivo más antiguo, saltando los marcados."""
+        chain = self._chains.get(key)
+        while chain and chain[0] != -1:
+            slot = chain[0]
+            self._advance(key, chain)
+            if lengths[slot] >= 0:
+                return slot
+        return -1
+
+    def memory_bytes(self) -> int:
+        return self.keys.itemsize * len(self.keys) + self._next.itemsize * len(self._next)
+
+
+class CompactMessageCache:
+    """
+    Cache de mensajes con huella de memoria fija y presupuesto en bytes.
+
+    Los metadatos viven en arrays circulares (message_id, author_id, canal,
+    servidor, hora de inserción, posición y longitud del contenido), el texto
+    UTF-8 en un único bytearray circular de `max_bytes` y la búsqueda por
+    message_id en una tabla hash de direccionamiento abierto. Cada entrada
+    cuesta unos 70 bytes más su contenido, frente a los cientos de bytes de
+    un OrderedDict de tuplas.
+
+    Las entradas eliminadas o reubicadas quedan marcadas (longitud -1) hasta
+    que la cabeza del anillo las alcanza o se compacta.
+
+    Políticas:
+        lru: un acierto reubica la entrada al final del anillo.
+        fifo: se desaloja por orden de inserción.
+        ttl: como fifo, y además las entradas con más de `ttl` segundos caducan.
+    """
+
+    def __init__(
+            self,
+            max_entries: int,
+            max_bytes: int,
+            policy: str = POLICY_LRU,
+            ttl: float = 0,
+            channel_quota: int = 0,
+            guild_quota: int = 0
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Política de cache desconocida: {policy}")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.ttl = ttl
+        self._ids = array('q', [0]) * max_entries
+        self._authors = array('q', [0]) * max_entries
+        self._offsets = array('q', [0]) * max_entries
+        self._lengths = array('i', [0]) * max_entries
+        self._times = array('d', [0.0]) * max_entries
+        self._arena = bytearray(max_bytes)
+        self._by_channel = _SlotGroups(max_entries, channel_quota)
+        self._by_guild = _SlotGroups(max_entries, guild_quota)
+
+        self._index_bits = max(4, (2 * max_entries - 1).bit_length())
+        self._index_mask = (1 << self._index_bits) - 1
+        self._index = array('i', [-1]) * (1 << self._index_bits)
+
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "compactions": 0,
+            "evictions": dict.fromkeys(("capacity", "bytes", "ttl", "channel_quota", "guild_quota"), 0)
+        }
+        self._reset()
+
+    def _reset(self) -> None:
+        self._head = 0          # Slot más antiguo del anillo
+        self._count = 0         # Slots ocupados, vivos o marcados
+        self._live = 0          # Entradas vivas
+        self._live_bytes = 0
+        self._tail_offset = 0   # Siguiente posición libre del arena
+        self._wrapped = False   # El arena ha dado la vuelta: datos en [cabeza, fin) + [0, cola)
+        self._by_channel.reset()
+        self._by_guild.reset()
+
+    # --- Índice hash ---
+    def _hash(self, message_id: int) -> int:
+        return ((message_id * _HASH_MULTIPLIER) & _MASK_64) >> (64 - self._index_bits)
+
+    def _find(self, message_id: int) -> int:
+        pos = self._hash(message_id)
+        while True:
+            slot = self._index[pos]
+            if slot == -1:
+                return -1
+            if self._ids[slot] == message_id:
+                return pos
+            pos = (pos + 1) & self._index_mask
+
+    def _index_insert(self, message_id: int, slot: int) -> None:
+        pos = self._hash(message_id)
+        while self._index[pos] != -1:
+            pos = (pos + 1) & self._index_mask
+        self._index[pos] = slot
+
+    def _index_delete(self, pos: int) -> None:
+        # Borrado con desplazamiento hacia atrás: no deja lápidas en la tabla
+        index, mask = self._index, self._index_mask
+        index[pos] = -1
+        hole, probe = pos, pos
+        while True:
+            probe = (probe + 1) & mask
+            slot = index[probe]
+            if slot == -1:
+                return
+            home = self._hash(self._ids[slot])
+            if hole <= probe:
+                stays = hole < home <= probe
+            else:
+                stays = home > hole or home <= probe
+            if not stays:
+                index[hole] = slot
+                index[probe] = -1
+                hole = probe
+
+    # --- Anillo de slots y arena ---
+    def _kill(self, pos: int) -> None:
+        slot = self._index[pos]
+        size = self._lengths[slot]
+        self._index_delete(pos)
+        self._live -= 1
+        self._live_bytes -= size
+        self._by_channel.on_kill(slot, size)
+        self._by_guild.on_kill(slot, size)
+        self._lengths[slot] = -1
+
+    def _kill_slot(self, slot: int, reason: str) -> None:
+        logger.debug(f"Mensaje {self._ids[slot]} eliminado del cache ({reason})")
+        self._kill(self._find(self._ids[slot]))
+        self.stats["evictions"][reason] += 1
+
+    def _evict_oldest(self, reason: str) -> None:
+        slot = self._head
+        old_offset = self._offsets[slot]
+        if self._lengths[slot] >= 0:
+            self._kill_slot(slot, reason)
+        self._by_channel.on_evict(slot)
+        self._by_guild.on_evict(slot)
+
+        self._head = (self._head + 1) % self.max_entries
+        self._count -= 1
+        if self._count == 0:
+            self._tail_offset = 0
+            self._wrapped = False
+        elif self._wrapped and self._offsets[self._head] < old_offset:
+            self._wrapped = False
+
+    def _arena_used(self) -> int:
+        if self._count == 0:
+            return 0
+        head_offset = self._offsets[self._head]
+        if self._wrapped:
+            return self.max_bytes - head_offset + self._tail_offset
+        return self._tail_offset - head_offset
+
+    def _try_alloc(self, size: int) -> int:
+        if self._count == 0:
+            self._tail_offset = 0
+            self._wrapped = False
+            return 0
+
+        head_offset = self._offsets[self._head]
+        if not self._wrapped:
+            if self._tail_offset + size <= self.max_bytes:
+                return self._tail_offset
+            if size <= head_offset:
+                self._wrapped = True
+                self._tail_offset = 0
+                return 0
+        elif self._tail_offset + size <= head_offset:
+            return self._tail_offset
+        return -1
+
+    def _worth_compacting(self) -> bool:
+        dead_slots = self._count - self._live
+        dead_bytes = self._arena_used() - self._live_bytes
+        return (dead_slots >= self.max_entries * _COMPACT_THRESHOLD
+                or dead_bytes >= self.max_bytes * _COMPACT_THRESHOLD)
+
+    def _compact(self) -> None:
+        """Reescribe las entradas vivas al principio del anillo y del arena, en el mismo orden."""
+        live = []
+        for i in range(self._count):
+            slot = (self._head + i) % self.max_entries
+            size = self._lengths[slot]
+            if size >= 0:
+                offset = self._offsets[slot]
+                live.append((self._ids[slot], self._authors[slot], self._by_channel.keys[slot],
+                             self._by_guild.keys[slot], self._times[slot], bytes(self._arena[offset:offset + size])))
+
+        for i in range(len(self._index)):
+            self._index[i] = -1
+        self._reset()
+        for entry in live:
+            self._append(*entry)
+        self.stats["compactions"] += 1
+
+    def _make_room(self, size: int) -> int:
+        """Garantiza un slot libre y `size` bytes contiguos en el arena; devuelve el offset."""
+        compacted = False
+        while True:
+            if self._count < self.max_entries:
+                offset = self._try_alloc(size)
+                if offset != -1:
+                    return offset
+                reason = "bytes"
+            else:
+                reason = "capacity"
+
+            if not compacted and self._lengths[self._head] >= 0 and self._worth_compacting():
+                self._compact()
+                compacted = True
+                continue
+            self._evict_oldest(reason)
+
+    def _append(self, message_id: int, author_id: int, channel_id: int, guild_id: int,
+                timestamp: float, data: bytes) -> None:
+        offset = self._make_room(len(data))
+
+        slot = (self._head + self._count) % self.max_entries
+        self._ids[slot] = message_id
+        self._authors[slot] = author_id
+        self._times[slot] = timestamp
+        self._offsets[slot] = offset
+        self._lengths[slot] = len(data)
+        self._arena[offset:offset + len(data)] = data
+        self._by_channel.append(slot, channel_id, len(data))
+        self._by_guild.append(slot, guild_id, len(data))
+
+        self._tail_offset = offset + len(data)
+        self._count += 1
+        self._live += 1
+        self._live_bytes += len(data)
+        self._index_insert(message_id, slot)
+
+    def _enforce_quotas(self, channel_id: int, guild_id: int) -> None:
+        for groups, key, reason in ((self._by_channel, channel_id, "channel_quota"),
+                                    (self._by_guild, guild_id, "guild_quota")):
+            while groups.over_limit(key):
+                slot = groups.pop_oldest_live(key, self._lengths)
+                if slot == -1:
+                    break
+                self._kill_slot(slot, reason)
+
+    def _expire(self, now: float) -> None:
+        while self._count and now - self._times[self._head] > self.ttl:
+            self._evict_oldest("ttl")
+
+    # --- API ---
+    def put(self, message_id: int, author_id: int, content: str, channel_id: int = 0, guild_id: int = 0) -> None:
+        now = time.time()
+        if self.policy == POLICY_TTL:
+            self._expire(now)
+
+        pos = self._find(message_id)
+        if pos != -1:
+            self._kill(pos)
+
+        self._append(message_id, author_id, channel_id, guild_id, now, content.encode("utf-8")[:self.max_bytes])
+        self._enforce_quotas(channel_id, guild_id)
+
+    def get(self, message_id: int) -> Optional[Tuple[int, str]]:
+        pos = self._find(message_id)
+        if pos == -1:
+            self.stats["misses"] += 1
+            return None
+
+        slot = self._index[pos]
+        if self.policy == POLICY_TTL and time.time() - self._times[slot] > self.ttl:
+            self._kill_slot(slot, "ttl")
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["hits"] += 1
+        offset, length = self._offsets[slot], self._lengths[slot]
+        author_id = self._authors[slot]
+        # errors="ignore": el contenido pudo truncarse a mitad de un carácter
+        content = self._arena[offset:offset + length].decode("utf-8", errors="ignore")
+
+        # Acceso reciente (LRU): reubicar al final del anillo si no es ya la entrada más nueva
+        newest = (self._head + self._count - 1) % self.max_entries
+        if self.policy == POLICY_LRU and slot != newest:
+            data = bytes(self._arena[offset:offset + length])
+            channel_id, guild_id = self._by_channel.keys[slot], self._by_guild.keys[slot]
+            self._kill(pos)
+            self._append(message_id, author_id, channel_id, guild_id, time.time(), data)
+        return author_id, content
+
+    def get_many(self, message_ids) -> dict[int, Tuple[int, str]]:
+        """Busca varios mensajes de una pasada, sin reubicarlos (pensado para mensajes ya borrados)."""
+        found = {}
+        now = time.time()
+        for message_id in message_ids:
+            pos = self._find(message_id)
+            if pos == -1:
+                continue
+            slot = self._index[pos]
+            if self.policy == POLICY_TTL and now - self._times[slot] > self.ttl:
+                continue
+            offset, length = self._offsets[slot], self._lengths[slot]
+            found[message_id] = (self._authors[slot],
+                                 self._arena[offset:offset + length].decode("utf-8", errors="ignore"))
+        self.stats["hits"] += len(found)
+        self.stats["misses"] += len(message_ids) - len(found)
+        return found
+
+    def update(self, message_id: int, content: str) -> Optional[str]:
+        """Sustituye el contenido conservando autor, canal y servidor; devuelve el anterior o None si no estaba."""
+        pos = self._find(message_id)
+        if pos == -1:
+            return None
+
+        slot = self._index[pos]
+        offset, length = self._offsets[slot], self._lengths[slot]
+        previous = self._arena[offset:offset + length].decode("utf-8", errors="ignore")
+        data = content.encode("utf-8")[:self.max_bytes]
+        if data == self._arena[offset:offset + length]:
+            return previous
+
+        author_id = self._authors[slot]
+        channel_id, guild_id = self._by_channel.keys[slot], self._by_guild.keys[slot]
+        self._kill(pos)
+        self._append(message_id, author_id, channel_id, guild_id, time.time(), data)
+        self._enforce_quotas(channel_id, guild_id)
+        return previous
+
+    def remove(self, message_id: int) -> bool:
+        pos = self._find(message_id)
+        if pos == -1:
+            return False
+        self._kill(pos)
+        return True
+
+    def clear(self) -> int:
+        count = self._live
+        for i in range(len(self._index)):
+            self._index[i] = -1
+        self._reset()
+        return count
+
+    def __len__(self) -> int:
+        return self._live
+
+    def export_state(self) -> tuple:
+        """
+        Copia el estado interno para escribir un snapshot desde otro hilo.
+
+        Solo hace copias de memoria contiguas, así que es rápido de ejecutar en el event loop.
+        """
+        return (array('q', self._ids), array('q', self._authors), array('q', self._by_channel.keys),
+                array('q', self._by_guild.keys), array('d', self._times), array('q', self._offsets),
+                array('i', self._lengths), bytes(self._arena), self._head, self._count)
+
+    def load_entries(self, ids, authors, channels, guilds, times, lengths, content) -> None:
+        """Inserta entradas en orden de antigüedad; content es la concatenación de sus textos."""
+        offset = 0
+        for i in range(len(ids)):
+            end = offset + lengths[i]
+            data = content[offset:min(end, offset + self.max_bytes)]
+            self._append(ids[i], authors[i], channels[i], guilds[i], times[i], data)
+            offset = end
+
+    def memory_bytes(self) -> int:
+        """Memoria reservada por las estructuras del cache (fija, no depende del uso)."""
+        arrays = (self._ids, self._authors, self._offsets, self._lengths, self._times, self._index)
+        return (sum(a.itemsize * len(a) for a in arrays) + len(self._arena)
+                + self._by_channel.memory_bytes() + self._by_guild.memory_bytes())
+
+    @property
+    def bytes_used(self) -> int:
+        return self._live_bytes
+
+
 # Cache: message_id -> (author_id, content)
-_message_cache: OrderedDict[int, Tuple[int, str]] = OrderedDict()
+_message_cache = CompactMessageCache(
+    CACHE_MAX,
+    CACHE_MAX_BYTES,
+    policy=CACHE_POLICY,
+    ttl=CACHE_TTL_SECONDS,
+    channel_quota=CACHE_CHANNEL_QUOTA_BYTES,
+    guild_quota=CACHE_GUILD_QUOTA_BYTES
+)
 
 
-def cache_message(message_id: int, author_id: int, content: str) -> None:
+def cache_message(message_id: int, author_id: int, content: str, channel_id: int = 0, guild_id: int = 0) -> None:
     """
-    Almacena un mensaje en el cache LRU.
+    Almacena un mensaje en el cache.
 
     Args:
         message_id: ID del mensaje
         author_id: ID del autor
         content: Contenido del mensaje
+        channel_id: ID del canal, para la cuota por canal (0 = sin cuota)
+        guild_id: ID del servidor, para la cuota por servidor (0 = sin cuota)
     """
     try:
-        _message_cache[message_id] = (author_id, content)
-
-        # Mantener LRU - eliminar los más antiguos
-        while len(_message_cache) > CACHE_MAX:
-            oldest_id, _ = _message_cache.popitem(last=False)
-            logger.debug(f"Mensaje {oldest_id} eliminado del cache (LRU)")
+        _message_cache.put(message_id, author_id, content, channel_id, guild_id)
     except Exception as e:
         logger.error(f"Error al cachear mensaje {message_id}: {e}")
 
@@ -40,18 +505,47 @@ def get_cached(message_id: int) -> Optional[Tuple[int, str]]:
         Tupla (author_id, content) o None si no está en cache
     """
     try:
-        val = _message_cache.get(message_id)
-        if val is None:
-            return None
-
-        # Mover al final (acceso reciente - LRU)
-        _message_cache.move_to_end(message_id)
-        return val
+        return _message_cache.get(message_id)
     except Exception as e:
         logger.error(f"Error al recuperar del cache mensaje {message_id}: {e}")
         return None
 
 
+def get_cached_many(message_ids) -> dict[int, Tuple[int, str]]:
+    """
+    Recupera varios mensajes del cache en una sola pasada.
+
+    Args:
+        message_ids: Colección de IDs de mensaje
+
+    Returns:
+        Diccionario message_id -> (author_id, content) con los que están en cache
+    """
+    try:
+        return _message_cache.get_many(message_ids)
+    except Exception as e:
+        logger.error(f"Error al recuperar del cache {len(message_ids)} mensajes: {e}")
+        return {}
+
+
+def update_cached(message_id: int, content: str) -> Optional[str]:
+    """
+    Actualiza el contenido de un mensaje editado que ya está en cache.
+
+    Args:
+        message_id: ID del mensaje editado
+        content: Nuevo contenido
+
+    Returns:
+        Contenido anterior, o None si el mensaje no estaba en cache
+    """
+    try:
+        return _message_cache.update(message_id, content)
+    except Exception as e:
+        logger.error(f"Error al actualizar en cache mensaje {message_id}: {e}")
+        return None
+
+
 def remove_cached(message_id: int) -> bool:
     """
     Elimina un mensaje del cache.
@@ -63,10 +557,7 @@ def remove_cached(message_id: int) -> bool:
         True si se eliminó, False si no estaba en cache
     """
     try:
-        if message_id in _message_cache:
-            _message_cache.pop(message_id)
-            return True
-        return False
+        return _message_cache.remove(message_id)
     except Exception as e:
         logger.error(f"Error al eliminar del cache mensaje {message_id}: {e}")
         return False
@@ -80,8 +571,7 @@ def clear_cache() -> int:
         Número de elementos eliminados
     """
     try:
-        count = len(_message_cache)
-        _message_cache.clear()
+        count = _message_cache.clear()
         logger.info(f"Cache limpiado: {count} mensajes eliminados")
         return count
     except Exception as e:
@@ -99,5 +589,103 @@ def get_cache_stats() -> dict:
     return {
         "size": len(_message_cache),
         "max_size": CACHE_MAX,
-        "usage_percent": (len(_message_cache) / CACHE_MAX * 100) if CACHE_MAX > 0 else 0
-    }
\ No newline at end of file
+        "usage_percent": (len(_message_cache) / CACHE_MAX * 100) if CACHE_MAX > 0 else 0,
+        "bytes_used": _message_cache.bytes_used,
+        "max_bytes": CACHE_MAX_BYTES,
+        "memory_bytes": _message_cache.memory_bytes(),
+        "policy": _message_cache.policy,
+        "hits": _message_cache.stats["hits"],
+        "misses": _message_cache.stats["misses"],
+        "compactions": _message_cache.stats["compactions"],
+        "evictions": dict(_message_cache.stats["evictions"])
+    }
+
+
+def snapshot_state() -> tuple:
+    """Captura el estado del cache para write_snapshot (llamar desde el event loop)."""
+    return _message_cache.export_state()
+
+
+def write_snapshot(state: tuple, path) -> int:
+    """
+    Escribe un snapshot binario del cache de forma atómica.
+
+    Args:
+        state: Resultado de snapshot_state()
+        path: Ruta del fichero de snapshot
+
+    Returns:
+        Número de entradas guardadas
+    """
+    try:
+        ids, authors, channels, guilds, times, offsets, lengths, arena, head, count = state
+        size = len(ids)
+        live = [slot for slot in ((head + i) % size for i in range(count)) if lengths[slot] >= 0]
+
+        columns = {
+            "ids": array('q', (ids[s] for s in live)),
+            "authors": array('q', (authors[s] for s in live)),
+            "channels": array('q', (channels[s] for s in live)),
+            "guilds": array('q', (guilds[s] for s in live)),
+            "times": array('d', (times[s] for s in live)),
+            "lengths": array('i', (lengths[s] for s in live)),
+        }
+        content = b"".join(arena[offsets[s]:offsets[s] + lengths[s]] for s in live)
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, _SNAPSHOT_VERSION, len(live), len(content)))
+            for _, name in _SNAPSHOT_ARRAYS:
+                columns[name].tofile(f)
+            f.write(content)
+        os.replace(tmp_path, path)
+        logger.info(f"Snapshot del cache guardado: {len(live)} mensajes, {len(content)} bytes de contenido")
+        return len(live)
+    except Exception as e:
+        logger.error(f"Error al guardar snapshot del cache: {e}")
+        return 0
+
+
+def load_snapshot(path) -> int:
+    """
+    Carga un snapshot en el cache mediante una lectura mapeada en memoria.
+
+    Args:
+        path: Ruta del fichero de snapshot
+
+    Returns:
+        Número de entradas cargadas
+    """
+    if not os.path.exists(path) or os.path.getsize(path) < _SNAPSHOT_HEADER.size:
+        return 0
+
+    start = time.perf_counter()
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                magic, version, count, content_size = _SNAPSHOT_HEADER.unpack_from(view)
+                if magic != _SNAPSHOT_MAGIC or version != _SNAPSHOT_VERSION:
+                    logger.warning(f"Snapshot del cache {path} no reconocido, se ignora")
+                    return 0
+
+                columns = {}
+                position = _SNAPSHOT_HEADER.size
+                for typecode, name in _SNAPSHOT_ARRAYS:
+                    column = array(typecode)
+                    column.frombytes(view[position:position + column.itemsize * count])
+                    columns[name] = column
+                    position += column.itemsize * count
+
+                content = view[position:position + content_size]
+                _message_cache.load_entries(content=content, **columns)
+                del content
+            finally:
+                view.release()
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"Snapshot del cache cargado: {count} mensajes en {elapsed_ms:.1f} ms")
+        return count
+    except Exception as e:
+        logger.error(f"Error al cargar snapshot del cache: {e}")
+        return 0
\ No newline at end of file
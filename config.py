@@ -17,22 +17,63 @@ ADMIN_LOG_CHANNEL_ID = int(os.environ.get("ADMIN_LOG_CHANNEL_ID", 0))
 if ADMIN_LOG_CHANNEL_ID == 0:
     logger.warning("⚠️ ADMIN_LOG_CHANNEL_ID no configurado, los logs de mensajes eliminados no funcionarán")
 
+# Webhook opcional del canal de logs (entrega con bucket de rate limit propio; si falla se usa el canal)
+ADMIN_LOG_WEBHOOK_URL = os.environ.get("ADMIN_LOG_WEBHOOK_URL", "")
+WEBHOOK_RATE_MESSAGES = int(os.environ.get("WEBHOOK_RATE_MESSAGES", 5))
+WEBHOOK_RATE_SECONDS = float(os.environ.get("WEBHOOK_RATE_SECONDS", 2.0))
+WEBHOOK_POOL_SIZE = int(os.environ.get("WEBHOOK_POOL_SIZE", 4))
+
 # Canal de música (0 = todos los canales permitidos)
 MUSIC_CHANNEL_ID = int(os.environ.get("MUSIC_CHANNEL_ID", 0))
 if MUSIC_CHANNEL_ID == 0:
     logger.info("ℹ️ MUSIC_CHANNEL_ID no configurado, comandos de música permitidos en todos los canales")
 
 # Cache Configuration
-CACHE_MAX = int(os.environ.get("CACHE_MAX", 5000))
+CACHE_MAX = int(os.environ.get("CACHE_MAX", 200000))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", 32 * 1024 * 1024))  # Memoria para el texto de los mensajes
+CACHE_POLICY = os.environ.get("CACHE_POLICY", "lru").lower()  # lru, fifo o ttl
+CACHE_TTL_SECONDS = float(os.environ.get("CACHE_TTL_SECONDS", 86400))  # Solo con CACHE_POLICY=ttl
+CACHE_CHANNEL_QUOTA_BYTES = int(os.environ.get("CACHE_CHANNEL_QUOTA_BYTES", 0))  # 0 = sin cuota
+CACHE_GUILD_QUOTA_BYTES = int(os.environ.get("CACHE_GUILD_QUOTA_BYTES", 0))  # 0 = sin cuota
+CACHE_SNAPSHOT_PATH = Path(os.environ.get("CACHE_SNAPSHOT_PATH", Path(__file__).parent / "cache.snapshot"))
+CACHE_SNAPSHOT_INTERVAL = int(os.environ.get("CACHE_SNAPSHOT_INTERVAL", 300))  # Segundos, 0 = solo al apagar
 if CACHE_MAX < 100:
     logger.warning(f"⚠️ CACHE_MAX muy bajo ({CACHE_MAX}), recomendado al menos 1000")
+if CACHE_MAX_BYTES < 64 * 1024:
+    logger.warning(f"⚠️ CACHE_MAX_BYTES muy bajo ({CACHE_MAX_BYTES}), usando 64 KiB")
+    CACHE_MAX_BYTES = 64 * 1024
+if CACHE_POLICY not in ("lru", "fifo", "ttl"):
+    logger.warning(f"⚠️ CACHE_POLICY ({CACHE_POLICY}) desconocida, usando lru")
+    CACHE_POLICY = "lru"
 
 # Audit Configuration
 AUDIT_LOOKBACK_SECONDS = int(os.environ.get("AUDIT_LOOKBACK_SECONDS", 10))
 AUDIT_WAIT_SECONDS = float(os.environ.get("AUDIT_WAIT_SECONDS", 1.2))
+AUDIT_CACHE_SECONDS = float(os.environ.get("AUDIT_CACHE_SECONDS", 1.0))  # Reutilizar una consulta al audit log
+LOG_EDIT_DIFF = os.environ.get("LOG_EDIT_DIFF", "1") == "1"  # Mostrar la última edición en el log de borrado
+
+# Notificaciones de administración
+NOTIFY_MAX_QUEUE = int(os.environ.get("NOTIFY_MAX_QUEUE", 50))  # Por canal; el exceso se agrupa en un resumen
+NOTIFY_RATE_MESSAGES = int(os.environ.get("NOTIFY_RATE_MESSAGES", 5))  # Límite de Discord: 5 mensajes...
+NOTIFY_RATE_SECONDS = float(os.environ.get("NOTIFY_RATE_SECONDS", 5.0))  # ...cada 5 segundos por canal
 
 # Database Configuration
 DB_PATH = Path(__file__).parent / "mensajes.db"
+DB_BATCH_SIZE = int(os.environ.get("DB_BATCH_SIZE", 200))  # Filas por commit
+DB_FLUSH_INTERVAL_MS = int(os.environ.get("DB_FLUSH_INTERVAL_MS", 250))  # Espera máxima antes de un commit
+DB_QUEUE_MAX = int(os.environ.get("DB_QUEUE_MAX", 10000))  # Mensajes pendientes antes de aplicar backpressure
+DB_PARTITION_DAYS = int(os.environ.get("DB_PARTITION_DAYS", 7))  # Días por partición de mensajes
+DB_RETENTION_DAYS = int(os.environ.get("DB_RETENTION_DAYS", 30))
+DB_RETENTION_INTERVAL_HOURS = float(os.environ.get("DB_RETENTION_INTERVAL_HOURS", 6))
+DB_COMPRESS_MIN_BYTES = int(os.environ.get("DB_COMPRESS_MIN_BYTES", 96))  # Mensajes más cortos se guardan sin comprimir
+DB_COMPRESS_LEVEL = int(os.environ.get("DB_COMPRESS_LEVEL", 6))
+DB_DICT_SIZE_KB = int(os.environ.get("DB_DICT_SIZE_KB", 16))  # Tamaño del diccionario de compresión (máx. 32)
+DB_CACHE_SIZE_KB = int(os.environ.get("DB_CACHE_SIZE_KB", 16384))  # Cache de páginas por conexión
+DB_MMAP_SIZE_MB = int(os.environ.get("DB_MMAP_SIZE_MB", 256))  # 0 = sin mmap
+
+# Búsqueda y exportación de mensajes (/buscar, /exportar)
+SEARCH_PAGE_SIZE = int(os.environ.get("SEARCH_PAGE_SIZE", 10))
+EXPORT_MAX_ROWS = int(os.environ.get("EXPORT_MAX_ROWS", 50000))  # Límite de filas por exportación
 
 # Bot Intents
 INTENTS = {
@@ -47,12 +88,48 @@ INTENTS = {
 MAX_QUEUE_SIZE = int(os.environ.get("MAX_QUEUE_SIZE", 100))  # Aumentado de 50 a 100
 DEFAULT_VOLUME = float(os.environ.get("DEFAULT_VOLUME", 0.5))
 INACTIVITY_TIMEOUT = int(os.environ.get("INACTIVITY_TIMEOUT", 300))  # 5 minutos
+PREFETCH_COUNT = int(os.environ.get("PREFETCH_COUNT", 2))  # Canciones de la cola con el stream ya resuelto (0 = desactivado)
+STREAM_REFRESH_MARGIN = int(os.environ.get("STREAM_REFRESH_MARGIN", 300))  # Segundos antes de caducar para re-resolver
+EXTRACTION_MODE = os.environ.get("EXTRACTION_MODE", "thread").lower()  # thread o process (yt-dlp fuera del GIL)
+EXTRACTION_WORKERS = int(os.environ.get("EXTRACTION_WORKERS", 4))  # Workers dedicados a yt-dlp
+EXTRACTION_GUILD_LIMIT = int(os.environ.get("EXTRACTION_GUILD_LIMIT", 2))  # Extracciones simultáneas por servidor
+SEARCH_CACHE_MAX = int(os.environ.get("SEARCH_CACHE_MAX", 1000))  # Búsquedas guardadas en memoria
+SEARCH_CACHE_TTL = int(os.environ.get("SEARCH_CACHE_TTL", 6 * 3600))  # Segundos
+SEARCH_CACHE_NEGATIVE_TTL = int(os.environ.get("SEARCH_CACHE_NEGATIVE_TTL", 300))  # Búsquedas sin resultados
+YTDL_MAX_USES = int(os.environ.get("YTDL_MAX_USES", 200))  # Extracciones por instancia de YoutubeDL antes de renovarla
+EXTRACTION_TIMEOUT = float(os.environ.get("EXTRACTION_TIMEOUT", 30))  # Plazo de búsquedas y extracciones (cola incluida)
+STREAM_CACHE_MAX = int(os.environ.get("STREAM_CACHE_MAX", 500))  # URLs de audio resueltas, compartidas entre servidores
+STREAM_DEFAULT_TTL = int(os.environ.get("STREAM_DEFAULT_TTL", 3600))  # Validez supuesta si la URL no trae expire=
+OPUS_PASSTHROUGH = os.environ.get("OPUS_PASSTHROUGH", "1") == "1"  # Enviar el Opus de YouTube sin decodificar a PCM
+
+# Cache de audio en disco (vacío = desactivado)
+AUDIO_CACHE_DIR = os.environ.get("AUDIO_CACHE_DIR", "")
+AUDIO_CACHE_MAX_MB = int(os.environ.get("AUDIO_CACHE_MAX_MB", 2048))  # Tamaño total de los ficheros .opus
+AUDIO_CACHE_MAX_TRACK_MB = int(os.environ.get("AUDIO_CACHE_MAX_TRACK_MB", 30))  # Pistas más grandes no se guardan
+AUDIO_CACHE_MIN_PLAYS = int(os.environ.get("AUDIO_CACHE_MIN_PLAYS", 3))  # Reproducciones para descargar una canción
+AUDIO_CACHE_AHEAD = int(os.environ.get("AUDIO_CACHE_AHEAD", 1))  # Próximas canciones de la cola que se descargan (0 = no)
 
 # Validaciones
 if DEFAULT_VOLUME < 0 or DEFAULT_VOLUME > 1:
     logger.warning(f"⚠️ DEFAULT_VOLUME ({DEFAULT_VOLUME}) fuera de rango [0-1], usando 0.5")
     DEFAULT_VOLUME = 0.5
 
+if DB_BATCH_SIZE < 1:
+    logger.warning(f"⚠️ DB_BATCH_SIZE ({DB_BATCH_SIZE}) inválido, usando 1")
+    DB_BATCH_SIZE = 1
+
+if DB_PARTITION_DAYS < 1:
+    logger.warning(f"⚠️ DB_PARTITION_DAYS ({DB_PARTITION_DAYS}) inválido, usando 7")
+    DB_PARTITION_DAYS = 7
+
+if EXTRACTION_MODE not in ("thread", "process"):
+    logger.warning(f"⚠️ EXTRACTION_MODE ({EXTRACTION_MODE}) desconocido, usando thread")
+    EXTRACTION_MODE = "thread"
+
+if AUDIO_CACHE_DIR and AUDIO_CACHE_MAX_MB < AUDIO_CACHE_MAX_TRACK_MB:
+    logger.warning(f"⚠️ AUDIO_CACHE_MAX_MB ({AUDIO_CACHE_MAX_MB}) menor que AUDIO_CACHE_MAX_TRACK_MB, usando {AUDIO_CACHE_MAX_TRACK_MB}")
+    AUDIO_CACHE_MAX_MB = AUDIO_CACHE_MAX_TRACK_MB
+
 if INACTIVITY_TIMEOUT < 60:
     logger.warning(f"⚠️ INACTIVITY_TIMEOUT muy bajo ({INACTIVITY_TIMEOUT}s), recomendado al menos 60s")
 
@@ -1,15 +1,36 @@
+import json
+import math
 import sqlite3
-from typing import Optional
+import queue
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from difflib import SequenceMatcher
+from functools import lru_cache
+from typing import Iterable, NamedTuple, Optional
 from contextlib import contextmanager
-from config import DB_PATH
+from config import (DB_PATH, DB_BATCH_SIZE, DB_FLUSH_INTERVAL_MS, DB_QUEUE_MAX, DB_CACHE_SIZE_KB, DB_MMAP_SIZE_MB,
+                    DB_PARTITION_DAYS, DB_COMPRESS_MIN_BYTES, DB_COMPRESS_LEVEL, DB_DICT_SIZE_KB)
 import logging
 
 logger = logging.getLogger(__name__)
 
-CREATE_TABLE_SQL = """
-CREATE TABLE IF NOT EXISTS mensajes (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    message_id INTEGER UNIQUE,
+# Tabla única original (id AUTOINCREMENT + UNIQUE + idx_message_id); la migración 1 la reparte en particiones
+LEGACY_TABLE = "mensajes"
+MIGRATION_CHUNK_SIZE = 10000
+
+# Los mensajes se guardan en una tabla por periodo (mensajes_pAAAAMMDD, fecha de inicio del periodo)
+PARTITION_PREFIX = "mensajes_p"
+DISCORD_EPOCH_MS = 1420070400000
+MS_PER_DAY = 86_400_000
+
+CREATE_PARTITION_SQL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    message_id INTEGER PRIMARY KEY,
     author_id INTEGER,
     content TEXT,
     channel_id INTEGER,
@@ -17,35 +38,627 @@ CREATE TABLE IF NOT EXISTS mensajes (
 );
 """
 
-CREATE_INDEX_SQL = """
-CREATE INDEX IF NOT EXISTS idx_message_id ON mensajes(message_id);
+INSERT_MESSAGE_SQL = "INSERT OR REPLACE INTO {table} (message_id, author_id, content, channel_id) VALUES (?, ?, ?, ?)"
+SELECT_MESSAGE_SQL = "SELECT message_id, author_id, content, channel_id, created_at FROM {table} WHERE message_id = ?"
+LIST_PARTITIONS_SQL = (
+    "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'mensajes_p[0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9]'"
+)
+
+# Índice de texto completo por partición (FTS5 sin contenido: solo el índice, rowid = message_id).
+# Autor y canal se indexan como columnas para poder filtrar por ellos sin índices extra.
+FTS_SUFFIX = "_fts"
+CREATE_FTS_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(
+    content, author, channel, content='', tokenize='unicode61 remove_diacritics 2'
+);
+"""
+INSERT_FTS_SQL = "INSERT INTO {table}_fts (rowid, content, author, channel) VALUES (?, ?, ?, ?)"
+DELETE_FTS_SQL = "INSERT INTO {table}_fts ({table}_fts, rowid, content, author, channel) VALUES ('delete', ?, ?, ?, ?)"
+
+# Historial de ediciones por partición. La partición guarda siempre la última versión y cada
+# revisión N es un delta que reconstruye la versión N-1 a partir de la N (edited_at: cuándo se creó la N).
+REVISION_SUFFIX = "_rev"
+CREATE_REVISION_SQL = """
+CREATE TABLE IF NOT EXISTS {table}_rev (
+    message_id INTEGER NOT NULL,
+    revision INTEGER NOT NULL,
+    delta BLOB NOT NULL,
+    edited_at INTEGER NOT NULL,
+    PRIMARY KEY (message_id, revision)
+) WITHOUT ROWID;
 """
 
+# Resultados de búsquedas de música (segundo nivel de search_cache), serializados en JSON comprimido
+CREATE_SEARCH_CACHE_SQL = """
+CREATE TABLE IF NOT EXISTS busquedas (
+    query TEXT PRIMARY KEY,
+    results BLOB NOT NULL,
+    expires_at INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Reproducciones por vídeo: frecuencia del cache de audio en disco (audio_cache), que sobrevive a los reinicios
+CREATE_AUDIO_PLAYS_SQL = """
+CREATE TABLE IF NOT EXISTS reproducciones (
+    video_id TEXT PRIMARY KEY,
+    plays INTEGER NOT NULL,
+    last_played INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Ajustes fijados al crear la base de datos (p. ej. el ancho de las particiones)
+CREATE_SETTINGS_SQL = """
+CREATE TABLE IF NOT EXISTS ajustes (
+    clave TEXT PRIMARY KEY,
+    valor TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Diccionarios zlib entrenados con mensajes reales; el de mayor id es el que se usa al comprimir
+CREATE_DICTIONARY_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS diccionarios (
+    id INTEGER PRIMARY KEY,
+    data BLOB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# Contenido comprimido: BLOB con cabecera (id de diccionario, 0 = sin diccionario) + deflate sin cabecera zlib.
+# El contenido corto o incompresible se guarda tal cual como TEXT.
+_COMPRESSED_HEADER = struct.Struct("<H")
+_DICT_TOKEN_RE = re.compile(r"\w+\W?")
+DICT_MIN_SAMPLES = 200
+
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}",
+    f"PRAGMA mmap_size = {DB_MMAP_SIZE_MB * 1024 * 1024}",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+
+
+class ConnectionManager:
+    """
+    Conexiones SQLite persistentes.
+
+    Mantiene una única conexión de escritura protegida por un lock y una
+    conexión de lectura por hilo. Con WAL las lecturas no esperan a los
+    commits del escritor.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._write_conn: Optional[sqlite3.Connection] = None
+        self._write_lock = threading.RLock()
+        self._local = threading.local()
+        self._all_conns: list[sqlite3.Connection] = []
+        self._all_lock = threading.Lock()
+
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        # check_same_thread=False: la conexión de escritura se comparte bajo lock
+        conn = sqlite3.connect(str(self._path), check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        if read_only:
+            conn.execute("PRAGMA query_only = ON")
+        with self._all_lock:
+            self._all_conns.append(conn)
+        return conn
+
+    @contextmanager
+    def write(self):
+        """Context manager sobre la conexión de escritura; hace commit al salir."""
+        with self._write_lock:
+            if self._write_conn is None:
+                self._write_conn = self._connect()
+            conn = self._write_conn
+            try:
+                yield conn
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Error en base de datos: {e}")
+                raise
+
+    def read(self) -> sqlite3.Connection:
+        """Devuelve la conexión de lectura del hilo actual."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect(read_only=True)
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        """Cierra todas las conexiones abiertas."""
+        with self._write_lock, self._all_lock:
+            for conn in self._all_conns:
+                try:
+                    conn.close()
+                except Exception as e:
+                    logger.error(f"Error al cerrar conexión: {e}")
+            self._all_conns.clear()
+            self._write_conn = None
+            self._local = threading.local()
+
+
+_connections = ConnectionManager(DB_PATH)
+
 
-@contextmanager
 def get_db_connection():
-    """Context manager para conexiones a la base de datos."""
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"Error en base de datos: {e}")
-        raise
-    finally:
-        conn.close()
+    """Context manager para la conexión persistente de escritura."""
+    return _connections.write()
+
+
+def get_read_connection() -> sqlite3.Connection:
+    """Conexión persistente de solo lectura para el hilo actual."""
+    return _connections.read()
+
+
+def close_db() -> None:
+    """Cierra las conexiones persistentes (llamar al apagar el bot)."""
+    _connections.close()
+
+
+# Días que cubre cada partición. Es propiedad de la base de datos (tabla ajustes): los nombres de las
+# particiones ya creadas dependen de él, así que cambiar DB_PARTITION_DAYS después no lo modifica.
+_partition_days = DB_PARTITION_DAYS
+
+
+def _partition_start_day(epoch_day: int) -> int:
+    return epoch_day - epoch_day % _partition_days
+
+
+@lru_cache(maxsize=4096)
+def _partition_name(start_day: int) -> str:
+    # Se calcula en cada inserción y cada búsqueda; strftime cuesta más que la propia consulta
+    return PARTITION_PREFIX + (date(1970, 1, 1) + timedelta(days=start_day)).strftime("%Y%m%d")
+
+
+def _partition_day(table: str) -> int:
+    return (date.fromisoformat(table[len(PARTITION_PREFIX):]) - date(1970, 1, 1)).days
+
+
+def partition_for_message(message_id: int) -> str:
+    """
+    Calcula la partición de un mensaje a partir de la marca de tiempo de su snowflake.
+
+    Args:
+        message_id: ID del mensaje de Discord
+
+    Returns:
+        Nombre de la tabla que contiene (o contendrá) el mensaje
+    """
+    return partition_for_timestamp((message_id >> 22) + DISCORD_EPOCH_MS)
+
+
+def partition_for_timestamp(timestamp_ms: int) -> str:
+    """Nombre de la partición que cubre una marca de tiempo Unix en milisegundos."""
+    return _partition_name(_partition_start_day(timestamp_ms // MS_PER_DAY))
+
+
+def _ensure_partition(conn: sqlite3.Connection, table: str) -> None:
+    conn.execute(CREATE_PARTITION_SQL.format(table=table))
+    conn.execute(CREATE_FTS_SQL.format(table=table))
+    conn.execute(CREATE_REVISION_SQL.format(table=table))
+
+
+def _insert_messages(conn: sqlite3.Connection, table: str, rows: list[tuple]) -> None:
+    """Inserta filas (message_id, author_id, content, channel_id) en una partición y en su índice FTS."""
+    # Si el mismo mensaje llega dos veces gana la última versión, como en la partición
+    rows = list({row[0]: row for row in rows}.values())
+    # El índice FTS no tiene contenido propio: al reemplazar un mensaje hay que retirar sus valores anteriores
+    ids = [row[0] for row in rows]
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        previous = conn.execute(
+            f"SELECT message_id, author_id, content, channel_id FROM {table} WHERE message_id IN ({placeholders})",
+            chunk
+        ).fetchall()
+        conn.executemany(
+            DELETE_FTS_SQL.format(table=table),
+            [(message_id, decode_content(content), str(author_id), str(channel_id))
+             for message_id, author_id, content, channel_id in previous]
+        )
+    conn.executemany(
+        INSERT_MESSAGE_SQL.format(table=table),
+        [(message_id, author_id, encode_content(content), channel_id)
+         for message_id, author_id, content, channel_id in rows]
+    )
+    conn.executemany(
+        INSERT_FTS_SQL.format(table=table),
+        [(message_id, content, str(author_id), str(channel_id)) for message_id, author_id, content, channel_id in rows]
+    )
+
+
+def list_partitions(conn: Optional[sqlite3.Connection] = None) -> list[str]:
+    """Lista las particiones existentes, de la más antigua a la más reciente."""
+    conn = conn or get_read_connection()
+    return sorted(row[0] for row in conn.execute(LIST_PARTITIONS_SQL))
+
+
+def _table_exists(conn: sqlite3.Connection, table: str) -> bool:
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    return row is not None
+
+
+_dictionaries: dict[int, bytes] = {}
+_current_dict_id = 0
+
+
+def _load_dictionaries(conn: sqlite3.Connection) -> None:
+    global _current_dict_id
+    for row in conn.execute("SELECT id, data FROM diccionarios"):
+        _dictionaries[row[0]] = bytes(row[1])
+    _current_dict_id = max(_dictionaries, default=0)
+
+
+def encode_content(content: str):
+    """
+    Prepara el contenido de un mensaje para guardarlo.
+
+    Returns:
+        str si el mensaje es corto o no se comprime bien, bytes comprimidos en otro caso
+    """
+    raw = content.encode("utf-8")
+    if len(raw) < DB_COMPRESS_MIN_BYTES:
+        return content
+
+    dict_id = _current_dict_id
+    zdict = _dictionaries.get(dict_id)
+    if zdict:
+        compressor = zlib.compressobj(DB_COMPRESS_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=zdict)
+    else:
+        compressor = zlib.compressobj(DB_COMPRESS_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    packed = compressor.compress(raw) + compressor.flush()
+
+    if len(packed) + _COMPRESSED_HEADER.size >= len(raw):
+        return content
+    return _COMPRESSED_HEADER.pack(dict_id) + packed
+
+
+def decode_content(value) -> str:
+    """Inversa de encode_content: descomprime si el valor guardado es un BLOB."""
+    if not isinstance(value, bytes):
+        return value
+
+    dict_id, = _COMPRESSED_HEADER.unpack_from(value)
+    zdict = _dictionaries.get(dict_id)
+    if dict_id and zdict is None:
+        raise ValueError(f"Diccionario de compresión {dict_id} no encontrado")
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS, zdict=zdict) if zdict else zlib.decompressobj(-zlib.MAX_WBITS)
+    raw = decompressor.decompress(value[_COMPRESSED_HEADER.size:]) + decompressor.flush()
+    return raw.decode("utf-8")
+
+
+_DELTA_COPY = 0
+_DELTA_INSERT = 1
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode_delta(source: str, target: str) -> bytes:
+    """
+    Codifica target como una lista de copias de source e inserciones literales.
+
+    Se recortan primero el prefijo y el sufijo comunes, así que una edición
+    típica (corregir una palabra) cuesta unos pocos bytes y el diff solo se
+    calcula sobre la zona que cambió.
+    """
+    src, dst = source.encode("utf-8"), target.encode("utf-8")
+    prefix = 0
+    limit = min(len(src), len(dst))
+    while prefix < limit and src[prefix] == dst[prefix]:
+        prefix += 1
+    suffix = 0
+    limit -= prefix
+    while suffix < limit and src[-1 - suffix] == dst[-1 - suffix]:
+        suffix += 1
+
+    ops = [(_DELTA_COPY, 0, prefix)] if prefix else []
+    src_mid, dst_mid = src[prefix:len(src) - suffix], dst[prefix:len(dst) - suffix]
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, src_mid, dst_mid).get_opcodes():
+        if tag == "equal":
+            ops.append((_DELTA_COPY, prefix + i1, i2 - i1))
+        elif j2 > j1:
+            ops.append((_DELTA_INSERT, j1, j2 - j1))
+    if suffix:
+        ops.append((_DELTA_COPY, len(src) - suffix, suffix))
+
+    out = bytearray()
+    for op, start, length in ops:
+        out.append(op)
+        if op == _DELTA_COPY:
+            _write_varint(out, start)
+            _write_varint(out, length)
+        else:
+            _write_varint(out, length)
+            out += dst_mid[start:start + length]
+    return bytes(out)
+
+
+def apply_delta(source: str, delta: bytes) -> str:
+    """Inversa de encode_delta: reconstruye target a partir de source y el delta."""
+    src = source.encode("utf-8")
+    out = bytearray()
+    pos = 0
+    while pos < len(delta):
+        op = delta[pos]
+        pos += 1
+        if op == _DELTA_COPY:
+            start, pos = _read_varint(delta, pos)
+            length, pos = _read_varint(delta, pos)
+            out += src[start:start + length]
+        elif op == _DELTA_INSERT:
+            length, pos = _read_varint(delta, pos)
+            out += delta[pos:pos + length]
+            pos += length
+        else:
+            raise ValueError(f"Operación de delta desconocida: {op}")
+    return out.decode("utf-8")
+
+
+def train_dictionary(sample_size: int = 5000) -> Optional[int]:
+    """
+    Entrena un diccionario de compresión con los mensajes más recientes.
+
+    Se quedan los fragmentos (palabra + separador) que más bytes ahorrarían,
+    con los más valiosos al final, que es donde deflate los alcanza más barato.
+    Solo afecta a los mensajes guardados a partir de ahora.
+
+    Args:
+        sample_size: Número de mensajes recientes a analizar
+
+    Returns:
+        int | None: ID del nuevo diccionario, o None si no hay muestras suficientes
+    """
+    global _current_dict_id
+    conn = get_read_connection()
+    samples = []
+    for table in reversed(list_partitions(conn)):
+        rows = conn.execute(
+            f"SELECT content FROM {table} ORDER BY message_id DESC LIMIT ?", (sample_size - len(samples),)
+        ).fetchall()
+        samples.extend(decode_content(row[0]) for row in rows if row[0])
+        if len(samples) >= sample_size:
+            break
+
+    if len(samples) < DICT_MIN_SAMPLES:
+        logger.info(f"Muestras insuficientes para entrenar diccionario ({len(samples)})")
+        return None
+
+    counts = Counter()
+    for text in samples:
+        counts.update(set(_DICT_TOKEN_RE.findall(text)))
+
+    budget = DB_DICT_SIZE_KB * 1024
+    chosen = []
+    for token, count in sorted(counts.items(), key=lambda item: item[1] * len(item[0]), reverse=True):
+        if count < 2:
+            break
+        encoded = token.encode("utf-8")
+        if len(encoded) > budget:
+            continue
+        chosen.append(encoded)
+        budget -= len(encoded)
+        if budget <= 0:
+            break
+
+    if not chosen:
+        return None
+
+    data = b"".join(reversed(chosen))
+    with get_db_connection() as write_conn:
+        cursor = write_conn.execute("INSERT INTO diccionarios (data) VALUES (?)", (data,))
+        dict_id = cursor.lastrowid
+    _dictionaries[dict_id] = data
+    _current_dict_id = dict_id
+    logger.info(f"Diccionario de compresión {dict_id} entrenado ({len(data)} bytes, {len(samples)} muestras)")
+    return dict_id
+
+
+def compress_existing_messages(batch_size: int = 5000) -> int:
+    """
+    Comprime los mensajes guardados como TEXT que superan el umbral de compresión.
+
+    Returns:
+        int: Número de mensajes comprimidos.
+    """
+    compressed = 0
+    bytes_before = 0
+    bytes_after = 0
+    start = time.perf_counter()
+    for table in list_partitions():
+        last_id = 0
+        while True:
+            rows = get_read_connection().execute(
+                f"SELECT message_id, content FROM {table} "
+                "WHERE message_id > ? AND typeof(content) = 'text' ORDER BY message_id LIMIT ?",
+                (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            updates = []
+            for message_id, content in rows:
+                encoded = encode_content(content)
+                if isinstance(encoded, bytes):
+                    updates.append((encoded, message_id))
+                    bytes_before += len(content.encode("utf-8"))
+                    bytes_after += len(encoded)
+            if updates:
+                with get_db_connection() as conn:
+                    conn.executemany(f"UPDATE {table} SET content = ? WHERE message_id = ?", updates)
+                compressed += len(updates)
+
+    ratio = (bytes_after / bytes_before * 100) if bytes_before else 100
+    logger.info(
+        f"Comprimidos {compressed} mensajes: {bytes_before} -> {bytes_after} bytes ({ratio:.1f}%) "
+        f"en {time.perf_counter() - start:.2f}s"
+    )
+    return compressed
+
+
+def _migrate_legacy_table(conn: sqlite3.Connection) -> None:
+    """Reparte la tabla mensajes original en particiones y elimina sus índices redundantes."""
+    if not _table_exists(conn, LEGACY_TABLE):
+        return
+
+    moved = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            f"SELECT id, message_id, author_id, content, channel_id, created_at FROM {LEGACY_TABLE} "
+            "WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, MIGRATION_CHUNK_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+
+        by_partition = defaultdict(list)
+        for row in rows:
+            by_partition[partition_for_message(row[1])].append(tuple(row[1:]))
+        for table, chunk in by_partition.items():
+            _ensure_partition(conn, table)
+            conn.executemany(
+                f"INSERT OR IGNORE INTO {table} (message_id, author_id, content, channel_id, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                chunk
+            )
+
+        moved += len(rows)
+        last_id = rows[-1][0]
+
+    conn.execute(f"DROP TABLE {LEGACY_TABLE}")
+    logger.info(f"Migrados {moved} mensajes de la tabla sin particionar")
+
+
+def _backfill_fts(conn: sqlite3.Connection) -> None:
+    """Crea y rellena el índice FTS de las particiones existentes."""
+    # init_db carga los diccionarios después de las migraciones, pero aquí ya hay que descomprimir
+    _load_dictionaries(conn)
+    for table in list_partitions(conn):
+        conn.execute(CREATE_FTS_SQL.format(table=table))
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                f"SELECT message_id, author_id, content, channel_id FROM {table} "
+                "WHERE message_id > ? ORDER BY message_id LIMIT ?",
+                (last_id, MIGRATION_CHUNK_SIZE)
+            ).fetchall()
+            if not rows:
+                break
+            conn.executemany(
+                INSERT_FTS_SQL.format(table=table),
+                [(row[0], decode_content(row[2]), str(row[1]), str(row[3])) for row in rows]
+            )
+            last_id = rows[-1][0]
+
+
+def _create_revision_tables(conn: sqlite3.Connection) -> None:
+    for table in list_partitions(conn):
+        conn.execute(CREATE_REVISION_SQL.format(table=table))
+
+
+def _infer_partition_days(start_days: list[int]) -> int:
+    """Ancho con el que se crearon unas particiones: divide a todos sus inicios y no supera el hueco menor entre ellas."""
+    gaps = [b - a for a, b in zip(start_days, start_days[1:])]
+    common = math.gcd(*start_days, *gaps)
+    # Con una sola partición no hay huecos: se asume como mucho un mes
+    limit = min(gaps) if gaps else 31
+    return max(d for d in range(1, min(common, limit) + 1) if common % d == 0)
+
+
+def _store_partition_days(conn: sqlite3.Connection) -> None:
+    conn.execute(CREATE_SETTINGS_SQL)
+    days = DB_PARTITION_DAYS
+    start_days = [_partition_day(table) for table in list_partitions(conn)]
+    if any(day % days for day in start_days):
+        # Las particiones existentes se crearon con otro valor de DB_PARTITION_DAYS
+        days = _infer_partition_days(start_days)
+        logger.warning(f"⚠️ Las particiones existentes no son de {DB_PARTITION_DAYS} días, se usarán {days}")
+    conn.execute("INSERT OR IGNORE INTO ajustes (clave, valor) VALUES ('partition_days', ?)", (str(days),))
+
+
+def _load_partition_days(conn: sqlite3.Connection) -> None:
+    global _partition_days
+    row = conn.execute("SELECT valor FROM ajustes WHERE clave = 'partition_days'").fetchone()
+    _partition_days = int(row[0])
+    if _partition_days != DB_PARTITION_DAYS:
+        logger.warning(
+            f"⚠️ DB_PARTITION_DAYS ({DB_PARTITION_DAYS}) no coincide con el de la base de datos, "
+            f"se mantienen particiones de {_partition_days} días"
+        )
+
+
+# (versión, descripción, función). La versión aplicada se guarda en PRAGMA user_version.
+MIGRATIONS = (
+    (1, "Repartir la tabla mensajes en particiones por message_id", _migrate_legacy_table),
+    (2, "Crear la tabla de diccionarios de compresión", lambda conn: conn.execute(CREATE_DICTIONARY_TABLE_SQL)),
+    (3, "Crear el índice de texto completo de los mensajes", _backfill_fts),
+    (4, "Crear las tablas de revisiones de mensajes editados", _create_revision_tables),
+    (5, "Crear la caché de búsquedas de música", lambda conn: conn.execute(CREATE_SEARCH_CACHE_SQL)),
+    (6, "Crear el contador de reproducciones del cache de audio", lambda conn: conn.execute(CREATE_AUDIO_PLAYS_SQL)),
+    (7, "Guardar el ancho de las particiones", _store_partition_days),
+)
+
+
+def run_migrations() -> int:
+    """
+    Aplica en orden las migraciones pendientes, cada una en su propia transacción.
+
+    Returns:
+        int: Versión del esquema tras aplicar las migraciones.
+    """
+    with get_db_connection() as conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+
+    for target, description, migrate in MIGRATIONS:
+        if target <= version:
+            continue
+        logger.info(f"Aplicando migración {target}: {description}")
+        start = time.perf_counter()
+        with get_db_connection() as conn:
+            migrate(conn)
+            conn.execute(f"PRAGMA user_version = {target}")
+        version = target
+        logger.info(f"Migración {target} completada en {time.perf_counter() - start:.2f}s")
+
+    return version
 
 
 def init_db():
-    """Inicializa la base de datos y crea las tablas necesarias."""
+    """Inicializa la base de datos, aplica migraciones y crea las tablas necesarias."""
     try:
+        run_migrations()
         with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(CREATE_TABLE_SQL)
-            cursor.execute(CREATE_INDEX_SQL)
-        logger.info("Base de datos inicializada correctamente")
+            _load_partition_days(conn)
+            _ensure_partition(conn, partition_for_timestamp(int(time.time() * 1000)))
+            partitions = list_partitions(conn)
+            _load_dictionaries(conn)
+        logger.info(f"Base de datos inicializada correctamente ({len(partitions)} particiones)")
+        if not _dictionaries:
+            train_dictionary()
     except Exception as e:
         logger.error(f"Error al inicializar la base de datos: {e}")
         raise
@@ -59,12 +672,10 @@ def save_message(message_id: int, author_id: int, content: str, channel_id: int)
         bool: True si se guardó correctamente, False en caso contrario.
     """
     try:
+        table = partition_for_message(message_id)
         with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT OR REPLACE INTO mensajes (message_id, author_id, content, channel_id) VALUES (?, ?, ?, ?)",
-                (message_id, author_id, content, channel_id)
-            )
+            _ensure_partition(conn, table)
+            _insert_messages(conn, table, [(message_id, author_id, content, channel_id)])
         return True
     except Exception as e:
         logger.error(f"Error al guardar mensaje {message_id}: {e}")
@@ -75,53 +686,615 @@ def get_message(message_id: int) -> Optional[dict]:
     """
     Recupera un mensaje de la base de datos.
 
+    La partición se deduce del propio message_id, así que la búsqueda toca una
+    sola tabla.
+
     Returns:
         dict | None: Diccionario con los datos del mensaje o None si no existe.
     """
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT message_id, author_id, content, channel_id, created_at FROM mensajes WHERE message_id = ?",
-                (message_id,)
-            )
-            row = cursor.fetchone()
-
-            if not row:
-                return None
-
-            return {
-                "message_id": row[0],
-                "author_id": row[1],
-                "content": row[2],
-                "channel_id": row[3],
-                "created_at": row[4]
-            }
+        conn = get_read_connection()
+        row = None
+        try:
+            row = conn.execute(
+                SELECT_MESSAGE_SQL.format(table=partition_for_message(message_id)), (message_id,)
+            ).fetchone()
+        except sqlite3.OperationalError:
+            # La partición aún no existe
+            row = None
+
+        if not row:
+            return None
+
+        return {
+            "message_id": row[0],
+            "author_id": row[1],
+            "content": decode_content(row[2]),
+            "channel_id": row[3],
+            "created_at": row[4]
+        }
     except Exception as e:
         logger.error(f"Error al recuperar mensaje {message_id}: {e}")
         return None
 
 
+def get_messages(message_ids) -> dict[int, dict]:
+    """
+    Recupera varios mensajes con una consulta IN por partición.
+
+    Args:
+        message_ids: Colección de IDs de mensaje
+
+    Returns:
+        Diccionario message_id -> datos del mensaje, solo con los encontrados
+    """
+    by_partition = defaultdict(list)
+    for message_id in message_ids:
+        by_partition[partition_for_message(message_id)].append(message_id)
+
+    found = {}
+    conn = get_read_connection()
+    for table, ids in by_partition.items():
+        # Trocear por debajo del límite de parámetros de SQLite
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            try:
+                rows = conn.execute(
+                    f"SELECT message_id, author_id, content, channel_id, created_at FROM {table} "
+                    f"WHERE message_id IN ({placeholders})",
+                    chunk
+                ).fetchall()
+            except sqlite3.OperationalError:
+                # La partición no existe
+                break
+            except Exception as e:
+                logger.error(f"Error al recuperar {len(chunk)} mensajes de {table}: {e}")
+                continue
+
+            for row in rows:
+                try:
+                    content = decode_content(row[2])
+                except Exception as e:
+                    logger.error(f"Error al descomprimir mensaje {row[0]}: {e}")
+                    continue
+                found[row[0]] = {
+                    "message_id": row[0],
+                    "author_id": row[1],
+                    "content": content,
+                    "channel_id": row[3],
+                    "created_at": row[4]
+                }
+    return found
+
+
+def _apply_revision(conn: sqlite3.Connection, table: str, message_id: int, content: str, edited_at: int) -> bool:
+    """Guarda la versión anterior como delta y deja la nueva en la partición y en el índice FTS."""
+    row = conn.execute(f"SELECT author_id, content, channel_id FROM {table} WHERE message_id = ?",
+                       (message_id,)).fetchone()
+    if row is None:
+        return False
+    previous = decode_content(row[1])
+    if previous == content:
+        return False
+
+    revision = conn.execute(
+        f"SELECT COALESCE(MAX(revision), 0) + 1 FROM {table}{REVISION_SUFFIX} WHERE message_id = ?", (message_id,)
+    ).fetchone()[0]
+    conn.execute(
+        f"INSERT INTO {table}{REVISION_SUFFIX} (message_id, revision, delta, edited_at) VALUES (?, ?, ?, ?)",
+        (message_id, revision, encode_delta(content, previous), edited_at)
+    )
+    conn.execute(f"UPDATE {table} SET content = ? WHERE message_id = ?", (encode_content(content), message_id))
+    author, channel = str(row[0]), str(row[2])
+    conn.execute(DELETE_FTS_SQL.format(table=table), (message_id, previous, author, channel))
+    conn.execute(INSERT_FTS_SQL.format(table=table), (message_id, content, author, channel))
+    return True
+
+
+def get_message_history(message_id: int) -> list[dict]:
+    """
+    Reconstruye todas las versiones de un mensaje editado.
+
+    Returns:
+        Lista de dicts con content y edited_at (None en la versión original),
+        de la más antigua a la más reciente. Vacía si el mensaje no existe.
+    """
+    table = partition_for_message(message_id)
+    try:
+        conn = get_read_connection()
+        row = conn.execute(f"SELECT content FROM {table} WHERE message_id = ?", (message_id,)).fetchone()
+        if not row:
+            return []
+        revisions = conn.execute(
+            f"SELECT delta, edited_at FROM {table}{REVISION_SUFFIX} WHERE message_id = ? ORDER BY revision DESC",
+            (message_id,)
+        ).fetchall()
+    except sqlite3.OperationalError:
+        # La partición aún no existe
+        return []
+    except Exception as e:
+        logger.error(f"Error al recuperar el historial del mensaje {message_id}: {e}")
+        return []
+
+    content = decode_content(row[0])
+    history = []
+    for delta, edited_at in revisions:
+        history.append({"content": content, "edited_at": edited_at})
+        content = apply_delta(content, delta)
+    history.append({"content": content, "edited_at": None})
+    history.reverse()
+    return history
+
+
+def _fts_query(text: Optional[str], author_id: Optional[int], channel_id: Optional[int]) -> Optional[str]:
+    # Cada término va entre comillas para que la sintaxis de FTS5 del usuario no rompa la consulta
+    terms = [f'"{term.replace(chr(34), chr(34) * 2)}"' for term in (text or "").split()]
+    if author_id:
+        terms.append(f'author:"{author_id}"')
+    if channel_id:
+        terms.append(f'channel:"{channel_id}"')
+    return " ".join(terms) or None
+
+
+def _snowflake_floor(timestamp_ms: int) -> int:
+    return max(0, timestamp_ms - DISCORD_EPOCH_MS) << 22
+
+
+def iter_messages(
+        text: Optional[str] = None,
+        author_id: Optional[int] = None,
+        channel_id: Optional[int] = None,
+        since_ms: Optional[int] = None,
+        until_ms: Optional[int] = None,
+        before_id: Optional[int] = None,
+        page_size: int = 500,
+        channel_ids: Optional[Iterable[int]] = None
+):
+    """
+    Recorre los mensajes que cumplen los filtros, del más reciente al más antiguo.
+
+    Usa el índice FTS de cada partición y salta las particiones fuera del
+    rango de fechas. Los resultados se leen por páginas, así que se puede
+    cortar la iteración en cualquier momento sin haber leído todo.
+
+    Args:
+        text: Palabras que debe contener el mensaje
+        author_id: Filtrar por autor
+        channel_id: Filtrar por canal
+        since_ms: Marca de tiempo Unix (ms) mínima
+        until_ms: Marca de tiempo Unix (ms) máxima
+        before_id: Solo mensajes con message_id menor (cursor de paginación)
+        page_size: Filas por consulta
+        channel_ids: Solo mensajes de estos canales (los visibles para quien consulta); None = todos
+
+    Yields:
+        dict con message_id, author_id, content, channel_id y created_at
+    """
+    match = _fts_query(text, author_id, channel_id)
+    low = _snowflake_floor(since_ms) if since_ms else 0
+    high = _snowflake_floor(until_ms + 1) - 1 if until_ms else (1 << 63) - 1
+    if before_id is not None:
+        high = min(high, before_id - 1)
+
+    # El filtro de canales va en la consulta para que cada página sea de resultados visibles. La lista
+    # viaja como un único parámetro JSON: puede tener miles de canales, y la conexión de lectura no
+    # puede crear tablas temporales (query_only)
+    visible, params = "", ()
+    if channel_ids is not None:
+        channel_ids = list(channel_ids)
+        if not channel_ids:
+            return
+        visible, params = " AND m.channel_id IN (SELECT value FROM json_each(?))", (json.dumps(channel_ids),)
+
+    conn = get_read_connection()
+    for table in reversed(list_partitions(conn)):
+        start_day = _partition_day(table)
+        if (start_day + _partition_days) * MS_PER_DAY <= (low >> 22) + DISCORD_EPOCH_MS:
+            break
+        if start_day * MS_PER_DAY > (high >> 22) + DISCORD_EPOCH_MS:
+            continue
+
+        cursor_high = high
+        while True:
+            if match:
+                rows = conn.execute(
+                    f"SELECT m.message_id, m.author_id, m.content, m.channel_id, m.created_at "
+                    f"FROM {table}{FTS_SUFFIX} f JOIN {table} m ON m.message_id = f.rowid "
+                    f"WHERE {table}{FTS_SUFFIX} MATCH ? AND f.rowid BETWEEN ? AND ?{visible} "
+                    "ORDER BY f.rowid DESC LIMIT ?",
+                    (match, low, cursor_high, *params, page_size)
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    f"SELECT m.message_id, m.author_id, m.content, m.channel_id, m.created_at FROM {table} m "
+                    f"WHERE m.message_id BETWEEN ? AND ?{visible} ORDER BY m.message_id DESC LIMIT ?",
+                    (low, cursor_high, *params, page_size)
+                ).fetchall()
+
+            for row in rows:
+                yield {
+                    "message_id": row[0],
+                    "author_id": row[1],
+                    "content": decode_content(row[2]),
+                    "channel_id": row[3],
+                    "created_at": row[4]
+                }
+            if len(rows) < page_size:
+                break
+            cursor_high = rows[-1][0] - 1
+
+
+def search_messages(limit: int = 10, **filters) -> list[dict]:
+    """
+    Devuelve una página de resultados de iter_messages.
+
+    Args:
+        limit: Número máximo de resultados
+        **filters: Filtros de iter_messages (text, author_id, channel_id, channel_ids, since_ms, until_ms, before_id)
+
+    Returns:
+        Lista de mensajes, del más reciente al más antiguo
+    """
+    try:
+        results = []
+        for message in iter_messages(page_size=limit, **filters):
+            results.append(message)
+            if len(results) >= limit:
+                break
+        return results
+    except Exception as e:
+        logger.error(f"Error al buscar mensajes: {e}")
+        return []
+
+
+def get_search_result(query: str) -> Optional[tuple[bytes, int]]:
+    """
+    Recupera una búsqueda guardada.
+
+    Returns:
+        Tupla (results, expires_at) o None si no está guardada
+    """
+    try:
+        row = get_read_connection().execute(
+            "SELECT results, expires_at FROM busquedas WHERE query = ?", (query,)
+        ).fetchone()
+        return (bytes(row[0]), row[1]) if row else None
+    except Exception as e:
+        logger.error(f"Error al recuperar búsqueda guardada: {e}")
+        return None
+
+
+def save_search_result(query: str, results: bytes, expires_at: int) -> bool:
+    """Guarda (o reemplaza) el resultado de una búsqueda hasta expires_at (Unix, segundos)."""
+    try:
+        with get_db_connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO busquedas (query, results, expires_at) VALUES (?, ?, ?)",
+                         (query, results, expires_at))
+        return True
+    except Exception as e:
+        logger.error(f"Error al guardar búsqueda: {e}")
+        return False
+
+
+def purge_search_results() -> int:
+    """Elimina las búsquedas caducadas y devuelve cuántas se borraron."""
+    try:
+        with get_db_connection() as conn:
+            return conn.execute("DELETE FROM busquedas WHERE expires_at <= ?", (int(time.time()),)).rowcount
+    except Exception as e:
+        logger.error(f"Error al purgar búsquedas caducadas: {e}")
+        return 0
+
+
+def get_play_counts() -> dict[str, int]:
+    """Devuelve las reproducciones guardadas de cada vídeo."""
+    try:
+        return dict(get_read_connection().execute("SELECT video_id, plays FROM reproducciones").fetchall())
+    except Exception as e:
+        logger.error(f"Error al leer las reproducciones: {e}")
+        return {}
+
+
+def record_play(video_id: str) -> bool:
+    """Suma una reproducción a un vídeo."""
+    try:
+        with get_db_connection() as conn:
+            conn.execute(
+                "INSERT INTO reproducciones (video_id, plays, last_played) VALUES (?, 1, ?) "
+                "ON CONFLICT(video_id) DO UPDATE SET plays = plays + 1, last_played = excluded.last_played",
+                (video_id, int(time.time()))
+            )
+        return True
+    except Exception as e:
+        logger.error(f"Error al guardar reproducción: {e}")
+        return False
+
+
 def delete_old_messages(days: int = 30) -> int:
     """
     Elimina mensajes antiguos de la base de datos.
 
+    Se borran particiones completas con DROP TABLE, por lo que nunca se
+    recorren filas. Una partición se elimina cuando todo su periodo queda
+    fuera de la retención, así que se conservan hasta `days` más el ancho de una partición.
+
     Args:
         days: Número de días a mantener.
 
     Returns:
-        int: Número de mensajes eliminados.
+        int: Número de particiones eliminadas.
     """
+    cutoff_day = int(time.time() * 1000) // MS_PER_DAY - days
+    dropped = 0
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "DELETE FROM mensajes WHERE created_at < datetime('now', ? || ' days')",
-                (f'-{days}',)
-            )
-            deleted_count = cursor.rowcount
-        logger.info(f"Eliminados {deleted_count} mensajes antiguos")
-        return deleted_count
+        for table in list_partitions():
+            if _partition_day(table) + _partition_days > cutoff_day:
+                break
+            with get_db_connection() as conn:
+                conn.execute(f"DROP TABLE IF EXISTS {table}{REVISION_SUFFIX}")
+                conn.execute(f"DROP TABLE IF EXISTS {table}{FTS_SUFFIX}")
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+            dropped += 1
+            logger.info(f"Partición {table} eliminada por retención")
+
+        logger.info(f"Retención aplicada: {dropped} particiones eliminadas")
+        return dropped
     except Exception as e:
         logger.error(f"Error al eliminar mensajes antiguos: {e}")
-        return 0
\ No newline at end of file
+        return dropped
+
+
+class _Revision(NamedTuple):
+    message_id: int
+    content: str
+    edited_at: int
+
+
+class MessageWriter:
+    """
+    Escritor de mensajes en segundo plano.
+
+    Los mensajes se encolan desde el event loop y un hilo dedicado los guarda
+    con executemany, haciendo un commit cada `batch_size` filas o cada
+    `flush_interval` segundos, lo que ocurra antes. Las ediciones pasan por
+    la misma cola para que nunca se apliquen antes que el mensaje original.
+    """
+
+    _STOP = object()
+
+    def __init__(self, batch_size: int, flush_interval: float, max_queue: int):
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._thread: Optional[threading.Thread] = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,
+            "revisions": 0,
+            "failed": 0,
+            "rejected": 0,
+            "batches": 0,
+            "retried_batches": 0,
+            "last_commit_ms": 0.0,
+            "max_commit_ms": 0.0,
+            "total_commit_ms": 0.0,
+        }
+
+    def start(self) -> None:
+        """Arranca el hilo escritor si no está ya en marcha."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+        logger.info("Escritor de mensajes iniciado")
+
+    def submit(
+            self,
+            message_id: int,
+            author_id: int,
+            content: str,
+            channel_id: int,
+            block: bool = False,
+            timeout: Optional[float] = None
+    ) -> bool:
+        """
+        Encola un mensaje para guardarlo en el siguiente lote.
+
+        Args:
+            block: Esperar a que haya hueco si la cola está llena
+            timeout: Tiempo máximo de espera cuando block es True
+
+        Returns:
+            bool: True si se encoló, False si la cola está llena.
+        """
+        return self._put((message_id, author_id, content, channel_id), block, timeout)
+
+    def submit_edit(
+            self,
+            message_id: int,
+            content: str,
+            edited_at: int,
+            block: bool = False,
+            timeout: Optional[float] = None
+    ) -> bool:
+        """
+        Encola una edición; se guarda como revisión si el mensaje existe y el contenido cambió.
+
+        Args:
+            edited_at: Marca de tiempo Unix (ms) de la edición
+
+        Returns:
+            bool: True si se encoló, False si la cola está llena.
+        """
+        return self._put(_Revision(message_id, content, edited_at), block, timeout)
+
+    def _put(self, item, block: bool, timeout: Optional[float]) -> bool:
+        try:
+            self._queue.put(item, block=block, timeout=timeout)
+        except queue.Full:
+            if not block:
+                with self._stats_lock:
+                    self._stats["rejected"] += 1
+            return False
+
+        with self._stats_lock:
+            self._stats["enqueued"] += 1
+        return True
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Vacía la cola pendiente en la base de datos y detiene el hilo escritor."""
+        if not self._thread or not self._thread.is_alive():
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"El escritor de mensajes no terminó en {timeout}s, quedan {self._queue.qsize()} pendientes")
+        else:
+            logger.info("Escritor de mensajes detenido, cola vaciada")
+
+    def _run(self) -> None:
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is self._STOP:
+                self._flush(batch)
+                return
+
+            if item is not None:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self._flush_interval
+
+            if batch and (len(batch) >= self._batch_size or time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+                deadline = None
+
+    def _flush(self, batch: list) -> None:
+        if not batch:
+            return
+
+        start = time.perf_counter()
+        failed = 0
+        try:
+            written, revisions = self._write(batch)
+        except Exception as e:
+            # Reintentar una vez (p. ej. "database is locked") y, si vuelve a fallar, fila a fila
+            # para perder solo las filas que fallan y no el lote entero
+            logger.warning(f"Error al guardar lote de {len(batch)} mensajes, reintentando: {e}")
+            try:
+                written, revisions = self._write(batch)
+            except Exception:
+                written = revisions = 0
+                for item in batch:
+                    try:
+                        item_written, item_revisions = self._write([item])
+                    except Exception as item_error:
+                        failed += 1
+                        kind = "la edición del mensaje" if isinstance(item, _Revision) else "el mensaje"
+                        logger.error(f"Error al guardar {kind} {item[0]}, se descarta: {item_error}")
+                        continue
+                    written += item_written
+                    revisions += item_revisions
+            with self._stats_lock:
+                self._stats["retried_batches"] += 1
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._stats_lock:
+            self._stats["written"] += written
+            self._stats["revisions"] += revisions
+            self._stats["failed"] += failed
+            self._stats["batches"] += 1
+            self._stats["last_commit_ms"] = elapsed_ms
+            self._stats["max_commit_ms"] = max(self._stats["max_commit_ms"], elapsed_ms)
+            self._stats["total_commit_ms"] += elapsed_ms
+
+    @staticmethod
+    def _write(batch: list) -> tuple[int, int]:
+        """Guarda un lote en una transacción. Devuelve (mensajes escritos, revisiones creadas)."""
+        by_partition = defaultdict(list)
+        edits = []
+        for item in batch:
+            if isinstance(item, _Revision):
+                edits.append(item)
+            else:
+                by_partition[partition_for_message(item[0])].append(item)
+
+        revisions = 0
+        with get_db_connection() as conn:
+            for table, rows in by_partition.items():
+                _ensure_partition(conn, table)
+                _insert_messages(conn, table, rows)
+            # Después de las inserciones: una edición puede referirse a un mensaje de este mismo lote
+            for edit in edits:
+                table = partition_for_message(edit.message_id)
+                if table in by_partition or _table_exists(conn, table):
+                    revisions += _apply_revision(conn, table, edit.message_id, edit.content, edit.edited_at)
+        return len(batch) - len(edits), revisions
+
+    def get_stats(self) -> dict:
+        """
+        Obtiene estadísticas del escritor.
+
+        Returns:
+            Diccionario con profundidad de cola, filas escritas y latencia de commit
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        total_ms = stats.pop("total_commit_ms")
+        stats["queue_depth"] = self._queue.qsize()
+        stats["avg_commit_ms"] = total_ms / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+
+message_writer = MessageWriter(DB_BATCH_SIZE, DB_FLUSH_INTERVAL_MS / 1000, DB_QUEUE_MAX)
+
+
+def queue_message(message_id: int, author_id: int, content: str, channel_id: int) -> bool:
+    """
+    Encola un mensaje para guardarlo en segundo plano sin bloquear.
+
+    Returns:
+        bool: True si se encoló, False si la cola está llena.
+    """
+    return message_writer.submit(message_id, author_id, content, channel_id)
+
+
+def queue_edit(message_id: int, content: str, edited_at: int) -> bool:
+    """
+    Encola la edición de un mensaje para guardarla en segundo plano sin bloquear.
+
+    Returns:
+        bool: True si se encoló, False si la cola está llena.
+    """
+    return message_writer.submit_edit(message_id, content, edited_at)
+
+
+def get_writer_stats() -> dict:
+    """Obtiene estadísticas del escritor de mensajes en segundo plano."""
+    return message_writer.get_stats()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Mantenimiento de la base de datos de mensajes")
+    parser.add_argument("--train", action="store_true", help="Entrena un nuevo diccionario de compresión")
+    parser.add_argument("--compress", action="store_true", help="Comprime los mensajes ya guardados como texto")
+    args = parser.parse_args()
+
+    init_db()
+    if args.train:
+        train_dictionary()
+    if args.compress:
+        compress_existing_messages()
+    close_db()
\ No newline at end of file
@@ -0,0 +1,311 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+from config import EXTRACTION_MODE, EXTRACTION_WORKERS, EXTRACTION_GUILD_LIMIT
+import ytdl
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0  # Búsquedas de /play: alguien está esperando la respuesta
+PRIORITY_PLAYBACK = 1     # Extracción de la canción que va a sonar ya
+PRIORITY_PREFETCH = 2     # Trabajo adelantado, se puede retrasar o cancelar
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_PLAYBACK, PRIORITY_PREFETCH)
+
+WAIT_SAMPLES = 500
+
+
+class ExtractionCancelled(Exception):
+    """El trabajo se canceló antes de empezar (p. ej. /stop o cambio de la cola)."""
+
+
+def make_executor(mode: str, workers: int) -> Executor:
+    """
+    Crea el pool de extracción.
+
+    Cada worker arranca con sus propias instancias de YoutubeDL
+    (ytdl.warm_worker). En modo process cada worker es un proceso, así que
+    el trabajo de yt-dlp no compite por el GIL con el event loop. Se usa
+    forkserver para no clonar los hilos del bot. Los workers importan de
+    nuevo el script principal: por eso se arranca con main.py, que no
+    carga nada al importarse, y no con bot.py.
+    """
+    if mode != "process":
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="extraction", initializer=ytdl.warm_worker)
+
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["ytdl"])
+    else:
+        context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=ytdl.warm_worker)
+
+
+@dataclass
+class ExtractionJob:
+    fn: Callable
+    args: tuple
+    guild_id: int
+    priority: int
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+    started: bool = False
+
+
+class ExtractionScheduler:
+    """
+    Planificador de las extracciones de yt-dlp sobre un pool propio.
+
+    Los trabajos esperan en una cola por prioridad y, dentro de cada
+    prioridad, por servidor. Los servidores se atienden por turnos y
+    ninguno ocupa más de `per_guild` workers a la vez, así que una playlist
+    larga en un servidor no bloquea las búsquedas de los demás. El pool
+    nunca recibe más trabajos que workers tiene: la cola vive aquí, donde
+    se puede reordenar y cancelar.
+    """
+
+    def __init__(self, workers: int, per_guild: int, executor_factory: Optional[Callable[[], Executor]] = None):
+        self.workers = max(1, workers)
+        self.per_guild = max(1, per_guild)
+        self._executor_factory = executor_factory or (lambda: make_executor("thread", self.workers))
+        self._executor = self._executor_factory()
+        self._pending: dict[int, OrderedDict[int, deque[ExtractionJob]]] = {p: OrderedDict() for p in PRIORITIES}
+        self._queued = 0
+        self._running = 0
+        self._running_by_guild: dict[int, int] = {}
+        self._wait_samples: deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self.stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "timed_out": 0,
+            "pool_restarts": 0,
+            "max_queue_depth": 0,
+            "total_run_ms": 0.0,
+        }
+
+    def submit(self, fn: Callable, *args, guild_id: int = 0, priority: int = PRIORITY_INTERACTIVE) -> ExtractionJob:
+        """
+        Encola fn(*args) sin esperar; el resultado se recoge con wait().
+
+        Args:
+            guild_id: Servidor que pide el trabajo (para el reparto por turnos y el límite por servidor)
+            priority: PRIORITY_INTERACTIVE, PRIORITY_PLAYBACK o PRIORITY_PREFETCH
+
+        Returns:
+            El trabajo, para wait() y promote()
+        """
+        job = ExtractionJob(fn, args, guild_id, priority, asyncio.get_running_loop().create_future())
+        self._pending[priority].setdefault(guild_id, deque()).append(job)
+        self._queued += 1
+        self.stats["submitted"] += 1
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self._queued)
+        self._pump()
+        return job
+
+    async def wait(self, job: ExtractionJob, timeout: Optional[float] = None) -> Any:
+        """
+        Espera el resultado de un trabajo encolado con submit().
+
+        Args:
+            timeout: Plazo en segundos, contando la espera en cola que quede
+
+        Raises:
+            asyncio.TimeoutError: Si vence el plazo
+            ExtractionCancelled: Si el trabajo se canceló antes de empezar
+        """
+        try:
+            # shield: si quien espera se cancela, el trabajo en curso no se puede interrumpir
+            return await asyncio.wait_for(asyncio.shield(job.future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if not job.future.done():
+                job.future.cancel()
+                self._discard(job)
+            self.stats["timed_out" if isinstance(e, asyncio.TimeoutError) else "cancelled"] += 1
+            raise
+
+    async def run(self, fn: Callable, *args, guild_id: int = 0, priority: int = PRIORITY_INTERACTIVE,
+                  timeout: Optional[float] = None) -> Any:
+        """
+        Ejecuta fn(*args) en el pool y espera su resultado.
+
+        Args:
+            guild_id: Servidor que pide el trabajo (para el reparto por turnos y el límite por servidor)
+            priority: PRIORITY_INTERACTIVE, PRIORITY_PLAYBACK o PRIORITY_PREFETCH
+            timeout: Plazo total en segundos, contando la espera en cola
+
+        Raises:
+            asyncio.TimeoutError: Si vence el plazo
+            ExtractionCancelled: Si el trabajo se canceló antes de empezar
+        """
+        job = self.submit(fn, *args, guild_id=guild_id, priority=priority)
+        return await self.wait(job, timeout)
+
+    def promote(self, job: ExtractionJob, priority: int) -> bool:
+        """
+        Sube un trabajo pendiente a `priority` (los demás trabajos del servidor no se mueven).
+
+        Returns:
+            True si el trabajo seguía en cola con menor prioridad y se ha movido
+        """
+        if job.started or job.future.done() or priority >= job.priority:
+            return False
+        self._discard(job)
+        job.priority = priority
+        # Al final de su servidor: no se cuela delante de trabajos que ya tenían esta prioridad
+        self._pending[priority].setdefault(job.guild_id, deque()).append(job)
+        self._queued += 1
+        self._pump()
+        return True
+
+    def cancel_guild(self, guild_id: int, priority: Optional[int] = None) -> int:
+        """
+        Cancela los trabajos pendientes de un servidor (los que ya están en un worker terminan igualmente).
+
+        Args:
+            priority: Cancelar solo los de esta prioridad; None = todos
+
+        Returns:
+            Número de trabajos cancelados
+        """
+        cancelled = 0
+        for p in ([priority] if priority is not None else PRIORITIES):
+            for job in self._pending[p].pop(guild_id, ()):
+                self._queued -= 1
+                if not job.future.done():
+                    job.future.set_exception(ExtractionCancelled())
+                    cancelled += 1
+        self.stats["cancelled"] += cancelled
+        return cancelled
+
+    def _discard(self, job: ExtractionJob) -> None:
+        guilds = self._pending[job.priority]
+        jobs = guilds.get(job.guild_id)
+        if jobs and job in jobs:
+            jobs.remove(job)
+            self._queued -= 1
+            if not jobs:
+                del guilds[job.guild_id]
+
+    def _next_job(self) -> Optional[ExtractionJob]:
+        for priority in PRIORITIES:
+            guilds = self._pending[priority]
+            for guild_id in list(guilds):
+                if self._running_by_guild.get(guild_id, 0) >= self.per_guild:
+                    continue
+                jobs = guilds[guild_id]
+                job = jobs.popleft()
+                self._queued -= 1
+                if jobs:
+                    # Turno rotatorio: el servidor pasa al final
+                    guilds.move_to_end(guild_id)
+                else:
+                    del guilds[guild_id]
+                return job
+        return None
+
+    def _pump(self) -> None:
+        while self._running < self.workers:
+            job = self._next_job()
+            if job is None:
+                return
+            if job.future.done():
+                continue
+            self._start(job)
+
+    def _start(self, job: ExtractionJob) -> None:
+        job.started = True
+        self._running += 1
+        self._running_by_guild[job.guild_id] = self._running_by_guild.get(job.guild_id, 0) + 1
+        started_at = time.monotonic()
+        self._wait_samples.append((started_at - job.enqueued_at) * 1000)
+
+        try:
+            submitted = self._executor.submit(job.fn, *job.args)
+        except BrokenExecutor:
+            self._restart_pool()
+            submitted = self._executor.submit(job.fn, *job.args)
+        executor = self._executor
+        future = asyncio.wrap_future(submitted)
+        future.add_done_callback(lambda f: self._finish(job, f, started_at, executor))
+
+    def _finish(self, job: ExtractionJob, future: asyncio.Future, started_at: float, executor: Executor) -> None:
+        self._running -= 1
+        remaining = self._running_by_guild[job.guild_id] - 1
+        if remaining:
+            self._running_by_guild[job.guild_id] = remaining
+        else:
+            del self._running_by_guild[job.guild_id]
+        self.stats["total_run_ms"] += (time.monotonic() - started_at) * 1000
+
+        error = future.exception()
+        self.stats["failed" if error else "completed"] += 1
+        if isinstance(error, BrokenExecutor) and executor is self._executor:
+            # Un proceso worker murió (p. ej. sin memoria): el pool entero queda inutilizable
+            self._restart_pool()
+        if not job.future.done():
+            if error:
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(future.result())
+        self._pump()
+
+    def _restart_pool(self) -> None:
+        broken = self._executor
+        self._executor = self._executor_factory()
+        broken.shutdown(wait=False, cancel_futures=True)
+        self.stats["pool_restarts"] += 1
+        logger.warning("Pool de extracción roto, se ha creado uno nuevo")
+
+    def get_stats(self) -> dict:
+        """
+        Obtiene estadísticas del planificador.
+
+        Returns:
+            Diccionario con contadores, ocupación del pool y tiempos de espera en cola (ms)
+        """
+        waits = sorted(self._wait_samples)
+        stats = dict(self.stats)
+        total_run_ms = stats.pop("total_run_ms")
+        finished = stats["completed"] + stats["failed"]
+        stats["mode"] = "process" if isinstance(self._executor, ProcessPoolExecutor) else "thread"
+        stats["workers"] = self.workers
+        stats["running"] = self._running
+        stats["queue_depth"] = self._queued
+        stats["queue_by_priority"] = {p: sum(len(jobs) for jobs in self._pending[p].values()) for p in PRIORITIES}
+        stats["saturation"] = self._running / self.workers
+        stats["wait_avg_ms"] = sum(waits) / len(waits) if waits else 0.0
+        stats["wait_p95_ms"] = waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0
+        stats["wait_max_ms"] = waits[-1] if waits else 0.0
+        stats["run_avg_ms"] = total_run_ms / finished if finished else 0.0
+        if stats["mode"] == "thread":
+            # En modo process cada worker lleva sus propias cuentas
+            stats["ytdl"] = ytdl.get_stats()
+        return stats
+
+    def shutdown(self) -> None:
+        """Cancela lo pendiente y cierra el pool sin esperar a los trabajos en curso."""
+        for guilds in self._pending.values():
+            for jobs in guilds.values():
+                for job in jobs:
+                    if not job.future.done():
+                        job.future.set_exception(ExtractionCancelled())
+            guilds.clear()
+        self._queued = 0
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+extraction_scheduler = ExtractionScheduler(
+    EXTRACTION_WORKERS, EXTRACTION_GUILD_LIMIT,
+    executor_factory=lambda: make_executor(EXTRACTION_MODE, EXTRACTION_WORKERS)
+)
+
+
+def get_extraction_stats() -> dict:
+    """Obtiene estadísticas del planificador de extracciones."""
+    return extraction_scheduler.get_stats()
@@ -0,0 +1,6 @@
+# Punto de entrada del bot: python main.py (python bot.py también acaba aquí).
+# Los workers de EXTRACTION_MODE=process importan de nuevo el script principal; este no carga
+# nada al importarse, así que cada worker solo trae ytdl, config y yt-dlp.
+if __name__ == "__main__":
+    import bot
+    bot.main()
@@ -1,12 +1,19 @@
 import discord
 import asyncio
-import yt_dlp
 import logging
+import itertools
 import random
+import time
 from typing import Optional, Dict, List
 from dataclasses import dataclass
 from collections import deque
-from config import MAX_QUEUE_SIZE, INACTIVITY_TIMEOUT
+from config import (MAX_QUEUE_SIZE, INACTIVITY_TIMEOUT, PREFETCH_COUNT, STREAM_REFRESH_MARGIN, EXTRACTION_TIMEOUT,
+                    OPUS_PASSTHROUGH, AUDIO_CACHE_AHEAD)
+import ytdl
+from search_cache import search_cache, normalize_query
+from stream_cache import stream_cache
+from audio_cache import audio_cache
+from extraction import extraction_scheduler, ExtractionCancelled, PRIORITY_INTERACTIVE, PRIORITY_PLAYBACK, PRIORITY_PREFETCH
 
 logger = logging.getLogger(__name__)
 
@@ -14,35 +21,6 @@ LOOP_OFF = 0
 LOOP_CURRENT = 1
 LOOP_QUEUE = 2
 
-# Opciones para buscar RÁPIDO (Playlists al instante)
-YDL_SEARCH_OPTIONS = {
-    'format': 'bestaudio/best',
-    'noplaylist': False,
-    'playlistmaxentries': 150,
-    'extract_flat': 'in_playlist',
-    'quiet': True,
-    'no_warnings': True,
-    'default_search': 'ytsearch',
-    'source_address': '0.0.0.0',
-    'force_ipv4': True,
-}
-
-# Opciones para extraer el AUDIO REAL (Justo antes de reproducir)
-YDL_EXTRACT_OPTIONS = {
-    'format': 'bestaudio/best',
-    'noplaylist': True,
-    'quiet': True,
-    'no_warnings': True,
-    'source_address': '0.0.0.0',
-    'force_ipv4': True,
-    # TRUCO ANTIBLOQUEO: Evita el error 403 y los fallos de FFmpeg
-    'extractor_args': {
-        'youtube': {
-            'player_client': ['android', 'web']
-        }
-    }
-}
-
 # Opciones robustas para evitar cortes
 FFMPEG_OPTIONS = {
     'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -reconnect_at_eof 1',
@@ -50,6 +28,21 @@ FFMPEG_OPTIONS = {
 }
 
 
+# Huecos de silencio entre canciones (fin de una pista -> inicio de la siguiente)
+GAP_SAMPLES = 200
+_gap_samples: deque[float] = deque(maxlen=GAP_SAMPLES)
+# Tiempo desde /play de una playlist hasta que suena su primera canción
+_first_audio_samples: deque[float] = deque(maxlen=GAP_SAMPLES)
+
+# Tamaños de los trozos en que se pide una playlist: el primero es una sola entrada para que
+# empiece a sonar cuanto antes; después crecen para no repetir demasiadas páginas de la playlist.
+PLAYLIST_CHUNKS = (1, 49, 100, 200, 400)
+# Clave de la entrada final de una playlist guardada a medias en search_cache: el siguiente playlist_item
+_PLAYLIST_NEXT = "next_item"
+_playback_stats = {"tracks": 0, "prefetched": 0, "resolved_on_demand": 0, "opus_passthrough": 0, "pcm_transcode": 0,
+                   "local_file": 0}
+
+
 @dataclass
 class Song:
     title: str
@@ -57,9 +50,14 @@ class Song:
     thumbnail: str
     stream_url: Optional[str] = None
     requester: Optional[discord.Member] = None
+    stream_expires: float = 0.0  # Unix; 0 = sin resolver
+    stream_codec: Optional[str] = None  # acodec del stream según yt-dlp ('opus', 'mp4a.40.2', ...)
 
     def __str__(self): return self.title
 
+    def stream_is_fresh(self, margin: float = 0) -> bool:
+        return bool(self.stream_url) and self.stream_expires - time.time() > margin
+
 
 class MusicPlayer:
     def __init__(self, guild: discord.Guild):
@@ -68,10 +66,17 @@ class MusicPlayer:
         self.current: Optional[Song] = None
         self.loop_mode = LOOP_OFF
         self.inactivity_task: Optional[asyncio.Task] = None
+        self.prefetch_task: Optional[asyncio.Task] = None
+        self._prefetch_wakeup = asyncio.Event()
+        self.track_ended_at: Optional[float] = None
+        self.ingest_tasks: set[asyncio.Task] = set()  # Playlists que se siguen añadiendo a la cola
+        self.requested_at: Optional[float] = None  # Inicio de /play, para medir el tiempo hasta el primer audio
 
     def add_song(self, song: Song) -> bool:
         if len(self.queue) >= MAX_QUEUE_SIZE: return False
         self.queue.append(song)
+        if len(self.queue) <= PREFETCH_COUNT:
+            self.start_prefetch()
         return True
 
     def get_next(self) -> Optional[Song]:
@@ -81,8 +86,7 @@ class MusicPlayer:
             return last_song
 
         if self.loop_mode == LOOP_QUEUE and last_song:
-            # Eliminamos el stream_url viejo porque caduca
-            last_song.stream_url = None
+            # El stream_url se conserva: stream_is_fresh decide si hay que volver a extraerlo
             self.queue.append(last_song)
 
         if self.queue:
@@ -95,9 +99,51 @@ class MusicPlayer:
             temp_list = list(self.queue)
             random.shuffle(temp_list)
             self.queue = deque(temp_list)
+            # Las siguientes canciones han cambiado: descartar el trabajo pendiente y empezar de nuevo
+            self.cancel_prefetch()
+            self.start_prefetch()
 
     def clear_queue(self):
         self.queue.clear()
+        self.cancel_prefetch()
+
+    # --- PREFETCH ---
+    def start_prefetch(self):
+        """Arranca el prefetcher o lo despierta tras un cambio en la cola."""
+        if PREFETCH_COUNT <= 0: return
+        if self.prefetch_task is None or self.prefetch_task.done():
+            self.prefetch_task = asyncio.create_task(self._prefetch_loop())
+        self._prefetch_wakeup.set()
+
+    def cancel_prefetch(self):
+        # Una extracción ya en curso termina en su worker (no se puede interrumpir); las pendientes se descartan
+        if self.prefetch_task:
+            self.prefetch_task.cancel()
+            self.prefetch_task = None
+        extraction_scheduler.cancel_guild(self.guild.id, PRIORITY_PREFETCH)
+        audio_cache.cancel_guild(self.guild.id)
+
+    async def _prefetch_loop(self):
+        """Mantiene resuelto el stream de las próximas PREFETCH_COUNT canciones, renovándolo antes de que caduque."""
+        while True:
+            self._prefetch_wakeup.clear()
+            next_refresh = None
+            upcoming = list(self.queue)[:max(PREFETCH_COUNT, AUDIO_CACHE_AHEAD)]
+            for song in upcoming[:AUDIO_CACHE_AHEAD]:
+                audio_cache.schedule_download(song.webpage_url, self.guild.id)
+            for song in upcoming[:PREFETCH_COUNT]:
+                if audio_cache.contains(song.webpage_url):
+                    continue  # Sonará desde el disco: no hace falta URL
+                await ensure_stream(song, guild_id=self.guild.id, priority=PRIORITY_PREFETCH)
+                if song.stream_url:
+                    refresh_at = song.stream_expires - STREAM_REFRESH_MARGIN
+                    next_refresh = refresh_at if next_refresh is None else min(next_refresh, refresh_at)
+
+            timeout = None if next_refresh is None else max(1.0, next_refresh - time.time())
+            try:
+                await asyncio.wait_for(self._prefetch_wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
 
 
 class MusicManager:
@@ -109,56 +155,192 @@ class MusicManager:
         return self.players[guild.id]
 
     def remove_player(self, guild_id: int):
-        if guild_id in self.players: del self.players[guild_id]
+        if guild_id in self.players:
+            player = self.players.pop(guild_id)
+            player.cancel_prefetch()
+            for task in player.ingest_tasks:
+                task.cancel()
+        extraction_scheduler.cancel_guild(guild_id)
+        audio_cache.cancel_guild(guild_id)
 
 
 music_manager = MusicManager()
 
 
-async def search_youtube(query: str) -> List[Song]:
+async def search_youtube(query: str, guild_id: int = 0) -> List[Song]:
     try:
-        loop = asyncio.get_event_loop()
+        entries = await search_cache.get(query)
+        if entries is None:
+            entries = await extraction_scheduler.run(
+                ytdl.search, query, guild_id=guild_id, priority=PRIORITY_INTERACTIVE, timeout=EXTRACTION_TIMEOUT
+            )
+            await search_cache.put(query, entries)
+        return _songs_from_entries(entries)
+    except Exception as e:
+        logger.error(f"Error en búsqueda plana: {e}")
+        return []
 
-        def extract():
-            with yt_dlp.YoutubeDL(YDL_SEARCH_OPTIONS) as ydl:
-                return ydl.extract_info(query, download=False)
 
-        info = await loop.run_in_executor(None, extract)
-        if not info: return []
+def _songs_from_entries(entries: list[dict]) -> List[Song]:
+    return [Song(title=e['title'], webpage_url=e['webpage_url'], thumbnail=e['thumbnail'],
+                 stream_url=None)  # Se cargará al reproducir
+            for e in entries if e['webpage_url']]
 
-        songs = []
-        entries = info.get('entries', [info])
 
-        for entry in entries:
-            if not entry: continue
+def is_playlist_query(query: str) -> bool:
+    return normalize_query(query).startswith("playlist:")
 
-            webpage_url = entry.get('webpage_url')
-            if not webpage_url:
-                url_field = entry.get('url', '')
-                if 'youtube.com' in url_field or 'youtu.be' in url_field:
-                    webpage_url = url_field
-                else:
-                    webpage_url = f"https://www.youtube.com/watch?v={entry.get('id')}"
 
-            thumbnail = ''
-            if entry.get('thumbnails'):
-                thumbnail = entry['thumbnails'][0]['url']
-            elif entry.get('thumbnail'):
-                thumbnail = entry.get('thumbnail')
+async def iter_playlist(query: str, guild_id: int = 0):
+    """
+    Recorre una playlist por trozos (PLAYLIST_CHUNKS), según los va devolviendo yt-dlp.
 
-            if not webpage_url: continue
+    El primer trozo va con prioridad interactiva y el resto como
+    reproducción. Lo extraído se guarda en search_cache aunque no se llegue
+    al final (cola llena, /stop): la parte guardada termina con una marca
+    _PLAYLIST_NEXT y la siguiente vez se devuelve y se sigue desde ahí.
 
-            songs.append(Song(
-                title=entry.get('title', 'Desconocido'),
-                webpage_url=webpage_url,
-                thumbnail=thumbnail,
-                stream_url=None  # Se cargará al reproducir
-            ))
+    Yields:
+        Listas de Song
+    """
+    collected = []
+    start = 1
+    entries = await search_cache.get(query)
+    if entries is not None:
+        if not entries or _PLAYLIST_NEXT not in entries[-1]:
+            yield _songs_from_entries(entries)
+            return
+        collected, start = entries[:-1], entries[-1][_PLAYLIST_NEXT]
+        yield _songs_from_entries(collected)
 
-        return songs
+    complete = False
+    try:
+        # Si ya suena lo guardado, no hace falta empezar por el trozo de una sola entrada
+        for i in itertools.count(1 if collected else 0):
+            size = PLAYLIST_CHUNKS[min(i, len(PLAYLIST_CHUNKS) - 1)]
+            chunk = await extraction_scheduler.run(
+                ytdl.search, query, start, start + size - 1, guild_id=guild_id,
+                priority=PRIORITY_INTERACTIVE if i == 0 else PRIORITY_PLAYBACK, timeout=EXTRACTION_TIMEOUT
+            )
+            collected.extend(chunk)
+            start += size
+            complete = len(chunk) < size
+            yield _songs_from_entries(chunk)
+            if complete:
+                break
+    finally:
+        # También al cerrar el generador antes de tiempo (aclose): lo ya extraído no se pierde
+        if complete:
+            await search_cache.put(query, collected)
+        elif collected:
+            await search_cache.put(query, collected + [{"webpage_url": None, _PLAYLIST_NEXT: start}])
+
+
+async def ingest_playlist(chunks, player: MusicPlayer, requester, on_progress=None, progress_interval: float = 2.0):
+    """
+    Añade a la cola los trozos de una playlist según llegan (tarea de fondo cancelable con /stop).
+
+    Args:
+        chunks: Iterador asíncrono de iter_playlist, ya iniciado
+        requester: Miembro que pidió la playlist
+        on_progress: Corrutina opcional on_progress(añadidas, terminado), llamada como mucho cada progress_interval
+
+    Returns:
+        Número de canciones añadidas
+    """
+    added = 0
+    last_report = time.monotonic()
+    try:
+        # Con la cola llena no se le pide a yt-dlp el siguiente trozo
+        while len(player.queue) < MAX_QUEUE_SIZE:
+            songs = await anext(chunks, None)
+            if songs is None:
+                return added
+            for song in songs:
+                song.requester = requester
+                if not player.add_song(song):
+                    break
+                added += 1
+            if on_progress and time.monotonic() - last_report >= progress_interval:
+                last_report = time.monotonic()
+                await on_progress(added, False)
+        logger.info(f"Cola llena, se deja de añadir la playlist ({added} añadidas)")
+        return added
+    except ExtractionCancelled:
+        return added
     except Exception as e:
-        logger.error(f"Error en búsqueda plana: {e}")
-        return []
+        logger.error(f"Error añadiendo playlist: {e}")
+        return added
+    finally:
+        await chunks.aclose()
+        if on_progress:
+            try:
+                await on_progress(added, True)
+            except Exception as e:
+                logger.debug(f"No se pudo actualizar el progreso de la playlist: {e}")
+
+
+async def ensure_stream(song: Song, margin: float = STREAM_REFRESH_MARGIN, *, guild_id: int = 0,
+                        priority: int = PRIORITY_PLAYBACK) -> bool:
+    """
+    Resuelve el stream de una canción si no tiene uno vigente durante al menos `margin` segundos.
+
+    La URL sale del cache compartido (stream_cache), que reutiliza la de otro
+    servidor o una extracción ya en curso antes de lanzar otra.
+
+    Returns:
+        True si la canción tiene un stream_url utilizable
+    """
+    if song.stream_is_fresh(margin):
+        return True
+    info = await stream_cache.resolve(song.webpage_url, margin, guild_id=guild_id, priority=priority)
+    if info:
+        song.stream_url, song.stream_expires, song.stream_codec = info.url, info.expires, info.acodec
+    return song.stream_is_fresh()
+
+
+def make_audio_source(song: Song, local_file: Optional[str] = None) -> discord.AudioSource:
+    """
+    Crea la fuente de audio de una canción.
+
+    Un fichero del cache de audio ya es Opus y se envía sin recodificar.
+    Si el stream ya es Opus, FFmpeg solo cambia el contenedor (webm -> ogg)
+    y discord.py envía los paquetes tal cual; si no, FFmpeg decodifica a
+    PCM y discord.py lo vuelve a codificar en Opus cada 20 ms.
+    """
+    if local_file:
+        return discord.FFmpegOpusAudio(local_file, codec="copy", options="-vn")
+    if OPUS_PASSTHROUGH and song.stream_codec == "opus":
+        return discord.FFmpegOpusAudio(song.stream_url, codec="copy", **FFMPEG_OPTIONS)
+    return discord.FFmpegPCMAudio(song.stream_url, **FFMPEG_OPTIONS)
+
+
+def _on_track_end(voice_client: discord.VoiceClient, player: MusicPlayer, error: Optional[Exception]):
+    # Se ejecuta en el hilo de audio de discord.py
+    player.track_ended_at = time.monotonic()
+    if error:
+        logger.error(f"Error durante la reproducción: {error}")
+    asyncio.run_coroutine_threadsafe(play_next(voice_client, player), voice_client.client.loop)
+
+
+def get_playback_stats() -> dict:
+    """
+    Obtiene estadísticas de reproducción de todos los servidores.
+
+    Returns:
+        Diccionario con pistas reproducidas, aciertos del prefetch, pistas tocadas desde el
+        cache de audio, enviadas en Opus directo o recodificadas, huecos entre canciones y
+        tiempo hasta el primer audio de las playlists (ms)
+    """
+    stats = dict(_playback_stats)
+    for name, samples in (("gap", _gap_samples), ("first_audio", _first_audio_samples)):
+        values = sorted(samples)
+        stats[f"{name}_samples"] = len(values)
+        stats[f"{name}_avg_ms"] = sum(values) / len(values) if values else 0.0
+        stats[f"{name}_p50_ms"] = values[len(values) // 2] if values else 0.0
+        stats[f"{name}_p95_ms"] = values[min(len(values) - 1, int(len(values) * 0.95))] if values else 0.0
+        stats[f"{name}_max_ms"] = values[-1] if values else 0.0
+    return stats
 
 
 async def play_next(voice_client: discord.VoiceClient, player: MusicPlayer):
@@ -170,47 +352,44 @@ async def play_next(voice_client: discord.VoiceClient, player: MusicPlayer):
     song = player.get_next()
     if song is None:
         player.current = None
+        player.track_ended_at = None
         player.inactivity_task = asyncio.create_task(inactivity_disconnect(voice_client, player))
         return
 
     player.current = song
+    player.start_prefetch()
 
-    # --- EXTRACCIÓN JUST IN TIME ---
-    if not song.stream_url:
-        try:
-            logger.info(f"Extrayendo URL de audio real para: {song.title}")
-            loop = asyncio.get_event_loop()
-
-            def extract_single():
-                with yt_dlp.YoutubeDL(YDL_EXTRACT_OPTIONS) as ydl:
-                    return ydl.extract_info(song.webpage_url, download=False)
-
-            info = await loop.run_in_executor(None, extract_single)
+    local_file = audio_cache.lookup(song.webpage_url)
 
-            if info:
-                # 1. Intentamos coger la URL maestra de bestaudio
-                song.stream_url = info.get('url')
-
-                # 2. Si falla, buscamos el MEJOR formato de audio (-1 es el mejor, 0 era el peor)
-                if not song.stream_url and 'formats' in info:
-                    f_audio = [f for f in info['formats'] if f.get('vcodec') == 'none' and f.get('url')]
-                    if f_audio:
-                        song.stream_url = f_audio[-1]['url']
-
-        except Exception as e:
-            logger.error(f"Fallo al cargar la canción {song.title}: {e}")
-            await play_next(voice_client, player)  # Saltamos a la siguiente si YT bloquea esta
-            return
-
-    if not song.stream_url:
+    # --- EXTRACCIÓN JUST IN TIME (si el prefetch no llegó a tiempo) ---
+    prefetched = local_file is not None or song.stream_is_fresh(STREAM_REFRESH_MARGIN)
+    try:
+        resolved = local_file is not None or await ensure_stream(song, guild_id=player.guild.id)
+    except ExtractionCancelled:
+        # /stop ha cancelado la extracción: no se pasa a la siguiente canción
+        return
+    if not resolved:
+        # Saltamos a la siguiente si YT bloquea esta
         logger.warning(f"No se pudo extraer el stream para {song.title}")
         await play_next(voice_client, player)
         return
 
     try:
-        source = discord.FFmpegPCMAudio(song.stream_url, **FFMPEG_OPTIONS)
-        voice_client.play(source, after=lambda e: asyncio.run_coroutine_threadsafe(play_next(voice_client, player),
-                                                                                   voice_client.client.loop))
+        source = make_audio_source(song, str(local_file) if local_file else None)
+        voice_client.play(source, after=lambda e: _on_track_end(voice_client, player, e))
+        _playback_stats["tracks"] += 1
+        if local_file:
+            _playback_stats["local_file"] += 1
+        else:
+            _playback_stats["opus_passthrough" if isinstance(source, discord.FFmpegOpusAudio) else "pcm_transcode"] += 1
+        audio_cache.record_play(song.webpage_url, player.guild.id)
+        _playback_stats["prefetched" if prefetched else "resolved_on_demand"] += 1
+        if player.track_ended_at is not None:
+            _gap_samples.append((time.monotonic() - player.track_ended_at) * 1000)
+            player.track_ended_at = None
+        if player.requested_at is not None:
+            _first_audio_samples.append((time.monotonic() - player.requested_at) * 1000)
+            player.requested_at = None
         logger.info(f"▶️ Sonando correctamente: {song.title}")
     except Exception as e:
         logger.error(f"Error audio FFmpeg: {e}")
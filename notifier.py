@@ -1,15 +1,370 @@
 import discord
+import aiohttp
+import asyncio
+import heapq
+import io
+import itertools
+import re
+import time
+from collections import deque
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
+from difflib import SequenceMatcher
+from typing import Optional
+from config import (NOTIFY_MAX_QUEUE, NOTIFY_RATE_MESSAGES, NOTIFY_RATE_SECONDS, ADMIN_LOG_WEBHOOK_URL,
+                    WEBHOOK_RATE_MESSAGES, WEBHOOK_RATE_SECONDS, WEBHOOK_POOL_SIZE)
 import logging
 
 logger = logging.getLogger(__name__)
 
+PRIORITY_HIGH = 0    # Borrados hechos por moderadores
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+_PRIORITY_DIGEST = -1  # El resumen sale antes que cualquier notificación pendiente
+
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000  # Suma de len(embed) que admite Discord en un mensaje
+MAX_DIGEST_LINES = 30
+
 
 def now_utc() -> datetime:
     """Retorna la fecha y hora actual en UTC."""
     return datetime.now(timezone.utc)
 
 
+def render_diff(old: str, new: str, max_length: int = 1024) -> str:
+    """Diff por palabras en markdown: lo eliminado tachado y lo añadido en negrita."""
+    old_words, new_words = old.split(), new.split()
+    parts = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, old_words, new_words).get_opcodes():
+        if tag == "equal":
+            parts.append(discord.utils.escape_markdown(" ".join(old_words[i1:i2])))
+            continue
+        if i2 > i1:
+            parts.append(f"~~{discord.utils.escape_markdown(' '.join(old_words[i1:i2]))}~~")
+        if j2 > j1:
+            parts.append(f"**{discord.utils.escape_markdown(' '.join(new_words[j1:j2]))}**")
+    text = " ".join(parts)
+    return text if len(text) <= max_length else text[:max_length - 3] + "..."
+
+
+@dataclass(order=True)
+class _Notification:
+    priority: int
+    seq: int
+    embed: discord.Embed = field(compare=False)
+    summary: str = field(compare=False)
+    file: Optional[discord.File] = field(compare=False, default=None)
+    enqueued_at: float = field(compare=False, default_factory=time.monotonic)
+
+
+class _ChannelQueue:
+    def __init__(self, channel: discord.abc.Messageable):
+        self.channel = channel
+        self.heap: list[_Notification] = []
+        self.sent_at: deque[float] = deque()
+        self.digest: list[str] = []
+        self.digest_count = 0
+        self.batch_limit = MAX_EMBEDS_PER_MESSAGE  # Se reduce tras un rechazo de Discord y se recupera al enviar
+        self.worker: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self.heap) + (1 if self.digest_count else 0)
+
+
+class NotificationDispatcher:
+    """
+    Cola de notificaciones por canal respetando el límite de mensajes de Discord.
+
+    Agrupa hasta 10 embeds (y 6000 caracteres) por mensaje, envía primero
+    los de mayor prioridad y, si la cola supera `max_queue`, funde los de
+    menor prioridad en un embed de resumen en vez de acumular envíos durante
+    minutos. Si Discord rechaza un mensaje agrupado, sus embeds vuelven a la
+    cola y se reenvían en mensajes más pequeños.
+    """
+
+    def __init__(self, max_queue: int, rate_messages: int, rate_seconds: float):
+        self.max_queue = max_queue
+        self.rate_messages = rate_messages
+        self.rate_seconds = rate_seconds
+        self._queues: dict[int, _ChannelQueue] = {}
+        self._seq = itertools.count()
+        self.stats = {
+            "submitted": 0,
+            "messages_sent": 0,
+            "embeds_sent": 0,
+            "delivered": 0,
+            "merged": 0,
+            "dropped": 0,
+            "failed": 0,
+            "latency_total": 0.0,
+            "latency_max": 0.0,
+        }
+
+    def submit(
+            self,
+            channel: discord.abc.Messageable,
+            embed: discord.Embed,
+            *,
+            priority: int = PRIORITY_NORMAL,
+            summary: str = "",
+            file: Optional[discord.File] = None
+    ) -> bool:
+        """
+        Encola un embed para el canal.
+
+        Args:
+            channel: Canal de destino
+            embed: Embed a enviar
+            priority: PRIORITY_HIGH, PRIORITY_NORMAL o PRIORITY_LOW
+            summary: Línea que lo representa si acaba fundido en un resumen
+            file: Adjunto opcional
+
+        Returns:
+            True si se aceptó la notificación
+        """
+        queue = self._queues.get(channel.id)
+        if queue is None:
+            queue = self._queues[channel.id] = _ChannelQueue(channel)
+
+        heapq.heappush(queue.heap, _Notification(priority, next(self._seq), embed, summary, file))
+        self.stats["submitted"] += 1
+        if len(queue.heap) > self.max_queue:
+            self._merge_overflow(queue)
+
+        if queue.worker is None or queue.worker.done():
+            queue.worker = asyncio.create_task(self._run(queue))
+        return True
+
+    def _merge_overflow(self, queue: _ChannelQueue) -> None:
+        # Fundir en el resumen los de menor prioridad (y más recientes) hasta volver al límite
+        excess = heapq.nlargest(len(queue.heap) - self.max_queue, queue.heap)
+        for notification in excess:
+            queue.heap.remove(notification)
+            queue.digest_count += 1
+            self.stats["merged"] += 1
+            if len(queue.digest) < MAX_DIGEST_LINES and notification.summary:
+                queue.digest.append(notification.summary)
+            else:
+                self.stats["dropped"] += 1
+        heapq.heapify(queue.heap)
+
+    def _take_digest(self, queue: _ChannelQueue) -> discord.Embed:
+        lines = queue.digest
+        description = "\n".join(lines)
+        if queue.digest_count > len(lines):
+            description += f"\n*...y {queue.digest_count - len(lines)} más*"
+        if len(description) > 4096:
+            description = description[:4093] + "..."
+        embed = discord.Embed(
+            title=f"📋 Resumen: {queue.digest_count} notificaciones agrupadas",
+            description=description,
+            color=discord.Color.orange(),
+            timestamp=now_utc()
+        )
+        queue.digest = []
+        queue.digest_count = 0
+        return embed
+
+    async def _wait_for_slot(self, queue: _ChannelQueue) -> None:
+        # Los destinos con su propio bucket (webhooks) declaran su límite en rate_limit
+        rate_messages, rate_seconds = getattr(queue.channel, "rate_limit", (self.rate_messages, self.rate_seconds))
+        while len(queue.sent_at) >= rate_messages:
+            wait = rate_seconds - (time.monotonic() - queue.sent_at[0])
+            if wait <= 0:
+                queue.sent_at.popleft()
+            else:
+                await asyncio.sleep(wait)
+
+    @staticmethod
+    def _take_batch(queue: _ChannelQueue) -> list[_Notification]:
+        """Saca de la cola los embeds del siguiente mensaje sin pasar de los límites de Discord."""
+        batch: list[_Notification] = []
+        chars = 0
+        while queue.heap and len(batch) < queue.batch_limit:
+            size = len(queue.heap[0].embed)
+            if batch and chars + size > MAX_EMBED_CHARS_PER_MESSAGE:
+                break
+            batch.append(heapq.heappop(queue.heap))
+            chars += size
+        return batch
+
+    def _requeue(self, queue: _ChannelQueue, batch: list[_Notification]) -> None:
+        for notification in batch:
+            if notification.file:
+                notification.file.reset()
+            heapq.heappush(queue.heap, notification)
+
+    async def _run(self, queue: _ChannelQueue) -> None:
+        while len(queue):
+            await self._wait_for_slot(queue)
+
+            if queue.digest_count:
+                # Como una notificación más: así también cuenta para el límite de caracteres y se puede reintentar
+                digest = self._take_digest(queue)
+                heapq.heappush(queue.heap, _Notification(_PRIORITY_DIGEST, next(self._seq), digest, ""))
+            batch = self._take_batch(queue)
+            embeds = [n.embed for n in batch]
+            files = [n.file for n in batch if n.file]
+            try:
+                if files:
+                    await queue.channel.send(embeds=embeds, files=files)
+                else:
+                    await queue.channel.send(embeds=embeds)
+            except discord.Forbidden:
+                logger.error(f"Sin permisos para enviar mensajes en {getattr(queue.channel, 'name', queue.channel)}")
+                self.stats["failed"] += len(embeds)
+                continue
+            except discord.HTTPException as e:
+                if e.status == 429:
+                    self._requeue(queue, batch)
+                elif len(batch) > 1:
+                    # Probablemente un embed no cabe con los demás: reintentar en mensajes de la mitad
+                    logger.warning(f"Discord rechazó {len(batch)} notificaciones juntas ({e.status}), se reenvían por partes")
+                    queue.batch_limit = max(1, len(batch) // 2)
+                    self._requeue(queue, batch)
+                else:
+                    logger.error(f"Error al enviar la notificación: {e}")
+                    self.stats["failed"] += 1
+                continue
+            except Exception as e:
+                logger.error(f"Error al enviar {len(embeds)} notificaciones: {e}")
+                self.stats["failed"] += len(embeds)
+                continue
+            finally:
+                queue.sent_at.append(time.monotonic())
+
+            queue.batch_limit = MAX_EMBEDS_PER_MESSAGE
+            now = time.monotonic()
+            delivered = [n for n in batch if n.priority != _PRIORITY_DIGEST]
+            self.stats["messages_sent"] += 1
+            self.stats["embeds_sent"] += len(embeds)
+            self.stats["delivered"] += len(delivered)
+            for notification in delivered:
+                latency = now - notification.enqueued_at
+                self.stats["latency_total"] += latency
+                self.stats["latency_max"] = max(self.stats["latency_max"], latency)
+
+    async def drain(self, timeout: float = 10.0) -> None:
+        """Espera a que se vacíen las colas (llamar antes de cerrar la conexión)."""
+        workers = [q.worker for q in self._queues.values() if q.worker and not q.worker.done()]
+        if workers:
+            await asyncio.wait(workers, timeout=timeout)
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        total = stats.pop("latency_total")
+        delivered = stats["delivered"]
+        stats["queue_depth"] = sum(len(q.heap) for q in self._queues.values())
+        stats["latency_avg"] = total / delivered if delivered else 0.0
+        return stats
+
+
+class WebhookTarget:
+    """
+    Destino de notificaciones que entrega por webhook y, si falla, por el canal.
+
+    El webhook usa su propia sesión HTTP con conexiones persistentes y su
+    propio bucket de rate limit, así que los logs no compiten con las
+    respuestas de los comandos de música por el bucket del bot.
+    """
+
+    def __init__(self, url: str, pool_size: int, rate_limit: tuple[int, float]):
+        self.url = url
+        # El ID del webhook da al destino su propia cola en el dispatcher, separada de la del canal
+        match = re.search(r"/webhooks/(\d+)/", url)
+        self.id = int(match.group(1)) if match else hash(url)
+        self.pool_size = pool_size
+        self.rate_limit = rate_limit
+        self.channel: Optional[discord.TextChannel] = None
+        self.disabled = False
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._webhook: Optional[discord.Webhook] = None
+        self.stats = {"webhook_sent": 0, "fallback_sent": 0, "webhook_errors": 0}
+
+    @property
+    def name(self) -> str:
+        return f"webhook de {self.channel.name}" if self.channel else "webhook"
+
+    async def _get_webhook(self) -> discord.Webhook:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            session = aiohttp.ClientSession(connector=connector)
+            try:
+                self._webhook = discord.Webhook.from_url(self.url, session=session)
+            except ValueError:
+                await session.close()
+                raise
+            self._session = session
+        return self._webhook
+
+    async def send(self, *, embeds: list[discord.Embed], files: Optional[list[discord.File]] = None) -> None:
+        if not self.disabled:
+            try:
+                webhook = await self._get_webhook()
+                if files:
+                    await webhook.send(embeds=embeds, files=files)
+                else:
+                    await webhook.send(embeds=embeds)
+                self.stats["webhook_sent"] += 1
+                return
+            except discord.NotFound:
+                logger.error("El webhook de logs ya no existe, se usará el canal a partir de ahora")
+                self.disabled = True
+                self.stats["webhook_errors"] += 1
+            except ValueError:
+                logger.error("ADMIN_LOG_WEBHOOK_URL no es una URL de webhook válida, se usará el canal")
+                self.disabled = True
+                self.stats["webhook_errors"] += 1
+            except (discord.HTTPException, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Fallo al enviar por webhook, usando el canal: {e}")
+                self.stats["webhook_errors"] += 1
+
+        if self.channel is None:
+            raise RuntimeError("Webhook no disponible y sin canal de respaldo")
+        for f in files or []:
+            f.reset()
+        if files:
+            await self.channel.send(embeds=embeds, files=files)
+        else:
+            await self.channel.send(embeds=embeds)
+        self.stats["fallback_sent"] += 1
+
+    async def close(self) -> None:
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+
+dispatcher = NotificationDispatcher(NOTIFY_MAX_QUEUE, NOTIFY_RATE_MESSAGES, NOTIFY_RATE_SECONDS)
+webhook_target = (
+    WebhookTarget(ADMIN_LOG_WEBHOOK_URL, WEBHOOK_POOL_SIZE, (WEBHOOK_RATE_MESSAGES, WEBHOOK_RATE_SECONDS))
+    if ADMIN_LOG_WEBHOOK_URL else None
+)
+
+
+def _delivery_target(admin_channel: discord.TextChannel):
+    """Webhook configurado (con el canal como respaldo) o el propio canal."""
+    if webhook_target is None or webhook_target.disabled:
+        return admin_channel
+    webhook_target.channel = admin_channel
+    return webhook_target
+
+
+async def close() -> None:
+    """Vacía las colas pendientes y cierra la sesión HTTP del webhook."""
+    await dispatcher.drain()
+    if webhook_target:
+        await webhook_target.close()
+
+
+def get_dispatcher_stats() -> dict:
+    """Estadísticas de envío: profundidad de cola, embeds agrupados y latencia extremo a extremo."""
+    stats = dispatcher.get_stats()
+    if webhook_target:
+        stats.update(webhook_target.stats)
+    return stats
+
+
 async def send_admin_embed(
         admin_channel: discord.TextChannel,
         *,
@@ -17,10 +372,12 @@ async def send_admin_embed(
         executor_display: str,
         channel_display: str,
         content: str,
-        message_id: int
+        message_id: int,
+        priority: int = PRIORITY_NORMAL,
+        history: Optional[list[dict]] = None
 ) -> bool:
     """
-    Envía un embed al canal de administración sobre un mensaje eliminado.
+    Encola un embed para el canal de administración sobre un mensaje eliminado.
 
     Args:
         admin_channel: Canal donde enviar la notificación
@@ -29,11 +386,19 @@ async def send_admin_embed(
         channel_display: Mención o nombre del canal
         content: Contenido del mensaje eliminado
         message_id: ID del mensaje eliminado
+        priority: Prioridad en la cola del canal
+        history: Versiones del mensaje (db.get_message_history); si hubo ediciones se añade el diff
 
     Returns:
-        True si se envió correctamente, False en caso contrario
+        True si se encoló correctamente, False en caso contrario
     """
     try:
+        previous = history[-2]["content"] if history and len(history) > 1 else None
+        summary_content = content.replace("\n", " ")
+        if len(summary_content) > 80:
+            summary_content = summary_content[:77] + "..."
+        summary = f"🗑️ {author_display} en {channel_display} (por {executor_display}): {summary_content}"
+
         # Truncar contenido si es muy largo
         max_content_length = 1024
         if len(content) > max_content_length:
@@ -56,20 +421,94 @@ async def send_admin_embed(
             inline=False
         )
 
+        if previous is not None:
+            embed.add_field(
+                name=f"Última edición ({len(history) - 1} en total)",
+                value=render_diff(previous, history[-1]["content"]) or "*(sin cambios de texto)*",
+                inline=False
+            )
+
         embed.set_footer(text=f"ID del mensaje: {message_id}")
 
-        await admin_channel.send(embed=embed)
-        logger.info(f"Notificación de eliminación enviada para mensaje {message_id}")
+        dispatcher.submit(_delivery_target(admin_channel), embed, priority=priority, summary=summary)
+        logger.info(f"Notificación de eliminación encolada para mensaje {message_id}")
         return True
 
-    except discord.Forbidden:
-        logger.error(f"Sin permisos para enviar mensajes en {admin_channel.name}")
-        return False
     except Exception as e:
         logger.error(f"Error al enviar embed de notificación: {e}")
         return False
 
 
+async def send_bulk_delete_summary(
+        admin_channel: discord.TextChannel,
+        *,
+        executor_display: str,
+        channel_display: str,
+        messages: list[dict],
+        total: int,
+        max_lines: int = 15
+) -> bool:
+    """
+    Encola un único resumen de un borrado masivo, con la transcripción completa adjunta.
+
+    Args:
+        admin_channel: Canal donde enviar la notificación
+        executor_display: Mención o nombre de quien eliminó los mensajes
+        channel_display: Mención o nombre del canal
+        messages: Mensajes recuperados (message_id, author_id, content), en orden cronológico
+        total: Número total de mensajes eliminados, recuperados o no
+        max_lines: Número máximo de mensajes mostrados en el embed
+
+    Returns:
+        True si se encoló correctamente, False en caso contrario
+    """
+    try:
+        lines = []
+        for msg in messages[:max_lines]:
+            content = msg["content"].replace("\n", " ")
+            if len(content) > 100:
+                content = content[:97] + "..."
+            lines.append(f"<@{msg['author_id']}>: {content}")
+        if len(messages) > max_lines:
+            lines.append(f"*...y {len(messages) - max_lines} más (ver transcripción adjunta)*")
+
+        embed = discord.Embed(
+            title="🧹 Borrado masivo",
+            description=(
+                f"**Eliminado por:** {executor_display}\n"
+                f"**Canal:** {channel_display}\n"
+                f"**Mensajes:** {total} ({len(messages)} recuperados)"
+            ),
+            color=discord.Color.dark_red(),
+            timestamp=now_utc()
+        )
+        if lines:
+            summary = "\n".join(lines)
+            if len(summary) > 1024:
+                summary = summary[:1021] + "..."
+            embed.add_field(name="Contenido", value=summary, inline=False)
+
+        file = None
+        if messages:
+            transcript = "\n".join(
+                f"[{msg['message_id']}] {msg['author_id']}: {msg['content']}" for msg in messages
+            )
+            file = discord.File(io.BytesIO(transcript.encode("utf-8")), filename="borrado_masivo.txt")
+
+        dispatcher.submit(
+            _delivery_target(admin_channel), embed,
+            priority=PRIORITY_HIGH,
+            summary=f"🧹 Borrado masivo de {total} mensajes en {channel_display} (por {executor_display})",
+            file=file
+        )
+        logger.info(f"Resumen de borrado masivo encolado ({total} mensajes)")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error al enviar resumen de borrado masivo: {e}")
+        return False
+
+
 async def send_info_embed(
         channel: discord.TextChannel,
         title: str,
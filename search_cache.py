@@ -0,0 +1,131 @@
+import asyncio
+import json
+import re
+import time
+import zlib
+from collections import OrderedDict
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+from config import SEARCH_CACHE_MAX, SEARCH_CACHE_TTL, SEARCH_CACHE_NEGATIVE_TTL
+import db
+import logging
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_YOUTUBE_HOSTS = ("youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Clave de cache de una búsqueda.
+
+    Los enlaces de YouTube se reducen al ID de la playlist o del vídeo (así
+    coinciden aunque cambien los parámetros de seguimiento); el texto libre
+    se pasa a minúsculas y se colapsan los espacios.
+    """
+    query = query.strip()
+    parsed = urlparse(query)
+    if parsed.scheme in ("http", "https"):
+        host = parsed.netloc.lower()
+        params = parse_qs(parsed.query)
+        if host in _YOUTUBE_HOSTS:
+            if "list" in params:
+                return f"playlist:{params['list'][0]}"
+            if "v" in params:
+                return f"video:{params['v'][0]}"
+        elif host == "youtu.be" and parsed.path.strip("/"):
+            return f"video:{parsed.path.strip('/')}"
+        return f"url:{query}"
+    return "q:" + _WHITESPACE_RE.sub(" ", query.lower())
+
+
+class SearchCache:
+    """
+    Cache de dos niveles de los resultados de search_youtube.
+
+    El primer nivel es un LRU en memoria; el segundo, la tabla busquedas de
+    la base de datos, que sobrevive a los reinicios y se consulta fuera del
+    event loop. Las búsquedas sin resultados también se guardan, con un TTL
+    más corto, para no repetir extracciones que se sabe que fallan.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, negative_ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._memory: OrderedDict[str, tuple[float, list[dict]]] = OrderedDict()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "negative_hits": 0, "misses": 0, "stored": 0}
+
+    def _remember(self, key: str, expires_at: float, entries: list[dict]) -> None:
+        self._memory[key] = (expires_at, entries)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _hit(self, entries: list[dict], tier: str) -> list[dict]:
+        self.stats[tier] += 1
+        if not entries:
+            self.stats["negative_hits"] += 1
+        return entries
+
+    async def get(self, query: str) -> Optional[list[dict]]:
+        """
+        Busca una consulta en memoria y, si no está, en la base de datos.
+
+        Returns:
+            Lista de dicts (title, webpage_url, thumbnail), lista vacía si se
+            sabe que no hay resultados, o None si no está en cache
+        """
+        key = normalize_query(query)
+        now = time.time()
+        cached = self._memory.get(key)
+        if cached:
+            if cached[0] > now:
+                self._memory.move_to_end(key)
+                return self._hit(cached[1], "memory_hits")
+            del self._memory[key]
+
+        stored = await asyncio.to_thread(db.get_search_result, key)
+        if stored and stored[1] > now:
+            try:
+                entries = json.loads(zlib.decompress(stored[0]))
+            except (zlib.error, ValueError) as e:
+                logger.warning(f"Búsqueda guardada ilegible ({key}): {e}")
+            else:
+                self._remember(key, stored[1], entries)
+                return self._hit(entries, "disk_hits")
+
+        self.stats["misses"] += 1
+        return None
+
+    async def put(self, query: str, entries: list[dict]) -> None:
+        """Guarda el resultado de una búsqueda en los dos niveles."""
+        key = normalize_query(query)
+        expires_at = time.time() + (self.ttl if entries else self.negative_ttl)
+        self._remember(key, expires_at, entries)
+        self.stats["stored"] += 1
+        payload = zlib.compress(json.dumps(entries, ensure_ascii=False).encode("utf-8"))
+        await asyncio.to_thread(db.save_search_result, key, payload, int(expires_at))
+
+    def get_stats(self) -> dict:
+        """
+        Obtiene estadísticas del cache de búsquedas.
+
+        Returns:
+            Diccionario con aciertos por nivel, fallos y tasa de acierto
+        """
+        stats = dict(self.stats)
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["entries"] = len(self._memory)
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
+
+
+search_cache = SearchCache(SEARCH_CACHE_MAX, SEARCH_CACHE_TTL, SEARCH_CACHE_NEGATIVE_TTL)
+
+
+def get_search_cache_stats() -> dict:
+    """Obtiene estadísticas del cache de búsquedas."""
+    return search_cache.get_stats()
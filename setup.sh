@@ -89,7 +89,7 @@ echo 2. Activa el entorno virtual (si no esta activo):
 echo    venv\Scripts\activate.bat
 echo.
 echo 3. Ejecuta el bot:
-echo    python bot.py
+echo    python main.py
 echo.
 echo Para mas informacion, consulta README.md
 echo.
@@ -0,0 +1,184 @@
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+from config import STREAM_CACHE_MAX, STREAM_DEFAULT_TTL, EXTRACTION_TIMEOUT
+from extraction import extraction_scheduler, ExtractionCancelled, PRIORITY_PREFETCH, ExtractionJob
+import ytdl
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Las URLs firmadas de googlevideo llevan la caducidad como ?expire=<unix> o /expire/<unix>/
+_EXPIRE_PATH_RE = re.compile(r"/expire/(\d+)")
+_VIDEO_PATH_RE = re.compile(r"^/(?:shorts|embed|live)/([\w-]+)")
+
+
+def parse_stream_expiry(url: str) -> Optional[float]:
+    """Devuelve la caducidad (Unix) de una URL de stream firmada, o None si no la indica."""
+    try:
+        value = parse_qs(urlparse(url).query).get("expire", [None])[0]
+        if value is None:
+            match = _EXPIRE_PATH_RE.search(url)
+            value = match.group(1) if match else None
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def video_key(webpage_url: str) -> str:
+    """ID del vídeo de un enlace de YouTube; para otros enlaces, el propio enlace."""
+    parsed = urlparse(webpage_url)
+    if parsed.netloc.lower() == "youtu.be":
+        return parsed.path.strip("/") or webpage_url
+    video_id = parse_qs(parsed.query).get("v", [None])[0]
+    if video_id:
+        return video_id
+    match = _VIDEO_PATH_RE.match(parsed.path)
+    return match.group(1) if match else webpage_url
+
+
+@dataclass
+class StreamInfo:
+    url: str
+    expires: float
+    ext: Optional[str] = None
+    acodec: Optional[str] = None
+
+    def is_fresh(self, margin: float = 0) -> bool:
+        return self.expires - time.time() > margin
+
+
+@dataclass
+class _Inflight:
+    task: asyncio.Task
+    job: ExtractionJob
+
+
+class StreamCache:
+    """
+    Cache de URLs de audio compartido por todos los servidores.
+
+    La clave es el ID del vídeo, así que la misma canción en varios
+    servidores (o repetida con LOOP_QUEUE) se extrae una sola vez mientras
+    la URL firmada siga vigente. Las resoluciones simultáneas del mismo
+    vídeo esperan a una única extracción.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, StreamInfo] = OrderedDict()
+        self._inflight: dict[str, _Inflight] = {}
+        self.stats = {"hits": 0, "misses": 0, "shared": 0, "expired": 0, "failed": 0}
+
+    def _lookup(self, key: str, margin: float) -> Optional[StreamInfo]:
+        info = self._entries.get(key)
+        if info is None:
+            return None
+        if not info.is_fresh(margin):
+            if not info.is_fresh():
+                del self._entries[key]
+                self.stats["expired"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return info
+
+    async def _extract(self, key: str, job: ExtractionJob) -> Optional[StreamInfo]:
+        try:
+            # Sin plazo en el prefetch: puede esperar en cola detrás de las búsquedas
+            timeout = None if job.priority == PRIORITY_PREFETCH else EXTRACTION_TIMEOUT
+            result = await extraction_scheduler.wait(job, timeout)
+            if not result["url"]:
+                self.stats["failed"] += 1
+                return None
+
+            info = StreamInfo(
+                url=result["url"],
+                expires=parse_stream_expiry(result["url"]) or time.time() + STREAM_DEFAULT_TTL,
+                ext=result.get("ext"),
+                acodec=result.get("acodec")
+            )
+            self._entries[key] = info
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return info
+        finally:
+            self._inflight.pop(key, None)
+
+    async def resolve(self, webpage_url: str, margin: float = 0, *, guild_id: int = 0,
+                      priority: int = PRIORITY_PREFETCH) -> Optional[StreamInfo]:
+        """
+        Devuelve un stream vigente durante al menos `margin` segundos, extrayéndolo si hace falta.
+
+        Args:
+            guild_id: Servidor que lo pide (para el planificador de extracciones)
+            priority: Prioridad de la extracción; sin plazo solo en PRIORITY_PREFETCH
+
+        Returns:
+            StreamInfo, o None si no se pudo extraer o venció el plazo
+
+        Raises:
+            ExtractionCancelled: Si la extracción se canceló (p. ej. /stop), salvo en el prefetch
+        """
+        key = video_key(webpage_url)
+        info = self._lookup(key, margin)
+        if info:
+            self.stats["hits"] += 1
+            return info
+
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            self.stats["misses"] += 1
+            logger.info(f"Extrayendo URL de audio real para: {webpage_url}")
+            job = extraction_scheduler.submit(ytdl.extract_stream, webpage_url, guild_id=guild_id, priority=priority)
+            task = asyncio.create_task(self._extract(key, job))
+            # Si todos los que esperaban se cancelaron, el error no debe quedar como "never retrieved"
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            inflight = self._inflight[key] = _Inflight(task, job)
+        else:
+            self.stats["shared"] += 1
+            # Alguien la necesita antes de lo previsto: adelantar esta extracción (y solo esta) en la cola.
+            # Al subir de prioridad ya no la descarta cancel_guild(PRIORITY_PREFETCH) al cambiar la cola
+            extraction_scheduler.promote(inflight.job, priority)
+
+        # Una extracción compartida puede venir de un prefetch, que espera sin plazo: el plazo es de quien espera
+        timeout = None if priority == PRIORITY_PREFETCH else EXTRACTION_TIMEOUT
+        try:
+            # shield: cancelar a quien espera (o que venza su plazo) no debe cancelar la extracción compartida
+            return await asyncio.wait_for(asyncio.shield(inflight.task), timeout)
+        except ExtractionCancelled:
+            if priority == PRIORITY_PREFETCH:
+                return None
+            raise
+        except asyncio.TimeoutError:
+            logger.error(f"La extracción del stream de {webpage_url} no terminó en {EXTRACTION_TIMEOUT}s")
+            return None
+        except Exception as e:
+            logger.error(f"Fallo al extraer el stream de {webpage_url}: {e}")
+            return None
+
+    def get_stats(self) -> dict:
+        """
+        Obtiene estadísticas del cache de streams.
+
+        Returns:
+            Diccionario con aciertos, extracciones, resoluciones compartidas y entradas
+        """
+        stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"] + stats["shared"]
+        stats["entries"] = len(self._entries)
+        stats["inflight"] = len(self._inflight)
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+stream_cache = StreamCache(STREAM_CACHE_MAX)
+
+
+def get_stream_cache_stats() -> dict:
+    """Obtiene estadísticas del cache de streams."""
+    return stream_cache.get_stats()
@@ -0,0 +1,65 @@
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+# config.py exige TOKEN al importarse
+os.environ.setdefault("TOKEN", "test")
+# Los trabajos de prueba se sustituyen con monkeypatch, que no llega a otros procesos
+os.environ["EXTRACTION_MODE"] = "thread"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+class Recorder:
+    """Trabajos de prueba: anotan el orden en que se ejecutan; `gate` retiene a los que bloquean."""
+
+    def __init__(self):
+        self.order: list[str] = []
+        self.gate = threading.Event()
+
+    def blocking(self, name: str) -> str:
+        self.gate.wait(5)
+        self.order.append(name)
+        return name
+
+    def quick(self, name: str) -> str:
+        self.order.append(name)
+        return name
+
+
+@pytest.fixture
+def recorder():
+    recorder = Recorder()
+    yield recorder
+    # Que ningún worker se quede esperando si la prueba falla
+    recorder.gate.set()
+
+
+@pytest.fixture
+def single_worker_scheduler():
+    """Crea planificadores de un solo worker (thread) y los cierra al terminar."""
+    from extraction import ExtractionScheduler
+
+    schedulers = []
+
+    def make(per_guild: int = 1) -> ExtractionScheduler:
+        scheduler = ExtractionScheduler(1, per_guild, executor_factory=lambda: ThreadPoolExecutor(max_workers=1))
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.shutdown()
+
+
+@pytest.fixture
+def extraction_pool(monkeypatch):
+    """El planificador global de extracciones, reducido a un worker y un trabajo por servidor."""
+    from extraction import extraction_scheduler
+
+    monkeypatch.setattr(extraction_scheduler, "workers", 1)
+    monkeypatch.setattr(extraction_scheduler, "per_guild", 1)
+    return extraction_scheduler
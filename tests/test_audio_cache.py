@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+import audio_cache
+import ytdl
+from extraction import PRIORITY_PLAYBACK
+
+GUILD = 1
+TRACK = b"opus" * 1024
+
+
+@pytest.fixture
+def blocking_download(monkeypatch, recorder):
+    """Sustituye ytdl.download_audio por una descarga que no termina hasta que se abre recorder.gate."""
+    def download(webpage_url: str, destination: str) -> int:
+        recorder.blocking(webpage_url)
+        with open(destination + audio_cache.AUDIO_SUFFIX, "wb") as f:
+            f.write(TRACK)
+        return len(TRACK)
+
+    monkeypatch.setattr(ytdl, "download_audio", download)
+    return recorder.gate
+
+
+def test_downloads_do_not_hold_the_extraction_pool(tmp_path, blocking_download, extraction_pool, recorder):
+    cache = audio_cache.AudioCache(tmp_path, 10 * 1024 * 1024, 1)
+    url = "https://www.youtube.com/watch?v=abc"
+
+    async def run():
+        cache.schedule_download(url, GUILD)
+        await asyncio.sleep(0.05)
+        assert cache.get_stats()["downloading"] == 1
+        # Con una descarga en marcha en el mismo servidor, la extracción de play_next no espera
+        stream = await asyncio.wait_for(
+            extraction_pool.run(recorder.quick, "stream", guild_id=GUILD, priority=PRIORITY_PLAYBACK), timeout=2
+        )
+        blocking_download.set()
+        await asyncio.gather(*cache._downloads.values())
+        cache.shutdown()
+        return stream
+
+    assert asyncio.run(run()) == "stream"
+    assert recorder.order == ["stream", url]
+    assert cache.lookup(url) == tmp_path / f"abc{audio_cache.AUDIO_SUFFIX}"
+    assert cache.get_stats()["downloads"] == 1
+
+
+def test_cancel_guild_drops_queued_downloads(tmp_path, blocking_download, single_worker_scheduler):
+    cache = audio_cache.AudioCache(tmp_path, 10 * 1024 * 1024, 1, scheduler=single_worker_scheduler())
+    first = "https://www.youtube.com/watch?v=uno"
+    second = "https://www.youtube.com/watch?v=dos"
+
+    async def run():
+        cache.schedule_download(first, GUILD)
+        cache.schedule_download(second, GUILD)
+        await asyncio.sleep(0)
+        cancelled = cache.cancel_guild(GUILD)
+        blocking_download.set()
+        await asyncio.gather(*cache._downloads.values())
+        cache.shutdown()
+        return cancelled
+
+    assert asyncio.run(run()) == 1
+    assert cache.contains(first)
+    assert not cache.contains(second)
+    assert list(tmp_path.iterdir()) == [tmp_path / f"uno{audio_cache.AUDIO_SUFFIX}"]
@@ -0,0 +1,184 @@
+"""
+Reproduce secuencias de borrados y entradas de auditoría y comprueba a quién se atribuye cada borrado.
+
+AuditReplay hace de Discord: guarda las entradas del audit log (con su
+count, que Discord incrementa en vez de crear otra entrada), las entrega
+por el "gateway" cuando se le pide y las sirve por "HTTP" con audit_logs.
+resolve() sigue los mismos pasos que on_raw_message_delete.
+"""
+import asyncio
+import itertools
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Optional
+
+import discord
+import pytest
+
+import audit
+
+MOD = 100
+OTHER_MOD = 101
+AUTHOR = 200
+CHANNEL = 300
+WAIT = 0.05
+
+
+class AuditReplay:
+    def __init__(self):
+        self.guild = SimpleNamespace(id=1, audit_logs=self._audit_logs)
+        self._ids = itertools.count(1000)
+        self._entries: dict[int, dict] = {}
+
+    def _snapshot(self, entry_id: int) -> SimpleNamespace:
+        # Cada lectura devuelve un objeto nuevo, como discord.py al leer el audit log
+        data = self._entries[entry_id]
+        return SimpleNamespace(
+            id=entry_id,
+            action=data["action"],
+            guild=self.guild,
+            user=SimpleNamespace(id=data["user"]),
+            target=SimpleNamespace(id=data["target"]),
+            extra=SimpleNamespace(channel=SimpleNamespace(id=data["channel"]), count=data["count"]),
+            created_at=data["created_at"],
+        )
+
+    async def _audit_logs(self, limit: int, action: discord.AuditLogAction):
+        matching = [i for i in sorted(self._entries, reverse=True) if self._entries[i]["action"] == action]
+        for entry_id in matching[:limit]:
+            yield self._snapshot(entry_id)
+
+    def moderator_delete(self, moderator: int, author: int, channel: int) -> SimpleNamespace:
+        """Crea la entrada de un borrado de moderador o, si ya hay una igual reciente, incrementa su count."""
+        for entry_id, data in self._entries.items():
+            if (data["action"], data["user"], data["target"], data["channel"]) == (
+                    discord.AuditLogAction.message_delete, moderator, author, channel):
+                data["count"] += 1
+                return self._snapshot(entry_id)
+        entry_id = next(self._ids)
+        self._entries[entry_id] = {
+            "action": discord.AuditLogAction.message_delete,
+            "user": moderator,
+            "target": author,
+            "channel": channel,
+            "count": 1,
+            "created_at": datetime.now(timezone.utc),
+        }
+        return self._snapshot(entry_id)
+
+    async def resolve(self, channel: int, author: Optional[int], gateway_entry=None) -> Optional[int]:
+        """Borrado de un mensaje; gateway_entry llega por el gateway mientras se espera."""
+        waiting = asyncio.create_task(audit.deletion_correlator.wait_for(
+            discord.AuditLogAction.message_delete, self.guild.id, channel, author, timeout=WAIT
+        ))
+        if gateway_entry is not None:
+            await asyncio.sleep(0)
+            audit.deletion_correlator.feed(gateway_entry)
+        entry = await waiting
+        if entry is None:
+            entry = await audit.find_audit_entry_for_channel(self.guild, channel, author)
+        return entry.user.id if entry else None
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(audit, "audit_cache", audit.AuditLogCache(window=0))
+    monkeypatch.setattr(audit, "delete_count_tracker", audit.DeleteCountTracker(credit_ttl=60))
+    monkeypatch.setattr(audit, "deletion_correlator", audit.DeletionCorrelator(retention=10))
+
+
+def replay(scenario):
+    return asyncio.run(scenario(AuditReplay()))
+
+
+def test_gateway_entry_before_delete_event_is_not_reused_for_self_deletion():
+    async def scenario(server):
+        entry = server.moderator_delete(MOD, AUTHOR, CHANNEL)
+        audit.deletion_correlator.feed(entry)  # La entrada llega antes que el evento de borrado
+        first = await server.resolve(CHANNEL, AUTHOR)
+        own = await server.resolve(CHANNEL, AUTHOR)  # El autor borra su propio mensaje: no hay entrada
+        return first, own
+
+    assert replay(scenario) == (MOD, None)
+
+
+def test_gateway_entry_after_delete_event_is_not_reused_for_self_deletion():
+    async def scenario(server):
+        entry = server.moderator_delete(MOD, AUTHOR, CHANNEL)
+        first = await server.resolve(CHANNEL, AUTHOR, gateway_entry=entry)
+        own = await server.resolve(CHANNEL, AUTHOR)
+        return first, own
+
+    assert replay(scenario) == (MOD, None)
+
+
+def test_collapsed_count_bumps_are_attributed_once_each():
+    async def scenario(server):
+        results = []
+        entry = server.moderator_delete(MOD, AUTHOR, CHANNEL)
+        results.append(await server.resolve(CHANNEL, AUTHOR, gateway_entry=entry))
+        # Discord agrupa los siguientes borrados en la misma entrada y no los manda por el gateway
+        server.moderator_delete(MOD, AUTHOR, CHANNEL)
+        results.append(await server.resolve(CHANNEL, AUTHOR))
+        results.append(await server.resolve(CHANNEL, AUTHOR))  # Borrado propio entre medias
+        server.moderator_delete(MOD, AUTHOR, CHANNEL)
+        server.moderator_delete(MOD, AUTHOR, CHANNEL)
+        results.append(await server.resolve(CHANNEL, AUTHOR))
+        results.append(await server.resolve(CHANNEL, AUTHOR))
+        results.append(await server.resolve(CHANNEL, AUTHOR))
+        return results
+
+    assert replay(scenario) == [MOD, MOD, None, MOD, MOD, None]
+
+
+def test_self_deletions_do_not_take_credit_from_other_moderators_entries():
+    async def scenario(server):
+        entry = server.moderator_delete(OTHER_MOD, AUTHOR + 1, CHANNEL)
+        other = await server.resolve(CHANNEL, AUTHOR + 1, gateway_entry=entry)
+        own = await server.resolve(CHANNEL, AUTHOR)
+        server.moderator_delete(MOD, AUTHOR, CHANNEL)
+        moderated = await server.resolve(CHANNEL, AUTHOR)
+        return other, own, moderated
+
+    assert replay(scenario) == (OTHER_MOD, None, MOD)
+
+
+def test_first_http_poll_ignores_old_entries():
+    async def scenario(server):
+        old = server.moderator_delete(MOD, AUTHOR, CHANNEL)
+        server._entries[old.id]["created_at"] = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        return await server.resolve(CHANNEL, AUTHOR)
+
+    assert replay(scenario) is None
+
+
+@pytest.mark.parametrize("entry_first", [True, False])
+def test_entry_of_an_untracked_deletion_is_not_reused_for_self_deletion(entry_first):
+    async def scenario(server):
+        # El moderador borra un mensaje que no estaba guardado: el bot no lo registra
+        entry = server.moderator_delete(MOD, AUTHOR, CHANNEL)
+        if entry_first:
+            audit.deletion_correlator.feed(entry)
+        audit.deletion_correlator.ignore(discord.AuditLogAction.message_delete, server.guild.id, CHANNEL)
+        if not entry_first:
+            audit.deletion_correlator.feed(entry)
+        own = await server.resolve(CHANNEL, AUTHOR)  # Dentro de la ventana, el autor borra uno suyo
+        server.moderator_delete(MOD, AUTHOR, CHANNEL)
+        moderated = await server.resolve(CHANNEL, AUTHOR)
+        return own, moderated
+
+    assert replay(scenario) == (None, MOD)
+    assert audit.deletion_correlator.stats["dropped"] == 1
+
+
+def test_unclaimed_entries_expire_after_the_retention(monkeypatch):
+    monkeypatch.setattr(audit, "deletion_correlator", audit.DeletionCorrelator(retention=WAIT))
+
+    async def scenario(server):
+        audit.deletion_correlator.feed(server.moderator_delete(MOD, AUTHOR, CHANNEL))
+        await asyncio.sleep(WAIT * 2)
+        return await audit.deletion_correlator.wait_for(
+            discord.AuditLogAction.message_delete, server.guild.id, CHANNEL, AUTHOR, timeout=WAIT
+        )
+
+    assert replay(scenario) is None
@@ -0,0 +1,130 @@
+"""
+Operaciones aleatorias sobre CompactMessageCache comparadas con un modelo OrderedDict.
+
+Los tamaños son pequeños a propósito para que el anillo de slots y el arena
+den muchas vueltas, haya entradas marcadas, compactaciones y desalojos por
+capacidad, por bytes y por cuota.
+"""
+import random
+from collections import OrderedDict, defaultdict
+
+import pytest
+
+from cache import CompactMessageCache, POLICY_FIFO, POLICY_LRU
+
+ALPHABET = "abcdefghij ñáé😀"
+
+
+def random_content(rng: random.Random) -> str:
+    return "".join(rng.choices(ALPHABET, k=rng.randrange(0, 40)))
+
+
+def check_structure(cache: CompactMessageCache) -> None:
+    """Invariantes internos: cada entrada viva está en el índice, y los contadores cuadran."""
+    live = [slot for slot in ((cache._head + i) % cache.max_entries for i in range(cache._count))
+            if cache._lengths[slot] >= 0]
+    assert len(live) == cache._live == len(cache)
+    assert sum(cache._lengths[slot] for slot in live) == cache.bytes_used
+    assert sum(1 for slot in cache._index if slot != -1) == len(live)
+    for slot in live:
+        assert cache._index[cache._find(cache._ids[slot])] == slot
+    assert cache._arena_used() <= cache.max_bytes
+    assert cache._count <= cache.max_entries
+
+
+def sync_with_cache(cache: CompactMessageCache, model: OrderedDict, suffix: bool) -> None:
+    """
+    Comprueba que lo que queda en el cache coincide con el modelo y quita del modelo lo desalojado.
+
+    Con suffix=True lo desalojado tiene que ser lo más antiguo del modelo (orden LRU/FIFO).
+    """
+    present = cache.get_many(list(model))
+    seen_present = False
+    for message_id, (author_id, content, _) in model.items():
+        if message_id in present:
+            assert present[message_id] == (author_id, content)
+            seen_present = True
+        elif suffix:
+            assert not seen_present, f"{message_id} desalojado antes que entradas más antiguas"
+    for message_id in [m for m in model if m not in present]:
+        del model[message_id]
+    assert len(cache) == len(model)
+
+
+def run_operations(cache: CompactMessageCache, seed: int, steps: int, channels: int = 1, suffix: bool = True):
+    rng = random.Random(seed)
+    model: OrderedDict[int, tuple[int, str, int]] = OrderedDict()
+    lru = cache.policy == POLICY_LRU
+    for _ in range(steps):
+        message_id = rng.randrange(1, 60)
+        op = rng.random()
+        if op < 0.45:
+            author_id, content, channel_id = rng.randrange(1, 5), random_content(rng), rng.randrange(1, channels + 1)
+            cache.put(message_id, author_id, content, channel_id)
+            model[message_id] = (author_id, content, channel_id)
+            model.move_to_end(message_id)
+        elif op < 0.7:
+            expected = model.get(message_id)
+            result = cache.get(message_id)
+            if result is not None:
+                assert result == expected[:2]
+                if lru:
+                    model.move_to_end(message_id)
+        elif op < 0.85:
+            content = random_content(rng)
+            previous = cache.update(message_id, content)
+            if previous is not None:
+                author_id, old_content, channel_id = model[message_id]
+                assert previous == old_content
+                if content != old_content:
+                    model[message_id] = (author_id, content, channel_id)
+                    model.move_to_end(message_id)
+            else:
+                model.pop(message_id, None)
+        else:
+            # sync_with_cache deja el modelo igual al cache: estaba si y solo si está en el modelo
+            assert cache.remove(message_id) == (message_id in model)
+            model.pop(message_id, None)
+        sync_with_cache(cache, model, suffix)
+        check_structure(cache)
+    return model
+
+
+@pytest.mark.parametrize("seed", range(8))
+@pytest.mark.parametrize("policy", [POLICY_LRU, POLICY_FIFO])
+def test_cache_matches_ordered_model(policy, seed):
+    cache = CompactMessageCache(16, 400, policy=policy)
+    run_operations(cache, seed, steps=3000)
+    assert cache.stats["compactions"] > 0
+    assert cache.stats["evictions"]["capacity"] > 0
+    assert cache.stats["evictions"]["bytes"] > 0
+
+
+def test_cache_without_pressure_keeps_everything():
+    cache = CompactMessageCache(1024, 1 << 20, policy=POLICY_LRU)
+    model = run_operations(cache, seed=99, steps=2000)
+    assert sum(cache.stats["evictions"].values()) == 0
+    assert len(model) == len(cache)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_channel_quota_is_enforced(seed):
+    quota = 60
+    cache = CompactMessageCache(32, 512, policy=POLICY_LRU, channel_quota=quota)
+    model = OrderedDict()
+    rng = random.Random(seed)
+    for _ in range(2000):
+        message_id, channel_id, content = rng.randrange(1, 80), rng.randrange(1, 4), random_content(rng)
+        cache.put(message_id, 1, content, channel_id)
+        model[message_id] = (1, content, channel_id)
+        model.move_to_end(message_id)
+        # La cuota desaloja dentro de cada canal, no en el orden global: sin comprobación de sufijo
+        sync_with_cache(cache, model, suffix=False)
+        check_structure(cache)
+
+        by_channel = defaultdict(int)
+        for _, content_, channel in model.values():
+            by_channel[channel] += len(content_.encode("utf-8"))
+        assert all(size <= quota for size in by_channel.values())
+        assert message_id in model or len(content.encode("utf-8")) > quota
+    assert cache.stats["evictions"]["channel_quota"] > 0
@@ -0,0 +1,230 @@
+import pytest
+
+import db
+
+DISCORD_EPOCH_MS = 1420070400000
+
+
+def snowflake(timestamp_ms: int, sequence: int = 0) -> int:
+    return ((timestamp_ms - DISCORD_EPOCH_MS) << 22) | sequence
+
+
+@pytest.fixture(autouse=True)
+def database(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "_connections", db.ConnectionManager(tmp_path / "mensajes.db"))
+    db.init_db()
+    yield
+    db.close_db()
+
+
+def test_resaving_a_message_replaces_its_search_entry():
+    message_id = snowflake(1_700_000_000_000)
+    assert db.save_message(message_id, 1, "zanahoria fresca", 2)
+    assert db.save_message(message_id, 1, "pepino", 2)
+
+    assert db.search_messages(text="zanahoria") == []
+    assert [m["content"] for m in db.search_messages(text="pepino")] == ["pepino"]
+
+
+def test_duplicate_messages_in_one_batch_keep_only_the_last_version():
+    message_id = snowflake(1_700_000_000_000)
+    table = db.partition_for_message(message_id)
+    with db.get_db_connection() as conn:
+        db._ensure_partition(conn, table)
+        db._insert_messages(conn, table, [(message_id, 1, "zanahoria", 2), (message_id, 1, "pepino", 2)])
+
+    assert db.search_messages(text="zanahoria") == []
+    assert db.get_message(message_id)["content"] == "pepino"
+
+
+def _reopen_with_partition_days(tmp_path, monkeypatch, days: int) -> None:
+    db.close_db()
+    monkeypatch.setattr(db, "DB_PARTITION_DAYS", days)
+    monkeypatch.setattr(db, "_partition_days", days)
+    monkeypatch.setattr(db, "_connections", db.ConnectionManager(tmp_path / "mensajes.db"))
+    db.init_db()
+
+
+def test_partition_width_is_kept_when_the_setting_changes(tmp_path, monkeypatch):
+    day_ms = 24 * 3600 * 1000
+    ids = [snowflake(1_700_000_000_000 + day * day_ms) for day in range(10)]
+    for i, message_id in enumerate(ids):
+        db.save_message(message_id, 1, f"mensaje {i}", 2)
+    tables = db.list_partitions()
+
+    _reopen_with_partition_days(tmp_path, monkeypatch, 3)
+
+    assert db.list_partitions() == tables
+    assert [db.get_message(message_id)["content"] for message_id in ids] == [f"mensaje {i}" for i in range(10)]
+    assert set(db.get_messages(ids)) == set(ids)
+    assert len(list(db.iter_messages(since_ms=1_700_000_000_000 + 8 * day_ms))) == 2
+
+
+def test_partition_width_is_inferred_for_databases_without_the_setting(tmp_path, monkeypatch):
+    day_ms = 24 * 3600 * 1000
+    ids = [snowflake(1_700_000_000_000 + day * day_ms) for day in range(0, 30, 2)]
+    for message_id in ids:
+        db.save_message(message_id, 1, "hola", 2)
+    width = db._partition_days
+    # Base de datos anterior a la migración 7
+    with db.get_db_connection() as conn:
+        conn.execute("DROP TABLE ajustes")
+        conn.execute("PRAGMA user_version = 6")
+
+    _reopen_with_partition_days(tmp_path, monkeypatch, width - 2)
+
+    assert db._partition_days == width
+    assert set(db.get_messages(ids)) == set(ids)
+
+
+def test_retention_keeps_partitions_that_still_hold_recent_days(monkeypatch):
+    now_ms = 1_700_000_000_000
+    monkeypatch.setattr(db.time, "time", lambda: now_ms / 1000)
+    day_ms = 24 * 3600 * 1000
+    for day in range(0, 40):
+        db.save_message(snowflake(now_ms - day * day_ms), 1, "hola", 2)
+
+    db.delete_old_messages(days=30)
+
+    oldest = min(db._partition_day(table) for table in db.list_partitions())
+    assert oldest + db._partition_days > now_ms // day_ms - 30
+    assert oldest <= now_ms // day_ms - 30
+
+
+def test_upgrade_from_version_2_decodes_dictionary_compressed_rows(tmp_path, monkeypatch):
+    db.close_db()
+    monkeypatch.setattr(db, "_connections", db.ConnectionManager(tmp_path / "antigua.db"))
+    monkeypatch.setattr(db, "_dictionaries", {})
+    monkeypatch.setattr(db, "_current_dict_id", 0)
+    message_id = snowflake(1_700_000_000_000)
+    content = "mensaje largo con palabras del diccionario " * 10
+    table = db.partition_for_message(message_id)
+    # Esquema de la versión 2: particiones sin índice FTS y la tabla de diccionarios
+    with db.get_db_connection() as conn:
+        conn.execute(db.CREATE_PARTITION_SQL.format(table=table))
+        conn.execute(db.CREATE_DICTIONARY_TABLE_SQL)
+        conn.execute("INSERT INTO diccionarios (id, data) VALUES (1, ?)", (b"palabras del diccionario ",))
+        db._load_dictionaries(conn)
+        encoded = db.encode_content(content)
+        conn.execute(db.INSERT_MESSAGE_SQL.format(table=table), (message_id, 1, encoded, 2))
+        conn.execute("PRAGMA user_version = 2")
+    assert isinstance(encoded, bytes) and encoded[:2] == b"\x01\x00"
+
+    db.close_db()
+    monkeypatch.setattr(db, "_dictionaries", {})
+    monkeypatch.setattr(db, "_current_dict_id", 0)
+    monkeypatch.setattr(db, "_connections", db.ConnectionManager(tmp_path / "antigua.db"))
+    db.init_db()
+
+    assert db.run_migrations() == db.MIGRATIONS[-1][0]
+    assert db.get_message(message_id)["content"] == content
+    assert [m["message_id"] for m in db.search_messages(text="diccionario")] == [message_id]
+
+
+def write_through_writer(items: list) -> dict:
+    writer = db.MessageWriter(batch_size=len(items), flush_interval=10, max_queue=100)
+    writer.start()
+    for item in items:
+        writer.submit(*item)
+    writer.stop()
+    return writer.get_stats()
+
+
+def test_writer_drops_only_the_rows_that_fail():
+    good = [(snowflake(1_700_000_000_000, i), 1, f"mensaje {i}", 2) for i in range(5)]
+    bad = (snowflake(1_700_000_000_000, 99), 1, 12345, 2)  # Contenido que no es texto
+
+    stats = write_through_writer(good[:2] + [bad] + good[2:])
+
+    assert (stats["written"], stats["failed"], stats["retried_batches"]) == (5, 1, 1)
+    assert set(db.get_messages([row[0] for row in good])) == {row[0] for row in good}
+    assert db.get_message(bad[0]) is None
+
+
+def test_writer_retries_a_batch_after_a_transient_error(monkeypatch):
+    insert = db._insert_messages
+    calls = []
+
+    def locked_once(conn, table, rows):
+        calls.append(len(rows))
+        if len(calls) == 1:
+            raise db.sqlite3.OperationalError("database is locked")
+        insert(conn, table, rows)
+
+    monkeypatch.setattr(db, "_insert_messages", locked_once)
+    good = [(snowflake(1_700_000_000_000, i), 1, f"mensaje {i}", 2) for i in range(5)]
+
+    stats = write_through_writer(good)
+
+    assert calls == [5, 5]  # Un reintento del lote entero, sin pasar a fila a fila
+    assert (stats["written"], stats["failed"], stats["retried_batches"]) == (5, 0, 1)
+    assert len(db.get_messages([row[0] for row in good])) == 5
+
+
+LEGACY_SCHEMA = (
+    # Esquema original: id AUTOINCREMENT, UNIQUE en message_id y además idx_message_id
+    """CREATE TABLE mensajes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        message_id INTEGER UNIQUE,
+        author_id INTEGER,
+        content TEXT,
+        channel_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    "CREATE INDEX idx_message_id ON mensajes(message_id)",
+)
+
+
+def test_migration_splits_the_legacy_table_into_partitions(tmp_path, monkeypatch):
+    db.close_db()
+    monkeypatch.setattr(db, "_connections", db.ConnectionManager(tmp_path / "legacy.db"))
+    monkeypatch.setattr(db, "MIGRATION_CHUNK_SIZE", 300)  # Varias vueltas del bucle por trozos
+    day_ms = 24 * 3600 * 1000
+    rows = [(snowflake(1_700_000_000_000 + (i % 45) * day_ms, i), i % 7, f"mensaje legado {i}", i % 3,
+             f"2023-11-{1 + i % 28:02d} 12:00:00") for i in range(1000)]
+    with db.get_db_connection() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.execute(statement)
+        conn.executemany(
+            "INSERT INTO mensajes (message_id, author_id, content, channel_id, created_at) VALUES (?, ?, ?, ?, ?)", rows
+        )
+
+    assert db.run_migrations() == db.MIGRATIONS[-1][0]
+
+    with db.get_db_connection() as conn:
+        assert not db._table_exists(conn, db.LEGACY_TABLE)
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == db.MIGRATIONS[-1][0]
+        partitions = db.list_partitions(conn)
+        counts = [conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0] for table in partitions]
+    assert len(partitions) > 1
+    assert sum(counts) == len(rows)
+
+    db.init_db()
+    message_id, author_id, content, channel_id, created_at = rows[123]
+    assert db.get_message(message_id) == {"message_id": message_id, "author_id": author_id, "content": content,
+                                          "channel_id": channel_id, "created_at": created_at}
+    assert len(db.search_messages(limit=2000, text="legado")) == len(rows)
+    # Volver a ejecutar las migraciones no hace nada
+    assert db.run_migrations() == db.MIGRATIONS[-1][0]
+
+
+@pytest.mark.parametrize("text", [None, "zanahoria"])
+def test_search_pages_only_over_visible_channels(text):
+    base = 1_700_000_000_000
+    visible = [snowflake(base + i * 1000) for i in range(3)]
+    hidden = [snowflake(base + 10_000 + i * 1000) for i in range(40)]
+    for message_id in visible:
+        db.save_message(message_id, 1, "zanahoria visible", 1)
+    for message_id in hidden:
+        db.save_message(message_id, 1, "zanahoria oculta", 2)
+
+    # Los 40 mensajes ocultos son más recientes: filtrar después de la consulta dejaría la página vacía
+    page = db.search_messages(limit=2, text=text, channel_ids={1})
+    assert [m["message_id"] for m in page] == visible[:0:-1]
+    rest = db.search_messages(limit=2, text=text, channel_ids={1}, before_id=page[-1]["message_id"])
+    assert [m["message_id"] for m in rest] == visible[:1]
+
+    many = set(range(3, 5000)) | {1}
+    assert len(db.search_messages(limit=50, text=text, channel_ids=many)) == 3
+    assert db.search_messages(text=text, channel_ids=set()) == []
+    assert len(db.search_messages(limit=50, text=text)) == 43
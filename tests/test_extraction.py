@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+import extraction
+import stream_cache
+import ytdl
+from extraction import PRIORITY_PLAYBACK, PRIORITY_PREFETCH
+
+GUILD = 1
+
+
+def test_promote_moves_only_the_given_job(recorder, single_worker_scheduler):
+    async def run():
+        scheduler = single_worker_scheduler()
+        busy = scheduler.submit(recorder.blocking, "ocupado", guild_id=GUILD)
+        download = scheduler.submit(recorder.quick, "descarga", guild_id=GUILD, priority=PRIORITY_PREFETCH)
+        stream = scheduler.submit(recorder.quick, "stream", guild_id=GUILD, priority=PRIORITY_PREFETCH)
+
+        assert scheduler.promote(stream, PRIORITY_PLAYBACK)
+        assert download.priority == PRIORITY_PREFETCH
+        assert scheduler.get_stats()["queue_by_priority"] == {0: 0, 1: 1, 2: 1}
+
+        recorder.gate.set()
+        await asyncio.gather(*(scheduler.wait(job) for job in (busy, download, stream)))
+
+    asyncio.run(run())
+    assert recorder.order == ["ocupado", "stream", "descarga"]
+
+
+def test_promote_ignores_started_and_higher_priority_jobs(recorder, single_worker_scheduler):
+    async def run():
+        scheduler = single_worker_scheduler()
+        busy = scheduler.submit(recorder.blocking, "ocupado", guild_id=GUILD, priority=PRIORITY_PREFETCH)
+        queued = scheduler.submit(recorder.quick, "playback", guild_id=GUILD, priority=PRIORITY_PLAYBACK)
+
+        assert not scheduler.promote(busy, PRIORITY_PLAYBACK)  # Ya está en un worker
+        assert not scheduler.promote(queued, PRIORITY_PREFETCH)  # Bajar no es promover
+        assert queued.priority == PRIORITY_PLAYBACK
+
+        recorder.gate.set()
+        await asyncio.gather(scheduler.wait(busy), scheduler.wait(queued))
+
+    asyncio.run(run())
+
+
+def test_shared_stream_resolution_promotes_its_own_extraction(monkeypatch, recorder, single_worker_scheduler):
+    scheduler = single_worker_scheduler()
+    monkeypatch.setattr(stream_cache, "extraction_scheduler", scheduler)
+    monkeypatch.setattr(ytdl, "extract_stream", lambda url: {"url": recorder.quick(url) + "?expire=9999999999"})
+    cache = stream_cache.StreamCache(10)
+    url = "https://www.youtube.com/watch?v=abc"
+
+    async def run():
+        busy = scheduler.submit(recorder.blocking, "ocupado", guild_id=GUILD)
+        prefetch = asyncio.create_task(cache.resolve(url, guild_id=GUILD, priority=PRIORITY_PREFETCH))
+        await asyncio.sleep(0)
+        download = scheduler.submit(recorder.quick, "descarga", guild_id=GUILD, priority=PRIORITY_PREFETCH)
+
+        playback = asyncio.create_task(cache.resolve(url, guild_id=GUILD, priority=PRIORITY_PLAYBACK))
+        await asyncio.sleep(0)
+        assert download.priority == PRIORITY_PREFETCH
+
+        recorder.gate.set()
+        return await asyncio.gather(prefetch, playback, scheduler.wait(busy), scheduler.wait(download))
+
+    first, second, *_ = asyncio.run(run())
+    assert first is second
+    assert recorder.order == ["ocupado", url, "descarga"]
+    assert cache.stats["shared"] == 1
+
+
+@pytest.mark.parametrize("priority", [PRIORITY_PLAYBACK, PRIORITY_PREFETCH])
+def test_cancel_guild_by_priority_leaves_promoted_jobs(priority, recorder, single_worker_scheduler):
+    async def run():
+        scheduler = single_worker_scheduler()
+        busy = scheduler.submit(recorder.blocking, "ocupado", guild_id=GUILD)
+        promoted = scheduler.submit(recorder.quick, "stream", guild_id=GUILD, priority=PRIORITY_PREFETCH)
+        scheduler.promote(promoted, PRIORITY_PLAYBACK)
+
+        cancelled = scheduler.cancel_guild(GUILD, priority)
+        recorder.gate.set()
+        await scheduler.wait(busy)
+        if priority == PRIORITY_PLAYBACK:
+            with pytest.raises(extraction.ExtractionCancelled):
+                await scheduler.wait(promoted)
+        else:
+            assert await scheduler.wait(promoted) == "stream"
+        return cancelled
+
+    assert asyncio.run(run()) == (1 if priority == PRIORITY_PLAYBACK else 0)
+
+
+def test_playback_joining_a_prefetch_gives_up_after_its_timeout(monkeypatch, recorder, single_worker_scheduler):
+    scheduler = single_worker_scheduler()
+    monkeypatch.setattr(stream_cache, "extraction_scheduler", scheduler)
+    monkeypatch.setattr(stream_cache, "EXTRACTION_TIMEOUT", 0.05)
+    monkeypatch.setattr(ytdl, "extract_stream", lambda url: {"url": recorder.blocking(url) + "?expire=9999999999"})
+    cache = stream_cache.StreamCache(10)
+    url = "https://www.youtube.com/watch?v=abc"
+
+    async def run():
+        prefetch = asyncio.create_task(cache.resolve(url, guild_id=GUILD, priority=PRIORITY_PREFETCH))
+        await asyncio.sleep(0.01)
+        # El prefetch espera sin plazo; quien reproduce no
+        assert await asyncio.wait_for(cache.resolve(url, guild_id=GUILD, priority=PRIORITY_PLAYBACK), 1) is None
+        assert not prefetch.done()
+
+        recorder.gate.set()
+        return await prefetch
+
+    assert asyncio.run(run()).url.startswith(url)
+    assert recorder.order == [url]
+
+
+def test_cancelled_stream_resolution_is_not_retried(monkeypatch, recorder, single_worker_scheduler):
+    scheduler = single_worker_scheduler()
+    monkeypatch.setattr(stream_cache, "extraction_scheduler", scheduler)
+    monkeypatch.setattr(ytdl, "extract_stream", lambda url: {"url": recorder.quick(url) + "?expire=9999999999"})
+    cache = stream_cache.StreamCache(10)
+    url = "https://www.youtube.com/watch?v=abc"
+
+    async def run():
+        busy = scheduler.submit(recorder.blocking, "ocupado", guild_id=GUILD)
+        playback = asyncio.create_task(cache.resolve(url, guild_id=GUILD, priority=PRIORITY_PLAYBACK))
+        await asyncio.sleep(0)
+        scheduler.cancel_guild(GUILD)  # /stop
+        with pytest.raises(extraction.ExtractionCancelled):
+            await playback
+        assert scheduler.get_stats()["queue_depth"] == 0  # Sin una segunda extracción en cola
+        recorder.gate.set()
+        await scheduler.wait(busy)
+
+    asyncio.run(run())
+    assert cache.stats["misses"] == 1
+    assert recorder.order == ["ocupado"]
@@ -0,0 +1,67 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import db
+import music
+import ytdl
+from search_cache import SearchCache
+
+PLAYLIST = "https://www.youtube.com/playlist?list=PL1"
+
+
+@pytest.fixture
+def playlist(tmp_path, monkeypatch):
+    """Playlist falsa de `size` entradas; devuelve los rangos que se le piden a ytdl.search."""
+    monkeypatch.setattr(db, "_connections", db.ConnectionManager(tmp_path / "mensajes.db"))
+    db.init_db()
+    monkeypatch.setattr(music, "search_cache", SearchCache(10, 3600, 60))
+    monkeypatch.setattr(music, "PREFETCH_COUNT", 0)
+    calls = []
+
+    def make(size: int) -> list:
+        def search(query, start=None, end=None):
+            calls.append((start, end))
+            return [{"title": f"canción {i}", "webpage_url": f"https://www.youtube.com/watch?v={i}", "thumbnail": None}
+                    for i in range(start, min(end, size) + 1)]
+        monkeypatch.setattr(ytdl, "search", search)
+        return calls
+
+    yield make
+    db.close_db()
+
+
+async def collect(query: str) -> list[str]:
+    return [song.webpage_url for songs in [s async for s in music.iter_playlist(query)] for song in songs]
+
+
+def test_complete_playlist_is_served_from_cache(playlist):
+    calls = playlist(60)
+    first = asyncio.run(collect(PLAYLIST))
+    assert len(first) == 60
+    assert calls == [(1, 1), (2, 50), (51, 150)]
+
+    calls.clear()
+    assert asyncio.run(collect(PLAYLIST)) == first
+    assert calls == []
+
+
+def test_full_queue_keeps_the_extracted_entries_and_resumes(playlist, monkeypatch):
+    calls = playlist(120)
+    monkeypatch.setattr(music, "MAX_QUEUE_SIZE", 30)
+    player = music.MusicPlayer(SimpleNamespace(id=1))
+
+    added = asyncio.run(music.ingest_playlist(music.iter_playlist(PLAYLIST), player, requester=None))
+    assert added == 30
+    assert calls == [(1, 1), (2, 50)]
+
+    # Lo extraído vuelve del cache y solo se pide lo que faltaba
+    calls.clear()
+    urls = asyncio.run(collect(PLAYLIST))
+    assert urls == [f"https://www.youtube.com/watch?v={i}" for i in range(1, 121)]
+    assert calls == [(51, 99), (100, 199)]
+
+    calls.clear()
+    assert asyncio.run(collect(PLAYLIST)) == urls
+    assert calls == []
@@ -0,0 +1,208 @@
+"""
+Entrega de notificaciones: el webhook contra un servidor aiohttp local y el agrupado del dispatcher.
+
+El servidor de prueba sustituye a la API de Discord (Route.BASE apunta a
+él) y responde a cada petición con el siguiente estado de su guion.
+"""
+import asyncio
+import io
+import json
+import socket
+
+import discord
+import discord.http
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import notifier
+
+WEBHOOK_URL = "https://discord.com/api/webhooks/123456789012345678/" + "t" * 68
+
+
+class FakeChannel:
+    id = 1
+    name = "logs"
+
+    def __init__(self):
+        self.sent: list[dict] = []
+
+    async def send(self, *, embeds, files=None):
+        self.sent.append({
+            "embeds": len(embeds),
+            "files": [f.fp.read() for f in files or []],
+        })
+
+
+class MockDiscord:
+    """Servidor local con el endpoint de ejecución de webhooks; `script` son las respuestas en orden."""
+
+    def __init__(self, script: list[web.Response]):
+        self.script = list(script)
+        self.requests = 0
+        self.bodies: list[bytes] = []
+
+    async def execute(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        self.bodies.append(await request.read())
+        return self.script.pop(0) if self.script else web.Response(status=204)
+
+    async def start(self) -> TestServer:
+        app = web.Application()
+        app.router.add_post("/api/v10/webhooks/{id}/{token}", self.execute)
+        server = TestServer(app)
+        await server.start_server()
+        return server
+
+
+def json_response(status: int, data: dict, headers: dict = None) -> web.Response:
+    # Sin "; charset=utf-8": discord.py solo decodifica el cuerpo si el tipo es exactamente application/json
+    return web.Response(status=status, body=json.dumps(data).encode(),
+                        headers={"Content-Type": "application/json", **(headers or {})})
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    # discord.py espera 1 + 2 * intento segundos entre reintentos de errores 5xx
+    real_sleep = asyncio.sleep
+    monkeypatch.setattr(asyncio, "sleep", lambda delay, *args, **kwargs: real_sleep(0, *args, **kwargs))
+
+
+def deliver(monkeypatch, script: list, sends: int = 1, files: bool = False):
+    """Envía `sends` mensajes por un WebhookTarget contra el servidor local y devuelve (target, canal, servidor)."""
+    mock = MockDiscord(script)
+    channel = FakeChannel()
+
+    async def run():
+        server = await mock.start()
+        monkeypatch.setattr(discord.http.Route, "BASE", str(server.make_url("/api/v10")))
+        target = notifier.WebhookTarget(WEBHOOK_URL, pool_size=2, rate_limit=(5, 2))
+        target.channel = channel
+        try:
+            for _ in range(sends):
+                attachments = [discord.File(io.BytesIO(b"contenido"), filename="mensaje.txt")] if files else None
+                await target.send(embeds=[discord.Embed(title="borrado")], files=attachments)
+        finally:
+            await target.close()
+            await server.close()
+        return target
+
+    return asyncio.run(run()), channel, mock
+
+
+def test_webhook_204_is_delivered_without_fallback(monkeypatch):
+    target, channel, mock = deliver(monkeypatch, [web.Response(status=204)])
+
+    assert mock.requests == 1
+    assert channel.sent == []
+    assert target.stats == {"webhook_sent": 1, "fallback_sent": 0, "webhook_errors": 0}
+
+
+def test_webhook_404_disables_webhook_and_uses_channel(monkeypatch):
+    script = [json_response(404, {"message": "Unknown Webhook", "code": 10015})]
+    target, channel, mock = deliver(monkeypatch, script, sends=2)
+
+    assert target.disabled
+    assert mock.requests == 1  # El segundo envío ya no prueba el webhook
+    assert len(channel.sent) == 2
+    assert target.stats == {"webhook_sent": 0, "fallback_sent": 2, "webhook_errors": 1}
+
+
+def test_webhook_429_from_discord_is_retried(monkeypatch, no_backoff):
+    script = [json_response(429, {"message": "rate limited", "retry_after": 0.01, "global": False},
+                            headers={"Via": "1.1 google"})]
+    target, channel, mock = deliver(monkeypatch, script)
+
+    assert mock.requests == 2
+    assert channel.sent == []
+    assert target.stats["webhook_sent"] == 1
+
+
+def test_webhook_429_without_retry_falls_back_to_channel(monkeypatch):
+    # Sin cabecera Via el 429 viene de Cloudflare y discord.py no reintenta
+    script = [json_response(429, {"message": "rate limited", "retry_after": 60})]
+    target, channel, mock = deliver(monkeypatch, script)
+
+    assert not target.disabled
+    assert len(channel.sent) == 1
+    assert target.stats == {"webhook_sent": 0, "fallback_sent": 1, "webhook_errors": 1}
+
+
+def test_webhook_500_falls_back_with_files_rewound(monkeypatch, no_backoff):
+    script = [json_response(500, {"message": "Internal Server Error"}) for _ in range(5)]
+    target, channel, mock = deliver(monkeypatch, script, files=True)
+
+    assert mock.requests == 5
+    assert b"contenido" in mock.bodies[0]
+    assert channel.sent == [{"embeds": 1, "files": [b"contenido"]}]
+    assert not target.disabled
+    assert target.stats == {"webhook_sent": 0, "fallback_sent": 1, "webhook_errors": 1}
+
+
+def test_webhook_connection_error_falls_back_to_channel(monkeypatch):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    monkeypatch.setattr(discord.http.Route, "BASE", f"http://127.0.0.1:{port}/api/v10")
+    channel = FakeChannel()
+
+    async def run():
+        target = notifier.WebhookTarget(WEBHOOK_URL, pool_size=2, rate_limit=(5, 2))
+        target.channel = channel
+        await target.send(embeds=[discord.Embed(title="borrado")])
+        await target.close()
+        return target
+
+    target = asyncio.run(run())
+    assert len(channel.sent) == 1
+    assert target.stats["webhook_errors"] == 1
+
+
+def test_invalid_webhook_url_disables_webhook_and_uses_channel():
+    channel = FakeChannel()
+
+    async def run():
+        target = notifier.WebhookTarget("https://example.com/no-es-un-webhook", pool_size=2, rate_limit=(5, 2))
+        target.channel = channel
+        await target.send(embeds=[discord.Embed(title="borrado")])
+        await target.close()
+        return target
+
+    target = asyncio.run(run())
+    assert target.disabled
+    assert len(channel.sent) == 1
+
+
+class RejectingChannel(FakeChannel):
+    """Como Discord: rechaza con 400 los mensajes de más de MAX_EMBED_CHARS_PER_MESSAGE caracteres."""
+
+    def __init__(self, limit: int):
+        super().__init__()
+        self.limit = limit
+        self.rejected = 0
+
+    async def send(self, *, embeds, files=None):
+        assert len(embeds) <= notifier.MAX_EMBEDS_PER_MESSAGE
+        assert sum(len(e) for e in embeds) <= notifier.MAX_EMBED_CHARS_PER_MESSAGE
+        if sum(len(e) for e in embeds) > self.limit:
+            self.rejected += 1
+            response = type("Response", (), {"status": 400, "reason": "Bad Request"})()
+            raise discord.HTTPException(response, {"message": "Invalid Form Body", "code": 50035})
+        await super().send(embeds=embeds, files=files)
+
+
+def test_dispatcher_splits_batches_instead_of_dropping_them():
+    channel = RejectingChannel(limit=3000)
+
+    async def run():
+        dispatcher = notifier.NotificationDispatcher(max_queue=50, rate_messages=100, rate_seconds=1)
+        for i in range(12):
+            dispatcher.submit(channel, discord.Embed(title=str(i), description="x" * 1100))
+        await dispatcher.drain()
+        return dispatcher.get_stats()
+
+    stats = asyncio.run(run())
+    assert stats["delivered"] == 12
+    assert stats["failed"] == 0
+    assert channel.rejected > 0
+    assert sum(sent["embeds"] for sent in channel.sent) == 12
@@ -0,0 +1,91 @@
+import threading
+
+import pytest
+
+import ytdl
+
+
+class FakeYoutubeDL:
+    """Sustituto de yt_dlp.YoutubeDL: guarda los params con los que se llamó y puede fallar a petición."""
+
+    created: list["FakeYoutubeDL"] = []
+
+    def __init__(self, params: dict):
+        self.params = dict(params)
+        self.calls: list[dict] = []
+        self.closed = False
+        self.fail = False
+        FakeYoutubeDL.created.append(self)
+
+    def extract_info(self, url: str, download: bool = False) -> dict:
+        self.calls.append(dict(self.params))
+        if self.fail:
+            raise RuntimeError("extractor roto")
+        return {"title": url, "webpage_url": url, "entries": [{"id": "a"}, {"id": "b"}]}
+
+    def close(self) -> None:
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def fake_ytdl(monkeypatch):
+    FakeYoutubeDL.created = []
+    monkeypatch.setattr(ytdl.yt_dlp, "YoutubeDL", FakeYoutubeDL)
+    monkeypatch.setattr(ytdl, "_local", threading.local())
+    monkeypatch.setattr(ytdl, "_stats", dict.fromkeys(ytdl._stats, 0))
+
+
+def test_per_call_params_are_applied_and_removed():
+    ytdl.search("playlist", start=11, end=20)
+    ytdl.search("otra")
+
+    ydl, = FakeYoutubeDL.created
+    assert ydl.calls[0]["playlist_items"] == "11-20"
+    assert "playlist_items" not in ydl.calls[1]
+    assert ydl.params == ytdl.YDL_SEARCH_OPTIONS
+
+
+def test_existing_params_are_restored_after_an_override():
+    ytdl._extract_info("search", "consulta", quiet=False)
+
+    ydl, = FakeYoutubeDL.created
+    assert ydl.calls[0]["quiet"] is False
+    assert ydl.params["quiet"] is True
+
+
+def test_failed_instance_is_discarded_with_its_params_restored():
+    ytdl.search("primera")
+    broken = FakeYoutubeDL.created[0]
+    broken.fail = True
+
+    with pytest.raises(RuntimeError):
+        ytdl.search("playlist", start=1, end=5)
+    assert broken.closed
+    assert "playlist_items" not in broken.params
+
+    ytdl.search("después")
+    assert len(FakeYoutubeDL.created) == 2
+    assert ytdl.get_stats()["errors"] == 1
+
+
+def test_instances_are_recycled_after_max_uses(monkeypatch):
+    monkeypatch.setattr(ytdl, "YTDL_MAX_USES", 3)
+    for i in range(7):
+        ytdl.search(f"consulta {i}")
+
+    assert [len(ydl.calls) for ydl in FakeYoutubeDL.created] == [3, 3, 1]
+    assert [ydl.closed for ydl in FakeYoutubeDL.created] == [True, True, False]
+    stats = ytdl.get_stats()
+    assert (stats["calls"], stats["created"], stats["recycled"]) == (7, 3, 2)
+
+
+def test_each_thread_and_option_set_gets_its_own_instance():
+    ytdl.search("aquí")
+    ytdl.search("otra vez aquí")
+    thread = threading.Thread(target=ytdl.search, args=("en otro hilo",))
+    thread.start()
+    thread.join()
+    ytdl._extract_info("extract", "https://www.youtube.com/watch?v=abc")
+
+    assert [len(ydl.calls) for ydl in FakeYoutubeDL.created] == [2, 1, 1]
+    assert FakeYoutubeDL.created[2].params == ytdl.YDL_EXTRACT_OPTIONS
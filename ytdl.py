@@ -0,0 +1,211 @@
+# Llamadas a yt-dlp. No importa discord ni el resto del bot (solo config) para que los procesos worker
+# (EXTRACTION_MODE=process) lo carguen rápido; las funciones devuelven dicts pequeños con
+# solo lo que usa music.py, que es lo único que viaja de vuelta entre procesos.
+import logging
+import os
+import threading
+from typing import Optional
+import yt_dlp
+from config import YTDL_MAX_USES, OPUS_PASSTHROUGH, AUDIO_CACHE_MAX_TRACK_MB
+
+logger = logging.getLogger(__name__)
+
+# Opciones para buscar RÁPIDO (Playlists al instante)
+YDL_SEARCH_OPTIONS = {
+    'format': 'bestaudio/best',
+    'noplaylist': False,
+    'playlistmaxentries': 150,
+    'extract_flat': 'in_playlist',
+    'quiet': True,
+    'no_warnings': True,
+    'default_search': 'ytsearch',
+    'source_address': '0.0.0.0',
+    'force_ipv4': True,
+}
+
+# Opciones para extraer el AUDIO REAL (Justo antes de reproducir)
+YDL_EXTRACT_OPTIONS = {
+    # Con OPUS_PASSTHROUGH se prefiere el audio Opus (webm), que se puede enviar a Discord sin recodificar
+    'format': 'bestaudio[acodec=opus]/bestaudio/best' if OPUS_PASSTHROUGH else 'bestaudio/best',
+    'noplaylist': True,
+    'quiet': True,
+    'no_warnings': True,
+    'source_address': '0.0.0.0',
+    'force_ipv4': True,
+    # TRUCO ANTIBLOQUEO: Evita el error 403 y los fallos de FFmpeg
+    'extractor_args': {
+        'youtube': {
+            'player_client': ['android', 'web']
+        }
+    }
+}
+
+# Opciones para DESCARGAR el audio al cache en disco (audio_cache). La ruta se pasa en cada llamada
+YDL_DOWNLOAD_OPTIONS = {
+    **YDL_EXTRACT_OPTIONS,
+    'format': 'bestaudio[acodec=opus]/bestaudio/best',
+    'max_filesize': AUDIO_CACHE_MAX_TRACK_MB * 1024 * 1024,
+    'retries': 3,
+    # Si ya es Opus solo se cambia el contenedor; si no, FFmpeg lo convierte
+    'postprocessors': [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'opus'}],
+}
+
+_OPTIONS = {"search": YDL_SEARCH_OPTIONS, "extract": YDL_EXTRACT_OPTIONS, "download": YDL_DOWNLOAD_OPTIONS}
+
+# Instancias de YoutubeDL confinadas a su hilo (no son seguras entre hilos). Mantenerlas vivas
+# conserva los extractores ya cargados, las cookies y las conexiones HTTP keep-alive.
+_local = threading.local()
+_stats_lock = threading.Lock()
+_stats = {"calls": 0, "created": 0, "recycled": 0, "errors": 0}
+
+
+def _count(key: str) -> None:
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def _instance(kind: str) -> list:
+    """Devuelve [YoutubeDL, usos] del hilo actual, creándola o renovándola si agotó sus usos."""
+    instances = getattr(_local, "instances", None)
+    if instances is None:
+        instances = _local.instances = {}
+
+    slot = instances.get(kind)
+    if slot is not None and slot[1] >= YTDL_MAX_USES:
+        # Renovar de vez en cuando evita que crezcan cookies y cachés internas indefinidamente
+        _discard(kind)
+        _count("recycled")
+        slot = None
+    if slot is None:
+        slot = instances[kind] = [yt_dlp.YoutubeDL(_OPTIONS[kind]), 0]
+        _count("created")
+    return slot
+
+
+def _discard(kind: str) -> None:
+    slot = getattr(_local, "instances", {}).pop(kind, None)
+    if slot is not None:
+        try:
+            slot[0].close()
+        except Exception as e:
+            logger.debug(f"Error cerrando instancia de YoutubeDL: {e}")
+
+
+def warm_worker() -> None:
+    """Inicializador de los workers: crea de antemano las instancias de YoutubeDL del hilo."""
+    # La de descargas solo se crea si se usa el cache de audio
+    for kind in ("search", "extract"):
+        _instance(kind)
+
+
+def _extract_info(kind: str, url: str, download: bool = False, **params) -> dict:
+    slot = _instance(kind)
+    slot[1] += 1
+    _count("calls")
+    ydl = slot[0]
+    # Opciones solo para esta llamada; la instancia es del hilo, así que nadie más las ve
+    previous = {key: ydl.params[key] for key in params if key in ydl.params}
+    ydl.params.update(params)
+    try:
+        return ydl.extract_info(url, download=download)
+    except Exception:
+        # Una instancia que ha fallado puede haber quedado en mal estado: la siguiente llamada crea otra
+        _discard(kind)
+        _count("errors")
+        raise
+    finally:
+        for key in params:
+            if key in previous:
+                ydl.params[key] = previous[key]
+            else:
+                ydl.params.pop(key, None)
+
+
+def get_stats() -> dict:
+    """
+    Obtiene estadísticas de las instancias de YoutubeDL de este proceso.
+
+    Returns:
+        Diccionario con llamadas, instancias creadas, renovadas y descartadas por error
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["reuse_ratio"] = 1 - stats["created"] / stats["calls"] if stats["calls"] else 0.0
+    return stats
+
+
+def _slim_entry(entry: dict) -> dict:
+    webpage_url = entry.get('webpage_url')
+    if not webpage_url:
+        url_field = entry.get('url', '')
+        if 'youtube.com' in url_field or 'youtu.be' in url_field:
+            webpage_url = url_field
+        else:
+            webpage_url = f"https://www.youtube.com/watch?v={entry.get('id')}"
+
+    thumbnail = ''
+    if entry.get('thumbnails'):
+        thumbnail = entry['thumbnails'][0]['url']
+    elif entry.get('thumbnail'):
+        thumbnail = entry.get('thumbnail')
+
+    return {"title": entry.get('title', 'Desconocido'), "webpage_url": webpage_url, "thumbnail": thumbnail}
+
+
+def search(query: str, start: Optional[int] = None, end: Optional[int] = None) -> list[dict]:
+    """
+    Búsqueda plana (sin resolver streams) de un texto, vídeo o playlist.
+
+    Args:
+        start: Primera entrada de la playlist (desde 1); None = todas
+        end: Última entrada de la playlist, incluida
+
+    Returns:
+        Lista de dicts con title, webpage_url y thumbnail
+    """
+    params = {"playlist_items": f"{start}-{end}"} if start else {}
+    info = _extract_info("search", query, **params)
+    if not info:
+        return []
+    return [_slim_entry(entry) for entry in info.get('entries', [info]) if entry]
+
+
+def extract_stream(webpage_url: str) -> dict:
+    """
+    Extrae la URL de audio reproducible de un vídeo.
+
+    Returns:
+        Dict con url (None si no hay formato de audio), ext y acodec
+    """
+    info = _extract_info("extract", webpage_url)
+    if not info:
+        return {"url": None}
+
+    # 1. Intentamos coger la URL maestra de bestaudio
+    if info.get('url'):
+        return {"url": info['url'], "ext": info.get('ext'), "acodec": info.get('acodec')}
+
+    # 2. Si falla, buscamos el MEJOR formato de audio (-1 es el mejor, 0 era el peor)
+    f_audio = [f for f in info.get('formats') or () if f.get('vcodec') == 'none' and f.get('url')]
+    if f_audio:
+        f_opus = [f for f in f_audio if f.get('acodec') == 'opus'] if OPUS_PASSTHROUGH else []
+        best = (f_opus or f_audio)[-1]
+        return {"url": best['url'], "ext": best.get('ext'), "acodec": best.get('acodec')}
+    return {"url": None}
+
+
+def download_audio(webpage_url: str, destination: str) -> int:
+    """
+    Descarga el audio de un vídeo como Opus.
+
+    Args:
+        destination: Ruta sin extensión; el fichero queda en destination + '.opus'
+
+    Returns:
+        Tamaño del fichero en bytes
+
+    Raises:
+        FileNotFoundError: Si no se descargó nada (p. ej. supera AUDIO_CACHE_MAX_TRACK_MB)
+    """
+    _extract_info("download", webpage_url, download=True, outtmpl={"default": destination + ".%(ext)s"})
+    return os.path.getsize(destination + ".opus")